@@ -0,0 +1,278 @@
+"""
+ASGI serving path for the /api/test/* routes
+
+Run with:  uvicorn asgi:app --host 0.0.0.0 --port 10000 --workers 2
+
+Each worker is a single event loop, so DeepSeek round trips no longer pin a
+process each: hundreds of analyses can wait on the upstream concurrently.
+Document parsing is CPU-bound and runs in a thread pool so it never blocks
+the loop (large PDFs still fan out to processes via PDF_PARALLEL_WORKERS).
+The Flask app in main.py is unchanged and keeps serving the web pages.
+"""
+import asyncio
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from functools import partial
+
+from starlette.applications import Starlette
+from starlette.responses import JSONResponse, StreamingResponse
+from starlette.routing import Route
+
+# Reuse the exact parser, cache, compactor and extractor set up for Flask
+from main import (
+    config, document_parser, extraction_cache, lab_extractor, rate_limiter, response_cache, retry_policy,
+    text_compactor, token_budget
+)
+from utils.ai_analyzer import parse_language, parse_sections
+from utils.async_ai_analyzer import AsyncAIAnalyzer
+from utils.script_stats import detect_language
+from utils.hedging import Hedger
+from utils.http_pool import create_async_http_client
+from utils.resilience import CircuitBreaker
+from utils.single_flight import AsyncSingleFlight
+
+ALLOWED_EXTENSIONS = {'pdf', 'docx', 'doc', 'txt'}
+
+deepseek_key = os.getenv('DEEPSEEK_API_KEY')
+single_flight = AsyncSingleFlight()
+ai_analyzer = AsyncAIAnalyzer(
+    api_key=deepseek_key, cache=response_cache, single_flight=single_flight,
+    budget=token_budget, usage_log=config.TOKEN_USAGE_LOG, chunk_concurrency=config.ANALYSIS_CHUNK_CONCURRENCY,
+    retry_policy=retry_policy,
+    breaker=CircuitBreaker(config.DEEPSEEK_BREAKER_FAILURES, config.DEEPSEEK_BREAKER_RESET_SECONDS),
+    hedger=Hedger(
+        percentile=config.HEDGE_PERCENTILE,
+        initial_delay=config.HEDGE_INITIAL_DELAY_SECONDS,
+        min_delay=config.HEDGE_MIN_DELAY_SECONDS
+    ) if config.HEDGE_REQUESTS else None,
+    http_client=create_async_http_client(
+        max_connections=config.DEEPSEEK_MAX_CONNECTIONS,
+        max_keepalive=config.DEEPSEEK_MAX_KEEPALIVE,
+        keepalive_seconds=config.DEEPSEEK_KEEPALIVE_SECONDS,
+        http2=config.DEEPSEEK_HTTP2
+    ),
+    limiter=rate_limiter
+) if deepseek_key else None
+parse_executor = ThreadPoolExecutor(max_workers=config.ASGI_PARSE_THREADS, thread_name_prefix='parse')
+
+
+async def _run_blocking(func, *args, **kwargs):
+    """Run CPU-bound or blocking work off the event loop"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(parse_executor, partial(func, *args, **kwargs))
+
+
+def _prepare_text(text: str, language=None):
+    """Compaction, local lab value extraction and language detection, as in main.py"""
+    compacted, compaction = text_compactor.compact(text)
+    lab_values, remaining_text = lab_extractor.extract(compacted)
+    if language is None:
+        language = detect_language(compacted)
+    return remaining_text, lab_values, compaction, language
+
+
+async def _read_upload(request):
+    """Return (filename, text, file_size, None) or (None, None, None, error response)"""
+    form = await request.form()
+    file = form.get('file')
+    if file is None or isinstance(file, str):
+        return None, None, None, JSONResponse({"error": "No file"}, status_code=400)
+    if not file.filename:
+        return None, None, None, JSONResponse({"error": "No file selected"}, status_code=400)
+
+    ext = file.filename.rsplit('.', 1)[-1].lower() if '.' in file.filename else ''
+    if ext not in ALLOWED_EXTENSIONS:
+        return None, None, None, JSONResponse(
+            {"error": f"File type .{ext} not allowed. Use: {', '.join(ALLOWED_EXTENSIONS)}"}, status_code=400
+        )
+
+    data = await file.read()
+    text, error = await _run_blocking(
+        document_parser.extract_text, data, max_chars=token_budget.input_char_limit(), filename=file.filename
+    )
+    if error:
+        return None, None, None, JSONResponse({
+            "error": f"Document parsing failed: {error}",
+            "filename": file.filename,
+            "file_size": len(data)
+        }, status_code=400)
+    return file.filename, text, len(data), None
+
+
+async def _output_options(request, data=None):
+    """Return (language, sections, None) or (None, None, error response), as in main.py"""
+    form = {}
+    if request.headers.get('content-type', '').startswith('multipart/form-data'):
+        form = await request.form()
+
+    def option(name):
+        return (data or {}).get(name) or form.get(name) or request.query_params.get(name)
+
+    language, error = parse_language(option('language'))
+    if not error:
+        sections, error = parse_sections(option('sections'))
+    if error:
+        return None, None, JSONResponse({"error": error}, status_code=400)
+    return language, sections, None
+
+
+async def health(request):
+    return JSONResponse({
+        "status": "healthy",
+        "timestamp": datetime.now().isoformat(),
+        "server": "asgi",
+        "services": {
+            "deepseek": "✅" if ai_analyzer else "❌ (check .env)",
+            "document_parser": "✅" if document_parser else "❌"
+        },
+        "parser_page_stats": document_parser.get_page_stats() if document_parser else None,
+        "extraction_cache": extraction_cache.get_stats() if extraction_cache else None,
+        "response_cache": response_cache.get_stats() if response_cache else None,
+        "single_flight": single_flight.get_stats(),
+        "ai_usage": ai_analyzer.get_usage_stats() if ai_analyzer else None,
+        "deepseek_circuit": ai_analyzer.breaker.get_state() if ai_analyzer else None,
+        "hedging": ai_analyzer.hedger.get_stats() if ai_analyzer and ai_analyzer.hedger else None,
+        "rate_limit": rate_limiter.get_stats() if rate_limiter else None
+    })
+
+
+async def test_text(request):
+    """Async counterpart of /api/test/text"""
+    try:
+        data = await request.json()
+    except ValueError:
+        data = None
+    if not data or 'text' not in data:
+        return JSONResponse({"error": "No text provided"}, status_code=400)
+    language, sections, invalid = await _output_options(request, data)
+    if invalid:
+        return invalid
+
+    text = data['text']
+    if not ai_analyzer:
+        return JSONResponse({
+            "error": "AI analyzer not available. Check DEEPSEEK_API_KEY in .env",
+            "text_received": text[:200]
+        }, status_code=500)
+
+    remaining_text, lab_values, compaction, language = await _run_blocking(
+        _prepare_text, token_budget.fit_input(text), language
+    )
+    result = await ai_analyzer.analyze_medical_text(remaining_text, language=language, lab_values=lab_values,
+                                                    sections=sections)
+    if not result.get('success'):
+        return JSONResponse({"error": f"AI analysis failed: {result.get('error', 'Unknown error')}"}, status_code=500)
+
+    return JSONResponse({
+        "success": True,
+        "text_length": len(text),
+        "key_values": lab_values,
+        "compaction": compaction,
+        "analysis": result['analysis'],
+        "language": result.get('language'),
+        "sections": result.get('sections'),
+        "cached": result.get('cached', False),
+        "coalesced": result.get('coalesced', False),
+        "usage": result.get('usage')
+    })
+
+
+async def test_upload(request):
+    """Async counterpart of /api/test/upload"""
+    if not document_parser:
+        return JSONResponse({"error": "Document parser not available"}, status_code=500)
+
+    filename, text, file_size, invalid = await _read_upload(request)
+    if invalid:
+        return invalid
+    language, sections, invalid = await _output_options(request)
+    if invalid:
+        return invalid
+
+    remaining_text, lab_values, compaction, language = await _run_blocking(_prepare_text, text, language)
+    response = {
+        "success": True,
+        "filename": filename,
+        "file_size": file_size,
+        "text_preview": text[:500] + "..." if len(text) > 500 else text,
+        "text_length": len(text),
+        "parser": "document_parser",
+        "key_values": lab_values
+    }
+
+    if ai_analyzer:
+        response['compaction'] = compaction
+        result = await ai_analyzer.analyze_medical_text(remaining_text, language=language, lab_values=lab_values,
+                                                        sections=sections)
+        if result.get('success'):
+            response['ai_analysis'] = result['analysis']
+            response['language'] = result.get('language')
+            response['sections'] = result.get('sections')
+            response['cached'] = result.get('cached', False)
+            response['coalesced'] = result.get('coalesced', False)
+            response['usage'] = result.get('usage')
+        else:
+            response['ai_error'] = result.get('error', 'Unknown error')
+
+    return JSONResponse(response)
+
+
+def _sse(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+async def test_stream(request):
+    """Async counterpart of /api/test/stream (Server-Sent Events)"""
+    if not ai_analyzer:
+        return JSONResponse({"error": "AI analyzer not available. Check DEEPSEEK_API_KEY in .env"}, status_code=500)
+
+    if request.headers.get('content-type', '').startswith('multipart/form-data'):
+        if not document_parser:
+            return JSONResponse({"error": "Document parser not available"}, status_code=500)
+        _, text, _, invalid = await _read_upload(request)
+        if invalid:
+            return invalid
+        language, sections, invalid = await _output_options(request)
+        if invalid:
+            return invalid
+    else:
+        try:
+            data = await request.json()
+        except ValueError:
+            data = None
+        if not data or 'text' not in data:
+            return JSONResponse({"error": "No text provided"}, status_code=400)
+        language, sections, invalid = await _output_options(request, data)
+        if invalid:
+            return invalid
+        text = token_budget.fit_input(data['text'])
+
+    remaining_text, lab_values, compaction, language = await _run_blocking(_prepare_text, text, language)
+
+    async def generate():
+        yield _sse("meta", {"text_length": len(text), "key_values": lab_values, "compaction": compaction})
+        async for event in ai_analyzer.stream_medical_text(remaining_text, language=language,
+                                                            lab_values=lab_values, sections=sections):
+            yield _sse(event.pop("type"), event)
+
+    return StreamingResponse(generate(), media_type='text/event-stream', headers={
+        "Cache-Control": "no-cache",
+        "X-Accel-Buffering": "no"
+    })
+
+
+async def warm_up():
+    """Open DeepSeek connections before the worker takes traffic"""
+    if ai_analyzer and config.DEEPSEEK_WARMUP_CONNECTIONS > 0:
+        opened = await ai_analyzer.warm_up(config.DEEPSEEK_WARMUP_CONNECTIONS)
+        print(f"🔌 Warmed {opened}/{config.DEEPSEEK_WARMUP_CONNECTIONS} DeepSeek connections")
+
+
+app = Starlette(on_startup=[warm_up], routes=[
+    Route('/api/health', health),
+    Route('/api/test/text', test_text, methods=['POST']),
+    Route('/api/test/upload', test_upload, methods=['POST']),
+    Route('/api/test/stream', test_stream, methods=['POST']),
+])
@@ -0,0 +1,92 @@
+"""
+Benchmark: first DeepSeek request after worker start, cold vs warmed pool
+
+Starts a local OpenAI-compatible stub that charges HANDSHAKE_SECONDS on every
+new connection (standing in for DNS + TCP + TLS to api.deepseek.com) and
+UPSTREAM_SECONDS per completion, then times the first analysis of a fresh
+AIAnalyzer with and without AIAnalyzer.warm_up().
+
+Run from the project root:
+    python benchmarks/bench_first_request.py
+"""
+import json
+import os
+import statistics
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.ai_analyzer import AIAnalyzer
+from utils.http_pool import create_http_client
+
+HANDSHAKE_SECONDS = 0.15
+UPSTREAM_SECONDS = 0.05
+ROUNDS = 5
+
+REPORT = "Glucose 6.4 mmol/L (3.9-6.1) H\nHbA1c 6.8 % (4.0-6.0) H\nLDL-C 3.1 mmol/L (<3.4)\n"
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'  # keep-alive, so pooled connections are reused
+    disable_nagle_algorithm = True  # headers and body are separate writes
+
+    def setup(self):
+        super().setup()
+        time.sleep(HANDSHAKE_SECONDS)  # once per new connection
+
+    def _send_json(self, payload):
+        body = json.dumps(payload).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        self._send_json({"object": "list", "data": [{"id": "deepseek-chat", "object": "model",
+                                                     "created": 0, "owned_by": "stub"}]})
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        time.sleep(UPSTREAM_SECONDS)
+        self._send_json({
+            "id": "stub", "object": "chat.completion", "created": 0, "model": "deepseek-chat",
+            "choices": [{"index": 0, "finish_reason": "stop",
+                         "message": {"role": "assistant", "content": "1. 📊 **Key Values / 关键数值**"}}],
+            "usage": {"prompt_tokens": 1200, "completion_tokens": 12, "total_tokens": 1212}
+        })
+
+    def log_message(self, *args):
+        pass
+
+
+def first_request_seconds(base_url: str, warm: bool) -> float:
+    analyzer = AIAnalyzer(api_key='stub', base_url=base_url, http_client=create_http_client(http2=False))
+    if warm:
+        analyzer.warm_up(1)
+    start = time.perf_counter()
+    result = analyzer.analyze_medical_text(REPORT, language='en')
+    elapsed = time.perf_counter() - start
+    assert result.get('success'), result
+    analyzer.client.close()
+    return elapsed
+
+
+def main():
+    server = ThreadingHTTPServer(('127.0.0.1', 0), StubHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base_url = f"http://127.0.0.1:{server.server_address[1]}"
+
+    print(f"stub: {HANDSHAKE_SECONDS * 1000:.0f} ms per new connection, "
+          f"{UPSTREAM_SECONDS * 1000:.0f} ms per completion")
+    for label, warm in (("cold pool", False), ("warmed pool", True)):
+        times = [first_request_seconds(base_url, warm) for _ in range(ROUNDS)]
+        print(f"{label:12s} first request median {statistics.median(times) * 1000:7.1f} ms")
+    server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
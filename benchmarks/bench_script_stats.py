@@ -0,0 +1,55 @@
+"""
+Microbenchmark: script detection before/after utils.script_stats
+
+Run from the project root:
+    python benchmarks/bench_script_stats.py
+"""
+import os
+import re
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.script_stats import detect_language, script_stats
+
+ZH_LINE = "血红蛋白 135 g/L 参考范围 130-175 正常\n"
+EN_LINE = "Hemoglobin 13.5 g/dL reference 13.0-17.5 normal\n"
+
+
+def legacy_parser_detect(text: str) -> str:
+    """The old DocumentParser.detect_language loop"""
+    chinese_chars = sum(1 for char in text if '\u4e00' <= char <= '\u9fff')
+    return 'zh' if text and chinese_chars / len(text) > 0.2 else 'en'
+
+
+def legacy_analyzer_detect(text: str) -> str:
+    """The old AIAnalyzer.detect_language (regex recompiled on every call)"""
+    pattern = re.compile(r'[\u4e00-\u9fff\u3400-\u4dbf\u20000-\u2a6df\u2a700-\u2b73f'
+                         r'\u2b740-\u2b81f\u2b820-\u2ceaf\uf900-\ufaff\u2f800-\u2fa1f]')
+    return 'zh' if pattern.search(text) else 'en'
+
+
+def main():
+    documents = {
+        "zh 3k chars": ZH_LINE * 100,
+        "en 3k chars": EN_LINE * 60,
+        "mixed 200k chars": (ZH_LINE + EN_LINE) * 2500,
+    }
+    candidates = {
+        "legacy parser loop": legacy_parser_detect,
+        "legacy analyzer regex": legacy_analyzer_detect,
+        "detect_language": detect_language,
+        "script_stats": script_stats,
+    }
+
+    print(f"{'document':<18} {'function':<22} {'usec/call':>10}")
+    for doc_name, text in documents.items():
+        for name, func in candidates.items():
+            number = 200
+            seconds = timeit.timeit(lambda: func(text), number=number)
+            print(f"{doc_name:<18} {name:<22} {seconds / number * 1e6:>10.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,52 @@
+"""
+Fit utils.token_budget.TOKEN_RATES to real DeepSeek usage, offline
+
+Collect samples by running the app with TOKEN_USAGE_LOG=usage.jsonl (each
+upstream call appends character class counts and response.usage
+prompt_tokens, never the document text), then run from the project root:
+    python benchmarks/calibrate_token_rates.py usage.jsonl token_rates.json
+and deploy with TOKEN_RATES_PATH=token_rates.json.
+"""
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.token_budget import CHAR_CLASSES, TOKEN_RATES, fit_token_rates
+
+
+def predict(counts, rates):
+    return rates['base'] + sum(counts.get(name, 0) * rates[name] for name in CHAR_CLASSES)
+
+
+def mean_abs_pct_error(samples, rates):
+    errors = [abs(predict(s["counts"], rates) - s["prompt_tokens"]) / s["prompt_tokens"] for s in samples]
+    return 100 * sum(errors) / len(errors)
+
+
+def main():
+    if len(sys.argv) < 2:
+        print(__doc__)
+        sys.exit(1)
+
+    with open(sys.argv[1], encoding='utf-8') as f:
+        samples = [json.loads(line) for line in f if line.strip()]
+    samples = [s for s in samples if s.get("prompt_tokens")]
+    if not samples:
+        print("No samples with prompt_tokens found")
+        sys.exit(1)
+
+    rates = fit_token_rates(samples)
+    print(f"{len(samples)} samples")
+    print(f"default rates: {TOKEN_RATES}  error {mean_abs_pct_error(samples, TOKEN_RATES):.1f}%")
+    print(f"fitted rates:  {rates}  error {mean_abs_pct_error(samples, rates):.1f}%")
+
+    if len(sys.argv) > 2:
+        with open(sys.argv[2], 'w', encoding='utf-8') as f:
+            json.dump(rates, f, indent=2)
+        print(f"Wrote {sys.argv[2]}")
+
+
+if __name__ == '__main__':
+    main()
@@ -18,12 +18,72 @@ class Config:
     # File Upload
     MAX_CONTENT_LENGTH = int(os.getenv('MAX_FILE_SIZE_MB', 10)) * 1024 * 1024  # 10MB default
     UPLOAD_FOLDER = os.getenv('UPLOAD_FOLDER', 'static/uploads')
+    UPLOAD_SPOOL_MAX_BYTES = int(os.getenv('UPLOAD_SPOOL_MAX_MB', 4)) * 1024 * 1024  # larger uploads are parsed from disk
     ALLOWED_EXTENSIONS = set(os.getenv('ALLOWED_EXTENSIONS', 'pdf,docx,doc').split(','))
     
+    # Document Parsing
+    PDF_PARALLEL_WORKERS = int(os.getenv('PDF_PARALLEL_WORKERS', 0))  # 0 = serial extraction
+    PDF_PARALLEL_MIN_PAGES = int(os.getenv('PDF_PARALLEL_MIN_PAGES', 40))
+    EXTRACTION_CACHE_SIZE = int(os.getenv('EXTRACTION_CACHE_SIZE', 256))  # in-memory entries
+    EXTRACTION_CACHE_PATH = os.getenv('EXTRACTION_CACHE_PATH')  # SQLite file, unset = memory only
+    EXTRACTION_CACHE_DISK_SIZE = int(os.getenv('EXTRACTION_CACHE_DISK_SIZE', 10000))  # SQLite entries
+    EXTRACTION_CACHE_TTL_SECONDS = int(os.getenv('EXTRACTION_CACHE_TTL_SECONDS', 30 * 24 * 3600))
+    BATCH_PARSE_WORKERS = int(os.getenv('BATCH_PARSE_WORKERS', 2))  # processes parsing /api/batch files, 0 = serial
+    ASGI_PARSE_THREADS = int(os.getenv('ASGI_PARSE_THREADS', 4))  # parsing threads per ASGI worker
+    
     # DeepSeek AI
     DEEPSEEK_API_KEY = os.getenv('DEEPSEEK_API_KEY')
     DEEPSEEK_BASE_URL = os.getenv('DEEPSEEK_BASE_URL', 'https://api.deepseek.com')
     DEEPSEEK_MODEL = os.getenv('DEEPSEEK_MODEL', 'deepseek-chat')
+    DEEPSEEK_TIMEOUT_SECONDS = float(os.getenv('DEEPSEEK_TIMEOUT_SECONDS', 60))  # per attempt
+    DEEPSEEK_MAX_RETRIES = int(os.getenv('DEEPSEEK_MAX_RETRIES', 3))  # on 429, 5xx and connection errors
+    DEEPSEEK_BACKOFF_BASE_SECONDS = float(os.getenv('DEEPSEEK_BACKOFF_BASE_SECONDS', 0.5))
+    DEEPSEEK_BACKOFF_MAX_SECONDS = float(os.getenv('DEEPSEEK_BACKOFF_MAX_SECONDS', 8))
+    DEEPSEEK_BREAKER_FAILURES = int(os.getenv('DEEPSEEK_BREAKER_FAILURES', 5))  # consecutive, to open
+    DEEPSEEK_BREAKER_RESET_SECONDS = float(os.getenv('DEEPSEEK_BREAKER_RESET_SECONDS', 30))
+    DEEPSEEK_MAX_CONNECTIONS = int(os.getenv('DEEPSEEK_MAX_CONNECTIONS', 20))  # HTTP pool per worker
+    DEEPSEEK_MAX_KEEPALIVE = int(os.getenv('DEEPSEEK_MAX_KEEPALIVE', 10))  # idle connections kept open
+    DEEPSEEK_KEEPALIVE_SECONDS = float(os.getenv('DEEPSEEK_KEEPALIVE_SECONDS', 60))
+    DEEPSEEK_HTTP2 = os.getenv('DEEPSEEK_HTTP2', 'true').lower() in ('1', 'true', 'yes')  # needs the h2 package
+    DEEPSEEK_WARMUP_CONNECTIONS = int(os.getenv('DEEPSEEK_WARMUP_CONNECTIONS', 2))  # opened per worker, 0 = off
+    DEEPSEEK_REQUESTS_PER_MINUTE = int(os.getenv('DEEPSEEK_REQUESTS_PER_MINUTE', 0))  # rate limiter, 0 = off
+    DEEPSEEK_TOKENS_PER_MINUTE = int(os.getenv('DEEPSEEK_TOKENS_PER_MINUTE', 0))  # estimated prompt + real usage
+    RATE_LIMIT_STATE_PATH = os.getenv('RATE_LIMIT_STATE_PATH')  # shared by all workers, unset = per process
+    RATE_LIMIT_MAX_WAIT_SECONDS = float(os.getenv('RATE_LIMIT_MAX_WAIT_SECONDS', 300))  # queued longer = error
+    HEDGE_REQUESTS = os.getenv('HEDGE_REQUESTS', 'false').lower() in ('1', 'true', 'yes')  # backup call if slow
+    HEDGE_PERCENTILE = float(os.getenv('HEDGE_PERCENTILE', 95))  # of recent time-to-first-token
+    HEDGE_INITIAL_DELAY_SECONDS = float(os.getenv('HEDGE_INITIAL_DELAY_SECONDS', 8))  # until enough samples
+    HEDGE_MIN_DELAY_SECONDS = float(os.getenv('HEDGE_MIN_DELAY_SECONDS', 1))
+    
+    # AI Response Cache
+    RESPONSE_CACHE_BACKEND = os.getenv('RESPONSE_CACHE_BACKEND', 'memory')  # memory, sqlite or none
+    RESPONSE_CACHE_PATH = os.getenv('RESPONSE_CACHE_PATH')  # SQLite file for the sqlite backend
+    RESPONSE_CACHE_SIZE = int(os.getenv('RESPONSE_CACHE_SIZE', 1000))
+    RESPONSE_CACHE_TTL_SECONDS = int(os.getenv('RESPONSE_CACHE_TTL_SECONDS', 7 * 24 * 3600))
+    SINGLE_FLIGHT_LOCK_DIR = os.getenv('SINGLE_FLIGHT_LOCK_DIR')  # file locks across workers, unset = per process
+    
+    # Token budget (see utils/token_budget.py)
+    DEEPSEEK_CONTEXT_TOKENS = int(os.getenv('DEEPSEEK_CONTEXT_TOKENS', 64000))
+    ANALYSIS_PROMPT_TOKENS = int(os.getenv('ANALYSIS_PROMPT_TOKENS', 6000))  # system + instructions + document
+    ANALYSIS_COMPLETION_TOKENS = int(os.getenv('ANALYSIS_COMPLETION_TOKENS', 3500))
+    TOKEN_RATES_PATH = os.getenv('TOKEN_RATES_PATH')  # fitted rates from benchmarks/calibrate_token_rates.py
+    TOKEN_USAGE_LOG = os.getenv('TOKEN_USAGE_LOG')  # append calibration samples (counts only, no text)
+    ANALYSIS_MAX_CHUNKS = int(os.getenv('ANALYSIS_MAX_CHUNKS', 1))  # > 1 = map-reduce long documents
+    ANALYSIS_CHUNK_CONCURRENCY = int(os.getenv('ANALYSIS_CHUNK_CONCURRENCY', 4))  # parallel map calls
+    
+    # Batch analysis (/api/batch)
+    BATCH_MAX_ITEMS = int(os.getenv('BATCH_MAX_ITEMS', 50))
+    BATCH_CONCURRENCY = int(os.getenv('BATCH_CONCURRENCY', 4))  # DeepSeek calls in flight per batch
+    
+    # Background jobs (/api/jobs, drained by job_worker.py)
+    JOB_QUEUE_PATH = os.getenv('JOB_QUEUE_PATH', os.path.join('data', 'jobs.sqlite3'))  # durable SQLite queue
+    JOB_WORKER_PROCESSES = int(os.getenv('JOB_WORKER_PROCESSES', 2))
+    JOB_POLL_SECONDS = float(os.getenv('JOB_POLL_SECONDS', 1))
+    JOB_LEASE_SECONDS = int(os.getenv('JOB_LEASE_SECONDS', 600))  # abandoned running jobs are retried after this
+    JOB_MAX_ATTEMPTS = int(os.getenv('JOB_MAX_ATTEMPTS', 3))
+    JOB_RETRY_BASE_SECONDS = float(os.getenv('JOB_RETRY_BASE_SECONDS', 30))  # doubled per failed attempt
+    JOB_RETRY_MAX_SECONDS = float(os.getenv('JOB_RETRY_MAX_SECONDS', 900))
+    JOB_RETENTION_SECONDS = int(os.getenv('JOB_RETENTION_SECONDS', 7 * 24 * 3600))  # finished jobs kept this long
     
     # Supabase
     SUPABASE_URL = os.getenv('SUPABASE_URL')
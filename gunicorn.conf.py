@@ -0,0 +1,31 @@
+"""
+Gunicorn settings for Medical Document Assistant
+Picked up automatically when gunicorn is started from the project root
+"""
+import os
+import sys
+
+bind = f"0.0.0.0:{os.getenv('PORT', '10000')}"
+workers = int(os.getenv('WEB_CONCURRENCY', 2))
+
+# Threaded workers keep heartbeating the arbiter while a request thread is
+# busy, so long streamed analyses (/api/test/stream) are not killed by the
+# worker timeout the way sync workers are
+worker_class = os.getenv('GUNICORN_WORKER_CLASS', 'gthread')
+threads = int(os.getenv('GUNICORN_THREADS', 8))
+timeout = int(os.getenv('GUNICORN_TIMEOUT', 120))
+
+
+def post_worker_init(worker):
+    """Open DeepSeek connections in each worker before it takes traffic
+
+    Runs after the app is loaded in the forked worker, so the pooled
+    connections belong to this process and the first analysis skips the
+    DNS + TCP + TLS handshake.
+    """
+    connections = int(os.getenv('DEEPSEEK_WARMUP_CONNECTIONS', 2))
+    analyzer = getattr(sys.modules.get('main'), 'ai_analyzer', None)
+    if analyzer is None or connections <= 0:
+        return
+    opened = analyzer.warm_up(connections)
+    worker.log.info(f"Warmed {opened}/{connections} DeepSeek connections")
@@ -0,0 +1,127 @@
+"""
+Background job worker: drains the /api/jobs queue
+
+Each process imports the app (same DocumentParser, AIAnalyzer, caches and
+settings as the web workers) and runs queued jobs one at a time through
+the same code path as /api/test/upload and /api/test/text.
+
+Run from the project root, next to the web server:
+    python job_worker.py --processes 4
+"""
+import argparse
+import logging
+import multiprocessing
+import os
+import signal
+import socket
+import threading
+import time
+
+from config import config
+from utils.rate_limiter import BACKGROUND
+
+logger = logging.getLogger('job_worker')
+
+PURGE_INTERVAL_SECONDS = 3600
+
+
+def run_job(app, job):
+    """Run one claimed job; returns (response dict, HTTP status)"""
+    if job['kind'] == 'file':
+        payload = job['payload']
+        return app.analyze_upload(payload, job['filename'], len(payload),
+                                  tables=job['options'].get('tables', False), priority=BACKGROUND,
+                                  language=job['options'].get('language'), sections=job['options'].get('sections'))
+    return app.analyze_text(job['payload'].decode('utf-8'), priority=BACKGROUND,
+                            language=job['options'].get('language'), sections=job['options'].get('sections'))
+
+
+def keep_lease(queue, job_id: str, worker_id: str, done: threading.Event):
+    """Renew the job's lease until done is set, so a long job is not handed to a second worker"""
+    interval = max(queue.lease_seconds / 3, 1)
+    while not done.wait(interval):
+        if not queue.renew(job_id, worker_id):
+            logger.warning(f"Job {job_id}: lease lost")
+            return
+
+
+def work(index: int):
+    """Claim and run jobs until SIGTERM/SIGINT"""
+    import main as app  # after the fork: connections and pools belong to this process
+
+    stopping = []
+    signal.signal(signal.SIGTERM, lambda *_: stopping.append(True))
+    signal.signal(signal.SIGINT, lambda *_: stopping.append(True))
+
+    queue = app.job_queue
+    if queue is None:
+        logger.error("Job queue not available, worker exiting")
+        return
+    worker_id = f"{socket.gethostname()}:{os.getpid()}"
+    last_purge = 0.0
+    print(f"👷 Job worker {index} started ({worker_id})")
+
+    while not stopping:
+        if time.time() - last_purge > PURGE_INTERVAL_SECONDS:
+            purged = queue.purge(config.JOB_RETENTION_SECONDS)
+            if purged:
+                logger.info(f"Purged {purged} finished jobs")
+            last_purge = time.time()
+
+        job = queue.claim(worker_id)
+        if job is None:
+            time.sleep(config.JOB_POLL_SECONDS)
+            continue
+
+        done = threading.Event()
+        threading.Thread(target=keep_lease, args=(queue, job['id'], worker_id, done), daemon=True).start()
+        try:
+            response, status = run_job(app, job)
+        except Exception as e:
+            logger.exception(f"Job {job['id']} crashed")
+            queue.fail(job['id'], f"Job failed: {str(e)}", retry=True)
+            continue
+        finally:
+            done.set()
+
+        if status == 200 and 'ai_error' in response:
+            # The file parsed but the AI analysis failed: retry later
+            queue.fail(job['id'], response['ai_error'], retry=True)
+        elif status == 200:
+            queue.complete(job['id'], response)
+        else:
+            # Bad input (400) is final; server-side failures are retried
+            queue.fail(job['id'], response.get('error', 'Unknown error'), retry=status >= 500)
+
+    print(f"👋 Job worker {index} stopped")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run background analysis job workers")
+    parser.add_argument('--processes', type=int, default=config.JOB_WORKER_PROCESSES,
+                        help="worker processes (default: JOB_WORKER_PROCESSES)")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    if args.processes <= 1:
+        work(0)
+        return
+
+    processes = [multiprocessing.Process(target=work, args=(index,), name=f'job-worker-{index}')
+                 for index in range(args.processes)]
+    for process in processes:
+        process.start()
+
+    def stop(*_):
+        for process in processes:
+            if process.is_alive():
+                process.terminate()  # SIGTERM: the current job is finished first
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+    for process in processes:
+        process.join()
+
+
+if __name__ == '__main__':
+    main()
@@ -45,10 +45,16 @@ sys.modules['storage3.utils'] = MockStorage3.utils
 print("✅ Patched missing storage3 module")
 # ========== END PATCH ==========
 
-from flask import Flask, jsonify, request, render_template, send_from_directory
+from flask import Flask, Response, jsonify, request, render_template, send_from_directory
 from flask_cors import CORS
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 from datetime import datetime
+import json
 import logging
+import tempfile
+
+from config import config
+from utils.rate_limiter import BATCH, INTERACTIVE
 
 # Setup
 app = Flask(__name__)
@@ -58,13 +64,97 @@ app.secret_key = os.getenv('SECRET_KEY', 'dev-key-123')
 # Now import utilities (should work after path fix)
 try:
     from utils.document_parser import DocumentParser
-    from utils.ai_analyzer import AIAnalyzer
-    document_parser = DocumentParser()
+    from utils.ai_analyzer import AIAnalyzer, parse_language, parse_sections
+    from utils.extraction_cache import ExtractionCache
+    from utils.text_compactor import TextCompactor
+    from utils.script_stats import detect_language
+    from utils.lab_extractor import LabExtractor
+    from utils.response_cache import create_response_cache
+    from utils.single_flight import SingleFlight
+    from utils.token_budget import TokenBudget, load_rates
+    from utils.resilience import CircuitBreaker, RetryPolicy
+    from utils.hedging import Hedger
+    from utils.http_pool import create_http_client
+    from utils.job_queue import JobQueue
+    from utils.rate_limiter import RateLimiter
+    text_compactor = TextCompactor()
+    lab_extractor = LabExtractor()
+    extraction_cache = ExtractionCache(
+        max_entries=config.EXTRACTION_CACHE_SIZE,
+        db_path=config.EXTRACTION_CACHE_PATH,
+        disk_max_entries=config.EXTRACTION_CACHE_DISK_SIZE,
+        ttl_seconds=config.EXTRACTION_CACHE_TTL_SECONDS
+    )
+    document_parser = DocumentParser(
+        parallel_workers=config.PDF_PARALLEL_WORKERS,
+        parallel_min_pages=config.PDF_PARALLEL_MIN_PAGES,
+        cache=extraction_cache,
+        batch_workers=config.BATCH_PARSE_WORKERS
+    )
+    
+    response_cache = create_response_cache(
+        config.RESPONSE_CACHE_BACKEND,
+        db_path=config.RESPONSE_CACHE_PATH,
+        max_entries=config.RESPONSE_CACHE_SIZE,
+        ttl_seconds=config.RESPONSE_CACHE_TTL_SECONDS
+    )
+    token_budget = TokenBudget(
+        prompt_tokens=config.ANALYSIS_PROMPT_TOKENS,
+        completion_tokens=config.ANALYSIS_COMPLETION_TOKENS,
+        context_tokens=config.DEEPSEEK_CONTEXT_TOKENS,
+        rates=load_rates(config.TOKEN_RATES_PATH),
+        max_chunks=config.ANALYSIS_MAX_CHUNKS
+    )
+    job_queue = JobQueue(config.JOB_QUEUE_PATH, lease_seconds=config.JOB_LEASE_SECONDS,
+                         max_attempts=config.JOB_MAX_ATTEMPTS, retry_base_seconds=config.JOB_RETRY_BASE_SECONDS,
+                         retry_max_seconds=config.JOB_RETRY_MAX_SECONDS)
+    retry_policy = RetryPolicy(
+        max_retries=config.DEEPSEEK_MAX_RETRIES,
+        base_delay=config.DEEPSEEK_BACKOFF_BASE_SECONDS,
+        max_delay=config.DEEPSEEK_BACKOFF_MAX_SECONDS,
+        timeout=config.DEEPSEEK_TIMEOUT_SECONDS
+    )
+    # Cross-worker coalescing only pays off when workers share the sqlite cache:
+    # with a per-process cache the lock would only make workers wait for each other
+    lock_dir = config.SINGLE_FLIGHT_LOCK_DIR
+    if lock_dir and config.RESPONSE_CACHE_BACKEND != 'sqlite':
+        print("⚠️  SINGLE_FLIGHT_LOCK_DIR needs RESPONSE_CACHE_BACKEND=sqlite; coalescing within each worker only")
+        lock_dir = None
+    single_flight = SingleFlight(lock_dir=lock_dir)
+    
+    # One queue for every worker when RATE_LIMIT_STATE_PATH is set
+    rate_limiter = RateLimiter(
+        requests_per_minute=config.DEEPSEEK_REQUESTS_PER_MINUTE,
+        tokens_per_minute=config.DEEPSEEK_TOKENS_PER_MINUTE,
+        state_path=config.RATE_LIMIT_STATE_PATH,
+        max_wait=config.RATE_LIMIT_MAX_WAIT_SECONDS
+    ) if config.DEEPSEEK_REQUESTS_PER_MINUTE or config.DEEPSEEK_TOKENS_PER_MINUTE else None
     
     # Check if DeepSeek API key exists
     deepseek_key = os.getenv('DEEPSEEK_API_KEY')
     if deepseek_key:
-        ai_analyzer = AIAnalyzer(api_key=deepseek_key)
+        ai_analyzer = AIAnalyzer(
+            api_key=deepseek_key,
+            cache=response_cache,
+            single_flight=single_flight,
+            budget=token_budget,
+            usage_log=config.TOKEN_USAGE_LOG,
+            chunk_concurrency=config.ANALYSIS_CHUNK_CONCURRENCY,
+            retry_policy=retry_policy,
+            breaker=CircuitBreaker(config.DEEPSEEK_BREAKER_FAILURES, config.DEEPSEEK_BREAKER_RESET_SECONDS),
+            hedger=Hedger(
+                percentile=config.HEDGE_PERCENTILE,
+                initial_delay=config.HEDGE_INITIAL_DELAY_SECONDS,
+                min_delay=config.HEDGE_MIN_DELAY_SECONDS
+            ) if config.HEDGE_REQUESTS else None,
+            http_client=create_http_client(
+                max_connections=config.DEEPSEEK_MAX_CONNECTIONS,
+                max_keepalive=config.DEEPSEEK_MAX_KEEPALIVE,
+                keepalive_seconds=config.DEEPSEEK_KEEPALIVE_SECONDS,
+                http2=config.DEEPSEEK_HTTP2
+            ),
+            limiter=rate_limiter
+        )
         print("✅ AI analyzer initialized with API key")
     else:
         ai_analyzer = None
@@ -76,6 +166,15 @@ except ImportError as e:
     print(f"   Current directory: {os.getcwd()}")
     print(f"   utils folder exists: {os.path.exists('utils')}")
     document_parser = None
+    extraction_cache = None
+    text_compactor = None
+    lab_extractor = None
+    response_cache = None
+    single_flight = None
+    token_budget = None
+    retry_policy = None
+    rate_limiter = None
+    job_queue = None
     ai_analyzer = None
 
 # Get Supabase credentials from .env
@@ -124,7 +223,16 @@ def health():
             "deepseek_status": "Configured" if os.getenv('DEEPSEEK_API_KEY') else "Missing API key in .env",
             "parser_status": "Loaded" if parser_ready else "Failed to load",
             "supabase_status": "Configured" if supabase_ready else "Missing in .env (optional)"
-        }
+        },
+        "parser_page_stats": document_parser.get_page_stats() if parser_ready else None,
+        "extraction_cache": extraction_cache.get_stats() if extraction_cache else None,
+        "response_cache": response_cache.get_stats() if response_cache else None,
+        "single_flight": single_flight.get_stats() if single_flight else None,
+        "ai_usage": ai_analyzer.get_usage_stats() if ai_analyzer else None,
+        "deepseek_circuit": ai_analyzer.breaker.get_state() if ai_analyzer else None,
+        "hedging": ai_analyzer.hedger.get_stats() if ai_analyzer and ai_analyzer.hedger else None,
+        "jobs": job_queue.get_stats() if job_queue else None,
+        "rate_limit": rate_limiter.get_stats() if rate_limiter else None
     })
 
 @app.route('/web')
@@ -135,78 +243,222 @@ def web_interface():
                          endpoint_text="/api/test/text",
                          endpoint_upload="/api/test/upload")
 
-@app.route('/api/test/upload', methods=['POST'])
-def test_upload():
-    """Simple upload test endpoint"""
+def _validate_upload():
+    """Return (file, ext, None) for a valid upload, or (None, None, error response)"""
     if 'file' not in request.files:
-        return jsonify({"error": "No file"}), 400
+        return None, None, (jsonify({"error": "No file"}), 400)
     
     file = request.files['file']
-    if file.filename == '':
-        return jsonify({"error": "No file selected"}), 400
+    ext, error = _check_filename(file.filename)
+    if error:
+        return None, None, (jsonify({"error": error}), 400)
+    
+    return file, ext, None
+
+def _check_filename(filename):
+    """Return (ext, None) for an allowed upload name, or (None, error message)"""
+    if filename == '':
+        return None, "No file selected"
     
     # Check file type
     allowed = {'pdf', 'docx', 'doc', 'txt'}
-    ext = file.filename.rsplit('.', 1)[-1].lower() if '.' in file.filename else ''
+    ext = filename.rsplit('.', 1)[-1].lower() if '.' in filename else ''
     
     if ext not in allowed:
-        return jsonify({"error": f"File type .{ext} not allowed. Use: {', '.join(allowed)}"}), 400
+        return None, f"File type .{ext} not allowed. Use: {', '.join(allowed)}"
+    
+    return ext, None
+
+def _spool_upload(file, ext):
+    """Return (source, file_size, temp_path) for an upload
+
+    Small uploads are parsed straight from the request buffer; only large
+    ones are spilled to a temp file, which the caller must remove.
+    """
+    # Measure the upload once from the request stream
+    file.stream.seek(0, os.SEEK_END)
+    file_size = file.stream.tell()
+    file.stream.seek(0)
+    
+    if file_size <= config.UPLOAD_SPOOL_MAX_BYTES:
+        return file.read(), file_size, None
+    
+    with tempfile.NamedTemporaryFile(delete=False, suffix=f'.{ext}') as tmp:
+        file.save(tmp)
+    return tmp.name, file_size, tmp.name
+
+def analyze_upload(source, filename, file_size, tables=False, priority=INTERACTIVE, language=None,
+                   sections=None):
+    """Parse, extract and analyze one document; returns (response dict, HTTP status)
+
+    Shared by /api/test/upload and the background job worker (job_worker.py).
+    priority orders the DeepSeek call when the rate limiter is queueing;
+    language is the output language (None = the document's own) and
+    sections the analysis sections to write (None = all 7).
+    """
+    text, error = document_parser.extract_text(
+        source, max_chars=token_budget.input_char_limit(), filename=filename
+    )
+    
+    if error:
+        return {
+            "error": f"Document parsing failed: {error}",
+            "filename": filename,
+            "file_size": file_size
+        }, 400
+    
+    # Table-aware mode: lab grids become rows of the lab values block, so the
+    # model doesn't have to rebuild them from the flattened text
+    rows, table_error = None, None
+    if tables:
+        rows, table_error = document_parser.extract_tables(
+            source, filename=filename, max_chars=token_budget.input_char_limit()
+        )
+    
+    response, status = analyze_document(text, filename, file_size, priority, language, sections, table_rows=rows)
+    if table_error:
+        response['table_error'] = table_error
+    elif tables:
+        response['table_rows'] = rows
+    
+    return response, status
+
+def _prepare_text(text, language=None, table_rows=None):
+    """Compaction and local lab value extraction, before (and without) the LLM call
+
+    Returns (remaining text, lab values, compaction stats, language); table
+    rows are merged into the lab values and their lines dropped. With
+    no language requested, the document's own is detected here, on the
+    whole compacted text: once the lab lines are taken out, a report that
+    is mostly lab values may have no Chinese left to detect.
+    """
+    compacted, compaction = text_compactor.compact(text)
+    lab_values, remaining_text = lab_extractor.extract(compacted, table_rows)
+    if language is None:
+        language = detect_language(compacted)
+        print(f"🌐 Detected document language: {language}")
+    return remaining_text, lab_values, compaction, language
+
+def analyze_document(text, filename, file_size, priority=INTERACTIVE, language=None, sections=None,
+                     table_rows=None):
+    """Key values plus the AI analysis of an already parsed document; returns (response dict, HTTP status)
+
+    A failed AI analysis is still a 200 with 'ai_error' set, since the
+    parsed text and key values are usable on their own; callers that need
+    the analysis (jobs, batch items) check 'ai_error' themselves.
+    """
+    response = {
+        "success": True,
+        "filename": filename,
+        "file_size": file_size,
+        "text_preview": text[:500] + "..." if len(text) > 500 else text,
+        "text_length": len(text),
+        "parser": "document_parser"
+    }
+    
+    remaining_text, lab_values, compaction, language = _prepare_text(text, language, table_rows)
+    response['key_values'] = lab_values
+    
+    # Add AI analysis if available
+    if ai_analyzer and os.getenv('DEEPSEEK_API_KEY'):
+        response['compaction'] = compaction
+        result = ai_analyzer.analyze_medical_text(remaining_text, language=language, lab_values=lab_values,
+                                                  priority=priority, sections=sections)
+        if result.get('success'):
+            response['ai_analysis'] = result['analysis']
+            response['language'] = result.get('language')
+            response['sections'] = result.get('sections')
+            response['cached'] = result.get('cached', False)
+            response['coalesced'] = result.get('coalesced', False)
+            response['usage'] = result.get('usage')
+        else:
+            response['ai_error'] = result.get('error', 'Unknown error')
+    
+    return response, 200
+
+def analyze_text(text, priority=INTERACTIVE, language=None, sections=None):
+    """Analyze plain text; returns (response dict, HTTP status)
+
+    Shared by /api/test/text and the background job worker.
+    """
+    if not ai_analyzer or not os.getenv('DEEPSEEK_API_KEY'):
+        return {
+            "error": "AI analyzer not available. Check DEEPSEEK_API_KEY in .env",
+            "text_received": text[:200]
+        }, 500
+    
+    remaining_text, lab_values, compaction, language = _prepare_text(token_budget.fit_input(text), language)
+    result = ai_analyzer.analyze_medical_text(remaining_text, language=language, lab_values=lab_values,
+                                              priority=priority, sections=sections)
+    if not result.get('success'):
+        return {
+            "error": f"AI analysis failed: {result.get('error', 'Unknown error')}"
+        }, 500
     
-    # Save temporarily
-    import tempfile
+    return {
+        "success": True,
+        "text_length": len(text),
+        "key_values": lab_values,
+        "compaction": compaction,
+        "analysis": result['analysis'],
+        "language": result.get('language'),
+        "sections": result.get('sections'),
+        "cached": result.get('cached', False),
+        "coalesced": result.get('coalesced', False),
+        "usage": result.get('usage')
+    }, 200
+
+def _wants_tables():
+    return request.form.get('tables', '').lower() in ('1', 'true', 'yes')
+
+def _output_options(data=None):
+    """Return (language, sections, None) for the output options, or (None, None, error response)
+
+    Options come from the JSON body, a form field or the query string:
+    "language" is en, zh, bilingual, or auto/absent for the document's own
+    language; "sections" is a list or comma-separated string of section
+    ids or numbers, absent for all 7.
+    """
+    def option(name):
+        return (data or {}).get(name) or request.form.get(name) or request.args.get(name)
+    
+    language, error = parse_language(option('language'))
+    if not error:
+        sections, error = parse_sections(option('sections'))
+    if error:
+        return None, None, (jsonify({"error": error}), 400)
+    return language, sections, None
+
+@app.route('/api/test/upload', methods=['POST'])
+def test_upload():
+    """Simple upload test endpoint"""
+    file, ext, invalid = _validate_upload()
+    if invalid:
+        return invalid
+    language, sections, invalid = _output_options()
+    if invalid:
+        return invalid
     
     temp_path = None
     try:
-        # Create temp file
-        with tempfile.NamedTemporaryFile(delete=False, suffix=f'.{ext}') as tmp:
-            file.save(tmp.name)
-            temp_path = tmp.name
-        
-        # Parse document (if parser available)
-        if document_parser:
-            text, error = document_parser.extract_text(temp_path)
-            
-            if error:
-                return jsonify({
-                    "error": f"Document parsing failed: {error}",
-                    "filename": file.filename,
-                    "file_size": os.path.getsize(temp_path) if temp_path else 0
-                }), 400
-            
-            response = {
-                "success": True,
-                "filename": file.filename,
-                "file_size": os.path.getsize(temp_path),
-                "text_preview": text[:500] + "..." if len(text) > 500 else text,
-                "text_length": len(text),
-                "parser": "document_parser"
-            }
-            
-            # Add AI analysis if available
-            if ai_analyzer and os.getenv('DEEPSEEK_API_KEY'):
-                result = ai_analyzer.analyze_medical_text(text[:3000])
-                if result.get('success'):
-                    response['ai_analysis'] = result['analysis']
-                else:
-                    response['ai_error'] = result.get('error', 'Unknown error')
-            
-            # Clean up
-            if temp_path and os.path.exists(temp_path):
-                os.unlink(temp_path)
-            
-            return jsonify(response)
-        else:
+        if not document_parser:
             return jsonify({
                 "error": "Document parser not available",
-                "filename": file.filename,
-                "file_size": os.path.getsize(temp_path) if temp_path else 0
+                "filename": file.filename
             }), 500
+        
+        source, file_size, temp_path = _spool_upload(file, ext)
+        response, status = analyze_upload(source, file.filename, file_size, tables=_wants_tables(),
+                                          language=language, sections=sections)
+        return jsonify(response), status
             
     except Exception as e:
-        # Clean up on error
+        return jsonify({"error": f"Upload failed: {str(e)}"}), 500
+    
+    finally:
+        # Clean up spilled upload
         if temp_path and os.path.exists(temp_path):
             os.unlink(temp_path)
-        return jsonify({"error": f"Upload failed: {str(e)}"}), 500
 
 @app.route('/api/test/text', methods=['POST'])
 def test_text():
@@ -214,26 +466,254 @@ def test_text():
     data = request.json
     if not data or 'text' not in data:
         return jsonify({"error": "No text provided"}), 400
+    language, sections, invalid = _output_options(data)
+    if invalid:
+        return invalid
     
-    text = data['text']
+    response, status = analyze_text(data['text'], language=language, sections=sections)
+    return jsonify(response), status
+
+def _read_batch():
+    """Return (items, None) or (None, error response) for a batch request
+
+    Items are ("file", filename, bytes) for multipart "files"/"file" parts
+    and ("text", None, text) for JSONL lines ({"text": ...} per line).
+    Invalid items are kept as ("error", name, message) so they fail alone.
+    """
+    items = []
+    if request.files:
+        for file in request.files.getlist('files') + request.files.getlist('file'):
+            ext, error = _check_filename(file.filename)
+            if error:
+                items.append(("error", file.filename, error))
+            else:
+                items.append(("file", file.filename, file.read()))
+    else:
+        for number, line in enumerate(request.get_data(as_text=True).splitlines(), 1):
+            if not line.strip():
+                continue
+            try:
+                data = json.loads(line)
+            except ValueError:
+                items.append(("error", None, f"Line {number} is not valid JSON"))
+                continue
+            if not isinstance(data, dict) or not isinstance(data.get('text'), str):
+                items.append(("error", None, f"Line {number} has no \"text\""))
+                continue
+            items.append(("text", None, data['text']))
     
-    if ai_analyzer and os.getenv('DEEPSEEK_API_KEY'):
-        result = ai_analyzer.analyze_medical_text(text[:3000])
-        if result.get('success'):
-            return jsonify({
-                "success": True,
-                "text_length": len(text),
-                "analysis": result['analysis']
-            })
+    if not items:
+        return None, (jsonify({"error": "No files or texts provided"}), 400)
+    if len(items) > config.BATCH_MAX_ITEMS:
+        return None, (jsonify({"error": f"Too many items ({len(items)}), the limit is {config.BATCH_MAX_ITEMS}"}), 400)
+    return items, None
+
+def _batch_item(index, text, language, sections, filename=None, file_size=None):
+    """Analyze one batch item; never raises, so one bad item can't fail the batch"""
+    try:
+        if filename is not None:
+            response, status = analyze_document(text, filename, file_size, BATCH, language, sections)
+            if 'ai_error' in response:
+                response, status = dict(response, success=False, error=response['ai_error']), 500
         else:
-            return jsonify({
-                "error": f"AI analysis failed: {result.get('error', 'Unknown error')}"
-            }), 500
+            response, status = analyze_text(text, BATCH, language, sections)
+    except Exception as e:
+        print(f"❌ Batch item {index} failed: {e}")
+        response, status = {"error": f"Analysis failed: {str(e)}"}, 500
+    return dict(response, index=index, status=status)
+
+@app.route('/api/batch', methods=['POST'])
+def batch_analyze():
+    """Analyze many documents (multipart "files") or texts (JSONL body) at once
+
+    Results are streamed as NDJSON, one line per item in the order the items
+    finish, each with its "index" in the request and an HTTP-style "status";
+    a final {"summary": ...} line closes the stream. Files are parsed in
+    the document parser's process pool and at most BATCH_CONCURRENCY items
+    are analyzed at a time. "language" and "sections" form fields or query
+    parameters apply to every item.
+    """
+    if not document_parser:
+        return jsonify({"error": "Document parser not available"}), 500
+    
+    # Everything that reads the request happens before streaming starts
+    language, sections, invalid = _output_options()
+    if invalid:
+        return invalid
+    items, invalid = _read_batch()
+    if invalid:
+        return invalid
+    
+    def generate():
+        counts = {"items": len(items), "succeeded": 0, "failed": 0}
+        
+        def line(result):
+            counts["succeeded" if result["status"] == 200 else "failed"] += 1
+            return json.dumps(result, ensure_ascii=False) + "\n"
+        
+        documents = []
+        pending = set()
+        parsed = None
+        pool = ThreadPoolExecutor(max_workers=config.BATCH_CONCURRENCY, thread_name_prefix='batch')
+        try:
+            for index, (kind, filename, value) in enumerate(items):
+                if kind == "error":
+                    yield line({"index": index, "status": 400, "filename": filename, "error": value})
+                elif kind == "text":
+                    pending.add(pool.submit(_batch_item, index, value, language, sections))
+                else:
+                    documents.append(index)
+            
+            # Analysis of each document starts as soon as it is parsed
+            parsed = document_parser.extract_many(
+                [(items[index][2], items[index][1]) for index in documents],
+                max_chars=token_budget.input_char_limit()
+            )
+            for position, text, error in parsed:
+                index = documents[position]
+                filename, source = items[index][1], items[index][2]
+                if error:
+                    yield line({"index": index, "status": 400, "filename": filename, "file_size": len(source),
+                                "error": f"Document parsing failed: {error}"})
+                else:
+                    pending.add(pool.submit(_batch_item, index, text, language, sections, filename,
+                                             len(source)))
+                done = {future for future in pending if future.done()}
+                for future in done:
+                    yield line(future.result())
+                pending -= done
+            
+            while pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    yield line(future.result())
+        finally:
+            # Client gone (or batch finished): don't pay for analyses nobody will read
+            for future in pending:
+                future.cancel()
+            if parsed is not None:
+                parsed.close()
+            pool.shutdown(wait=False, cancel_futures=True)
+        
+        yield json.dumps({"summary": counts}) + "\n"
+    
+    return Response(generate(), mimetype='application/x-ndjson', headers={
+        "Cache-Control": "no-cache",
+        "X-Accel-Buffering": "no"
+    })
+
+@app.route('/api/jobs', methods=['POST'])
+def create_job():
+    """Queue an analysis and return its id at once
+
+    Takes the same input as /api/test/upload (multipart "file", optional
+    "tables") or /api/test/text (JSON "text"). A job worker
+    (job_worker.py) runs it; poll GET /api/jobs/<id> for the result.
+    """
+    if not job_queue:
+        return jsonify({"error": "Job queue not available"}), 500
+    
+    if 'file' in request.files:
+        file, ext, invalid = _validate_upload()
+        if invalid:
+            return invalid
+        language, sections, invalid = _output_options()
+        if invalid:
+            return invalid
+        job_id = job_queue.enqueue('file', file.read(), filename=file.filename,
+                                   options={"tables": _wants_tables(), "language": language,
+                                            "sections": sections})
     else:
-        return jsonify({
-            "error": "AI analyzer not available. Check DEEPSEEK_API_KEY in .env",
-            "text_received": text[:200]
-        }), 500
+        data = request.get_json(silent=True)
+        if not data or 'text' not in data:
+            return jsonify({"error": "No text provided"}), 400
+        language, sections, invalid = _output_options(data)
+        if invalid:
+            return invalid
+        job_id = job_queue.enqueue('text', data['text'].encode('utf-8'),
+                                   options={"language": language, "sections": sections})
+    
+    return jsonify({
+        "job_id": job_id,
+        "status": "queued",
+        "status_url": f"/api/jobs/{job_id}"
+    }), 202
+
+@app.route('/api/jobs/<job_id>', methods=['GET'])
+def get_job(job_id):
+    """Status of a queued job, with its result once done"""
+    if not job_queue:
+        return jsonify({"error": "Job queue not available"}), 500
+    
+    job = job_queue.get(job_id)
+    if job is None:
+        return jsonify({"error": "Job not found", "job_id": job_id}), 404
+    return jsonify(job)
+
+def _sse(event: str, data: dict) -> str:
+    """Format one Server-Sent Events message"""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+@app.route('/api/test/stream', methods=['POST'])
+def test_stream():
+    """Streaming analysis endpoint (Server-Sent Events)
+
+    Accepts the same input as /api/test/text (JSON "text") or
+    /api/test/upload (multipart "file") and forwards the analysis as it is
+    generated: one "meta" event with locally extracted key values, "delta"
+    events with text chunks, then a final "done" or "error" event.
+    """
+    if not ai_analyzer or not os.getenv('DEEPSEEK_API_KEY'):
+        return jsonify({"error": "AI analyzer not available. Check DEEPSEEK_API_KEY in .env"}), 500
+    
+    # Everything that reads the request happens before streaming starts
+    if 'file' in request.files:
+        file, ext, invalid = _validate_upload()
+        if invalid:
+            return invalid
+        if not document_parser:
+            return jsonify({"error": "Document parser not available", "filename": file.filename}), 500
+        language, sections, invalid = _output_options()
+        if invalid:
+            return invalid
+        
+        temp_path = None
+        try:
+            source, file_size, temp_path = _spool_upload(file, ext)
+            text, error = document_parser.extract_text(
+                source, max_chars=token_budget.input_char_limit(), filename=file.filename
+            )
+        finally:
+            if temp_path and os.path.exists(temp_path):
+                os.unlink(temp_path)
+        
+        if error:
+            return jsonify({"error": f"Document parsing failed: {error}", "filename": file.filename}), 400
+    else:
+        data = request.get_json(silent=True)
+        if not data or 'text' not in data:
+            return jsonify({"error": "No text provided"}), 400
+        language, sections, invalid = _output_options(data)
+        if invalid:
+            return invalid
+        text = token_budget.fit_input(data['text'])
+    
+    remaining_text, lab_values, compaction, language = _prepare_text(text, language)
+    
+    def generate():
+        yield _sse("meta", {
+            "text_length": len(text),
+            "key_values": lab_values,
+            "compaction": compaction
+        })
+        for event in ai_analyzer.stream_medical_text(remaining_text, language=language, lab_values=lab_values,
+                                                     sections=sections):
+            yield _sse(event.pop("type"), event)
+    
+    return Response(generate(), mimetype='text/event-stream', headers={
+        "Cache-Control": "no-cache",
+        "X-Accel-Buffering": "no"  # don't let nginx-style proxies buffer the stream
+    })
 
 @app.route('/result')
 def result_page():
@@ -255,6 +735,9 @@ if __name__ == '__main__':
     print(f"API Health: http://localhost:5000/api/health")
     print(f"Upload test: POST to http://localhost:5000/api/test/upload")
     print(f"Text test: POST JSON to http://localhost:5000/api/test/text")
+    print(f"Streaming test: POST to http://localhost:5000/api/test/stream (SSE)")
+    print(f"Batch analysis: POST to http://localhost:5000/api/batch (NDJSON)")
+    print(f"Background jobs: POST to http://localhost:5000/api/jobs (run python job_worker.py)")
     
     # Show Supabase status
     if SUPABASE_URL and SUPABASE_ANON_KEY:
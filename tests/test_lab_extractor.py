@@ -0,0 +1,66 @@
+from utils.lab_extractor import LabExtractor, _infer_flag
+
+
+def test_english_and_chinese_lines():
+    text = "\n".join([
+        "Hemoglobin: 112 g/L (130-175) L",
+        "空腹血糖 6.8 mmol/L 参考范围 3.9-6.1 ↑",
+        "WBC 6.5 ×10⁹/L",
+        "Patient reports fatigue",
+    ])
+    rows, remaining = LabExtractor().extract(text)
+    assert rows == [
+        {'test': 'Hemoglobin', 'value': '112', 'unit': 'g/L', 'range': '130-175', 'flag': 'L'},
+        {'test': 'Glucose', 'value': '6.8', 'unit': 'mmol/L', 'range': '3.9-6.1', 'flag': 'H'},
+        {'test': 'WBC', 'value': '6.5', 'unit': '×10⁹/L', 'range': '', 'flag': ''},
+    ]
+    assert remaining == "Patient reports fatigue"
+
+
+def test_infer_flag_bounds():
+    assert _infer_flag('6.8', '3.9-6.1') == 'H'
+    assert _infer_flag('3.5', '3.9-6.1') == 'L'
+    assert _infer_flag('6.1', '3.9-6.1') == ''
+    assert _infer_flag('3.9', '3.9-6.1') == ''
+    assert _infer_flag('3.6', '<3.4') == 'H'
+    assert _infer_flag('3.4', '≤3.4') == ''
+    assert _infer_flag('0.9', '>1.0') == 'L'
+    assert _infer_flag('<0.5', '<3.4') == ''
+    assert _infer_flag('5', '') == ''
+
+
+def test_serial_results_keep_their_dates():
+    text = "\n".join([
+        "2023-01-05",
+        "Hemoglobin 112 g/L (130-175)",
+        "Hemoglobin 112 g/L (130-175)",
+        "2023年6月1日",
+        "Hemoglobin 112 g/L (130-175)",
+    ])
+    rows, remaining = LabExtractor().extract(text)
+    assert [(row.get('date'), row['value'], row['flag']) for row in rows] == [
+        ('2023-01-05', '112', 'L'),
+        ('2023年6月1日', '112', 'L'),
+    ]
+    # The merged repeat stays in the text; captured lines are removed
+    assert remaining.split("\n") == ["2023-01-05", "Hemoglobin 112 g/L (130-175)", "2023年6月1日"]
+
+
+def test_table_rows_come_first_and_their_lines_are_removed():
+    text = "\n".join([
+        "Complete blood count",
+        "Neutrophil % | 78.5 | % | 40-75",
+        "Hemoglobin | 120 | g/L | 130-175",
+        "Creatinine 80 umol/L (57-111)",
+    ])
+    table_rows = [
+        {'test': 'Neutrophil %', 'value': '78.5', 'unit': '%', 'range': '40-75', 'flag': ''},
+        {'test': 'Hemoglobin', 'value': '120', 'unit': 'g/L', 'range': '130-175', 'flag': ''},
+    ]
+    rows, remaining = LabExtractor().extract(text, table_rows)
+    assert [(row['test'], row['flag']) for row in rows] == [
+        ('Neutrophil %', 'H'),
+        ('Hemoglobin', 'L'),
+        ('Creatinine', ''),
+    ]
+    assert remaining == "Complete blood count"
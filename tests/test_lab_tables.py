@@ -0,0 +1,37 @@
+from utils.lab_tables import format_rows, normalize_table
+
+
+def test_header_row_maps_columns():
+    table = [
+        ["检验项目", "结果", "单位", "参考范围", "提示"],
+        ["血红蛋白", "120", "g/L", "130-175", "↓"],
+        ["白细胞", "6.5 H", "10^9/L", "3.5-9.5", None],
+        ["备注", "", "", "", ""],
+    ]
+    assert normalize_table(table) == [
+        {'test': '血红蛋白', 'value': '120', 'unit': 'g/L', 'range': '130-175', 'flag': 'L'},
+        {'test': '白细胞', 'value': '6.5', 'unit': '10^9/L', 'range': '3.5-9.5', 'flag': 'H'},
+    ]
+
+
+def test_rows_without_header_are_classified_by_shape():
+    table = [["Glucose", "6.8↑", "mmol/L", "3.9-6.1"]]
+    assert normalize_table(table) == [
+        {'test': 'Glucose', 'value': '6.8', 'unit': 'mmol/L', 'range': '3.9-6.1', 'flag': 'H'},
+    ]
+
+
+def test_format_rows_groups_dates():
+    rows = [
+        {'test': 'Hemoglobin', 'value': '112', 'unit': 'g/L', 'range': '', 'flag': '', 'date': '2023-01-05'},
+        {'test': 'Glucose', 'value': '5.1', 'unit': 'mmol/L', 'range': '', 'flag': '', 'date': '2023-01-05'},
+        {'test': 'Hemoglobin', 'value': '118', 'unit': 'g/L', 'range': '', 'flag': '', 'date': '2023-06-01'},
+    ]
+    assert format_rows(rows).split("\n") == [
+        "[2023-01-05]",
+        "Hemoglobin | 112 | g/L",
+        "Glucose | 5.1 | mmol/L",
+        "[2023-06-01]",
+        "Hemoglobin | 118 | g/L",
+    ]
+    assert format_rows([{'test': 'WBC', 'value': '6.5', 'unit': '', 'range': '', 'flag': ''}]) == "WBC | 6.5"
@@ -0,0 +1,48 @@
+from utils.text_compactor import TextCompactor
+
+
+def test_short_repeated_results_are_kept():
+    text = "\n".join([
+        "Urinalysis",
+        "Protein", "Negative",
+        "Glucose", "Negative",
+        "Ketones", "Negative",
+        "Nitrite", "Negative",
+        "RBC", "5",
+        "WBC", "2",
+        "Casts", "5",
+        "Bacteria", "5",
+    ])
+    compacted, _ = TextCompactor().compact(text)
+    lines = compacted.split("\n")
+    assert lines.count("Negative") == 4
+    assert lines.count("5") == 3
+    assert lines[lines.index("Casts") + 1] == "5"
+
+
+def test_repeated_page_headers_and_markers_are_dropped():
+    page = "City Hospital Laboratory\nHemoglobin 135 g/L\nPage {} of 3\n"
+    text = "\f".join(page.format(number) for number in range(1, 4))
+    compacted, _ = TextCompactor().compact(text)
+    assert compacted.split("\n") == ["City Hospital Laboratory", "Hemoglobin 135 g/L"]
+
+
+def test_full_width_is_normalized_but_superscripts_are_kept():
+    compacted, _ = TextCompactor().compact("血红蛋白　１２０ｇ/Ｌ\nWBC 6.5 ×10⁹/L")
+    assert compacted.split("\n") == ["血红蛋白 120g/L", "WBC 6.5 ×10⁹/L"]
+
+
+def test_repeated_results_at_different_visits_are_kept():
+    text = "\n".join([
+        "Visit 2023-01-05",
+        "Hemoglobin: 112 g/L (130-175) L",
+        "Hemoglobin: 112 g/L (130-175) L",
+        "Visit 2023-06-01",
+        "Hemoglobin: 112 g/L (130-175) L",
+        "No complaints at this visit",
+        "No complaints at this visit",
+    ])
+    compacted, _ = TextCompactor().compact(text)
+    lines = compacted.split("\n")
+    assert lines.count("Hemoglobin: 112 g/L (130-175) L") == 2
+    assert lines.count("No complaints at this visit") == 1
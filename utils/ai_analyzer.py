@@ -2,86 +2,159 @@
 DeepSeek AI integration for medical document analysis
 """
 from openai import OpenAI
-from typing import Dict
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+import json
 import logging
-import re
+import threading
+
+from utils.hedging import Attempt, Hedger
+from utils.lab_tables import format_rows
+from utils.rate_limiter import INTERACTIVE, RateLimiter
+from utils.resilience import CircuitBreaker, RetryPolicy, call_with_retry
+from utils.response_cache import ResponseCache
+from utils.script_stats import detect_language
+from utils.single_flight import SingleFlight
+from utils.token_budget import TokenBudget, usage_sample
 
 logger = logging.getLogger(__name__)
 
-class AIAnalyzer:
-    """Analyze medical documents using DeepSeek AI"""
-    
-    def __init__(self, api_key: str, base_url: str = "https://api.deepseek.com", model: str = "deepseek-chat"):
-        self.client = OpenAI(api_key=api_key, base_url=base_url)
-        self.model = model
-    
-    def detect_language(self, text: str) -> str:
-        """Detect if text contains Chinese characters"""
-        # Check for Chinese characters (Unicode range for CJK)
-        chinese_pattern = re.compile(r'[\u4e00-\u9fff\u3400-\u4dbf\u20000-\u2a6df\u2a700-\u2b73f\u2b740-\u2b81f\u2b820-\u2ceaf\uf900-\ufaff\u2f800-\u2fa1f]')
-        if chinese_pattern.search(text):
-            return "zh"
-        return "en"
-    
-    def analyze_medical_text(self, text: str, language: str = None) -> Dict:
-        """Analyze medical text with enhanced clinical analysis - bilingual output"""
-        if not text.strip():
-            return {"error": "No text provided"}
-        
-        try:
-            # Auto-detect language if not specified (for internal use)
-            if language is None:
-                language = self.detect_language(text)
-                print(f"🌐 Detected document language: {language}")
-            
-            # Truncate if too long
-            max_length = 8000
-            if len(text) > max_length:
-                text = text[:max_length] + "... [text truncated]"
-            
-            # Updated prompt for bilingual output
-            prompt = f"""As a medical information specialist, please analyze this medical document and provide a comprehensive clinical interpretation:
-
-【MEDICAL DOCUMENT】
-{text}
-
-Please provide analysis in EXACTLY this format with 7 sections and bullet points, with EACH LINE in BOTH English and Chinese (English first, then Chinese on the same line):
-
-1. 📊 **Key Values / 关键数值**
-- [Test name]: [value] [units] ([brief interpretation]) / [项目名称]: [数值] [单位] ([简要解读])
-- [Test name]: [value] [units] ([brief interpretation]) / [项目名称]: [数值] [单位] ([简要解读])
-- Other values ([list normal tests]) are normal / 其他正常值: [列出正常项目]
-
-2. 🔍 **Abnormalities & Significance / 异常发现与意义**
-- Primary abnormality: [brief description] / 主要异常: [简要描述]
-- Pattern: [specific pattern description] / 异常模式: [具体模式]
-- Clinical significance: [specific health impact] / 临床意义: [对健康的具体影响]
-
-3. 🏥 **Possible Diagnosis / 可能的诊断方向**
-- More consistent with: [specific diagnosis] / 更符合: [具体诊断]
-- Supports: [what the results indicate] / 支持: [结果提示什么]
-- Rules out: [what is excluded] / 排除: [排除了什么]
-
-4. 💊 **Current Treatment Status / 当前治疗状态**
-- [Whether medication is indicated in the report] / [报告中是否使用相关药物]
-- [What the values mean for treatment decisions] / [数值对治疗决策的意义]
-
-5. ⚠️ **Urgency & Follow-Up / 紧迫性与随访**
-- Urgent findings: [yes/no and what] / 紧急发现: [有/无及说明]
-- Specialist referral: [needed/not needed and why] / 专科转诊: [需要/不需要及原因]
-- Follow-up timeline: [specific interval and what to repeat] / 随访时间: [具体间隔和复查项目]
-
-6. ❓ **Questions to Ask Your Doctor / 向医生提问**
-- [Question 1] / [问题1]
-- [Question 2] / [问题2]
-- [Question 3] / [问题3]
-- [Question 4] / [问题4]
-- [Question 5] / [问题5]
-
-7. 📋 **Recommendations / 建议**
-- Lifestyle: [specific recommendations] / 生活方式: [具体的饮食、运动建议]
-- Monitoring: [specific tests and intervals] / 监测: [具体检查项目和频率]
-- Evidence-based: [relevant clinical guidelines] / 循证依据: [相关临床指南]
+# Bump whenever the prompt text changes so cached responses are not reused
+PROMPT_VERSION = '4'
+
+TEMPERATURE = 0.4
+
+USAGE_FIELDS = ('prompt_tokens', 'completion_tokens', 'prompt_cache_hit_tokens', 'prompt_cache_miss_tokens')
+
+DISCLAIMER = ("此分析仅供信息参考，不能替代专业医疗建议、诊断或治疗。如有医疗问题，请务必咨询合格的医疗保健提供者。" +
+              " This analysis is for informational purposes only and is not a substitute for professional medical advice, " +
+              "diagnosis, or treatment. Always consult with a qualified healthcare provider for medical concerns.")
+
+# Output language modes. Bilingual writes every line twice, so a single
+# language needs about half the completion tokens (plus some headroom)
+LANGUAGES = ('en', 'zh', 'bilingual')
+OUTPUT_TOKEN_SHARE = {'en': 0.55, 'zh': 0.55, 'bilingual': 1.0}
+
+# The 7 analysis sections: (id, emoji, English title, Chinese title, bullets),
+# each bullet an (English, Chinese) template pair. Requests may ask for a
+# subset by id or number; sections keep their numbers either way.
+SECTIONS = (
+    ('key_values', '📊', 'Key Values', '关键数值', (
+        ('[Test name]: [value] [units] ([brief interpretation])', '[项目名称]: [数值] [单位] ([简要解读])'),
+        ('[Test name]: [value] [units] ([brief interpretation])', '[项目名称]: [数值] [单位] ([简要解读])'),
+        ('Other values ([list normal tests]) are normal', '其他正常值: [列出正常项目]'),
+    )),
+    ('abnormalities', '🔍', 'Abnormalities & Significance', '异常发现与意义', (
+        ('Primary abnormality: [brief description]', '主要异常: [简要描述]'),
+        ('Pattern: [specific pattern description]', '异常模式: [具体模式]'),
+        ('Clinical significance: [specific health impact]', '临床意义: [对健康的具体影响]'),
+    )),
+    ('diagnosis', '🏥', 'Possible Diagnosis', '可能的诊断方向', (
+        ('More consistent with: [specific diagnosis]', '更符合: [具体诊断]'),
+        ('Supports: [what the results indicate]', '支持: [结果提示什么]'),
+        ('Rules out: [what is excluded]', '排除: [排除了什么]'),
+    )),
+    ('treatment', '💊', 'Current Treatment Status', '当前治疗状态', (
+        ('[Whether medication is indicated in the report]', '[报告中是否使用相关药物]'),
+        ('[What the values mean for treatment decisions]', '[数值对治疗决策的意义]'),
+    )),
+    ('urgency', '⚠️', 'Urgency & Follow-Up', '紧迫性与随访', (
+        ('Urgent findings: [yes/no and what]', '紧急发现: [有/无及说明]'),
+        ('Specialist referral: [needed/not needed and why]', '专科转诊: [需要/不需要及原因]'),
+        ('Follow-up timeline: [specific interval and what to repeat]', '随访时间: [具体间隔和复查项目]'),
+    )),
+    ('questions', '❓', 'Questions to Ask Your Doctor', '向医生提问', (
+        ('[Question 1]', '[问题1]'),
+        ('[Question 2]', '[问题2]'),
+        ('[Question 3]', '[问题3]'),
+        ('[Question 4]', '[问题4]'),
+        ('[Question 5]', '[问题5]'),
+    )),
+    ('recommendations', '📋', 'Recommendations', '建议', (
+        ('Lifestyle: [specific recommendations]', '生活方式: [具体的饮食、运动建议]'),
+        ('Monitoring: [specific tests and intervals]', '监测: [具体检查项目和频率]'),
+        ('Evidence-based: [relevant clinical guidelines]', '循证依据: [相关临床指南]'),
+    )),
+)
+SECTION_IDS = tuple(section[0] for section in SECTIONS)
+SECTION_BULLETS = {section[0]: len(section[4]) for section in SECTIONS}
+
+
+def _in_language(english: str, chinese: str, language: str) -> str:
+    if language == 'en':
+        return english
+    if language == 'zh':
+        return chinese
+    return f"{english} / {chinese}"
+
+
+def _system_prompt(language: str) -> str:
+    output_rules = {
+        'bilingual': """2. ALL bullet points must contain BOTH English and Chinese versions, separated by " / "
+3. English must come FIRST, followed by Chinese
+4. All bullet point text must be plain with no asterisks, no bold, no italics, no markdown of any kind""",
+        'en': """2. ALL bullet points must be written in English only
+3. All bullet point text must be plain with no asterisks, no bold, no italics, no markdown of any kind""",
+        'zh': """2. ALL bullet points must be written in Simplified Chinese only
+3. All bullet point text must be plain with no asterisks, no bold, no italics, no markdown of any kind""",
+    }
+    language_rules = {
+        'bilingual': """You MUST provide EVERY line of analysis in BOTH English and Chinese, with English first and Chinese after the " / " separator.""",
+        'en': """You MUST write EVERY line of analysis in English only, with no Chinese translation.""",
+        'zh': """You MUST write EVERY line of analysis in Simplified Chinese only, with no English translation. Test names, values and units may be kept as they appear in the document.""",
+    }
+    return f"""You are an experienced clinical information specialist and medical educator. 
+Your role is to help patients understand their medical documents by providing professional, evidence-based interpretation.
+
+**STRICT OUTPUT RULE**: 
+1. ONLY the section titles may have **bold** formatting
+{output_rules[language]}
+
+**CLINICAL ACCURACY RULE**: When interpreting lab values, always ensure logical consistency. Never state that a value is "above target" when it is numerically below that target. If multiple targets exist (general vs. high-risk), clearly specify which target is being applied based on patient risk factors mentioned in the document.
+
+**LANGUAGE RULE**: {language_rules[language]}"""
+
+
+@lru_cache(maxsize=None)
+def _analysis_instructions(language: str, sections: Optional[Tuple[str, ...]] = None) -> str:
+    """Instructions for the given sections (None = all 7), each a static string"""
+    line_language = {
+        'bilingual': "with EACH LINE in BOTH English and Chinese (English first, then Chinese on the same line)",
+        'en': "with EACH LINE in English only",
+        'zh': "with EACH LINE in Simplified Chinese only",
+    }
+    bullet_rule = {
+        'bilingual': 'For ALL bullet points, you MUST write BOTH English and Chinese versions separated by " / "',
+        'en': 'For ALL bullet points, write English only - no Chinese translation',
+        'zh': 'For ALL bullet points, write Simplified Chinese only - no English translation',
+    }
+    closing = {
+        'bilingual': "Provide a concise, clinically-oriented bilingual analysis",
+        'en': "Provide a concise, clinically-oriented analysis in English",
+        'zh': "Provide a concise, clinically-oriented analysis in Simplified Chinese",
+    }
+    selected = [(number, section) for number, section in enumerate(SECTIONS, 1)
+                if sections is None or section[0] in sections]
+    formats = "\n\n".join(
+        f"{number}. {emoji} **{_in_language(english, chinese, language)}**\n" +
+        "\n".join(f"- {_in_language(en, zh, language)}" for en, zh in bullets)
+        for number, (_, emoji, english, chinese, bullets) in selected
+    )
+    count = len(selected)
+    scope = "" if sections is None else (
+        "\nWrite only these sections, no others, and keep their numbers exactly as shown.")
+    example = _in_language(
+        '"Non-HDL Cholesterol: 125 mg/dL (elevated for high-risk patients - target <100 mg/dL for diabetes with ASCVD risk factors)"',
+        '"非高密度脂蛋白胆固醇: 125 mg/dL (对高风险患者而言偏高 - 对于伴有ASCVD危险因素的糖尿病患者，目标值应<100 mg/dL)"',
+        language
+    )
+    not_specified = _in_language('"Not specified in report"', '"报告中未说明"', language)
+    return f"""As a medical information specialist, please analyze the medical document at the end of this message and provide a comprehensive clinical interpretation.
+
+Please provide analysis in EXACTLY this format with {count} sections and bullet points, {line_language[language]}:{scope}
+
+{formats}
 
 **IMPORTANT INTERPRETATION GUIDELINES FOR LIPID PANELS:**
 When interpreting Non-HDL Cholesterol and LDL-C, pay close attention to patient-specific risk factors mentioned in the document:
@@ -92,58 +165,560 @@ When interpreting Non-HDL Cholesterol and LDL-C, pay close attention to patient-
   * For patients with CHD or diabetic patients with ≥2 CHD risk factors: LDL-C target <70 mg/dL
 
 - When a value is flagged as elevated, ALWAYS specify WHICH target is being applied
-- Example of CORRECT interpretation: "Non-HDL Cholesterol: 125 mg/dL (elevated for high-risk patients - target <100 mg/dL for diabetes with ASCVD risk factors)" / "非高密度脂蛋白胆固醇: 125 mg/dL (对高风险患者而言偏高 - 对于伴有ASCVD危险因素的糖尿病患者，目标值应<100 mg/dL)"
+- Example of CORRECT interpretation: {example}
 
 **CRITICAL FORMATTING RULES - READ CAREFULLY:**
-1. ONLY the 7 section titles may have **double asterisks** for bold
-2. For ALL bullet points, you MUST write BOTH English and Chinese versions separated by " / "
+1. ONLY the {count} section titles may have **double asterisks** for bold
+2. {bullet_rule[language]}
 3. Bullet points must start with "- " followed by plain text only - no asterisks, no underscores, no backticks
 4. Write medical terms, diagnoses, and values as plain text without any formatting
 5. Be concise: 2-4 bullet points per section
 6. No introductory sentences, no conclusions, no extra text
-7. If data is insufficient, state "Not specified in report" / "报告中未说明" as plain text
+7. If data is insufficient, state {not_specified} as plain text
 
-Provide a concise, clinically-oriented bilingual analysis with absolutely no formatting in the bullet points."""
-            
-            # System message for bilingual output
-            system_content = """You are an experienced clinical information specialist and medical educator. 
-Your role is to help patients understand their medical documents by providing professional, evidence-based interpretation.
+{closing[language]} with absolutely no formatting in the bullet points."""
 
-**STRICT OUTPUT RULE**: 
-1. ONLY the 7 section titles may have **bold** formatting
-2. ALL bullet points must contain BOTH English and Chinese versions, separated by " / "
-3. English must come FIRST, followed by Chinese
-4. All bullet point text must be plain with no asterisks, no bold, no italics, no markdown of any kind
 
-**CLINICAL ACCURACY RULE**: When interpreting lab values, always ensure logical consistency. Never state that a value is "above target" when it is numerically below that target. If multiple targets exist (general vs. high-risk), clearly specify which target is being applied based on patient risk factors mentioned in the document.
+# Static prompt material, one system prompt per output language and one set
+# of instructions per language and section selection. Both are sent verbatim
+# ahead of the document so they form a stable prefix for DeepSeek context
+# caching: never interpolate per-request values into them.
+SYSTEM_PROMPTS = {language: _system_prompt(language) for language in LANGUAGES}
+
+
+def analysis_prompt(language: str, sections: Optional[Tuple[str, ...]] = None) -> Tuple[str, str]:
+    """(system prompt, instructions) for an output language and section selection"""
+    return SYSTEM_PROMPTS[language], _analysis_instructions(language, sections)
+
+
+DOCUMENT_HEADER = "【MEDICAL DOCUMENT】"
+
+# Map step of map-reduce analysis: each part of a long record is reduced to
+# plain facts, and the findings of all parts become the document of one
+# regular 7-section analysis. Static text first, as above.
+MAP_SYSTEM_PROMPT = """You extract facts from medical records accurately and completely, without interpretation."""
+
+MAP_INSTRUCTIONS = """The text at the end of this message is one part of a longer medical record. List every medical fact it contains:
+
+- Lab and test results: test name, value, unit, reference range and any abnormal flag, copied exactly
+- Dates, visit or report names, and the ordering department when stated
+- Diagnoses, symptoms, medications with doses, procedures and the doctor's recommendations
+
+Rules:
+1. One fact per line, starting with "- ", in English; keep original test names in brackets when they are not English
+2. Keep the date or visit a value belongs to on the same line
+3. No interpretation, no commentary, no repeated facts
+4. If the part contains no medical facts, reply with the single line: - None"""
+
+PART_HEADER = "【DOCUMENT PART】"
+
+# Completion tokens per map call, further capped so that the findings of
+# all parts fit the reduce prompt
+MAP_COMPLETION_TOKENS = 1000
+MIN_MAP_COMPLETION_TOKENS = 200
+
+CHUNK_CONCURRENCY = 4
+
+WARMUP_TIMEOUT = 10.0  # seconds per warm-up request
+
+
+def parse_language(value: Optional[str]) -> Tuple[Optional[str], Optional[str]]:
+    """Validate a request's language option; returns (language, error)
+
+    Empty or 'auto' gives None, i.e. the document's detected language.
+    """
+    if value is None or not str(value).strip() or str(value).strip().lower() == 'auto':
+        return None, None
+    language = str(value).strip().lower()
+    if language not in LANGUAGES:
+        return None, f"Unsupported language: {value}. Use: {', '.join(LANGUAGES)} or auto"
+    return language, None
+
+
+def parse_sections(value) -> Tuple[Optional[Tuple[str, ...]], Optional[str]]:
+    """Validate a request's sections option; returns (sections, error)
+
+    Accepts a list or a comma-separated string of section ids
+    (key_values, abnormalities, diagnosis, treatment, urgency, questions,
+    recommendations) or numbers 1-7. Empty or all sections gives None.
+    """
+    if value is None:
+        return None, None
+    items = value.split(',') if isinstance(value, str) else value
+    if not isinstance(items, (list, tuple)):
+        return None, "sections must be a list or a comma-separated string"
+    
+    chosen = set()
+    for item in items:
+        name = str(item).strip().lower()
+        if not name:
+            continue
+        if name.isdigit() and 1 <= int(name) <= len(SECTION_IDS):
+            name = SECTION_IDS[int(name) - 1]
+        if name not in SECTION_IDS:
+            return None, f"Unknown section: {item}. Use: {', '.join(SECTION_IDS)} (or 1-{len(SECTION_IDS)})"
+        chosen.add(name)
+    
+    if not chosen or len(chosen) == len(SECTION_IDS):
+        return None, None
+    return tuple(name for name in SECTION_IDS if name in chosen), None
+
+
+def sum_usage(usages: List[Dict[str, int]]) -> Dict[str, int]:
+    """Add up the usage dicts of several calls"""
+    return {field: sum(usage.get(field, 0) for usage in usages) for field in USAGE_FIELDS}
+
+
+class AIAnalyzer:
+    """Analyze medical documents using DeepSeek AI"""
+    
+    def __init__(self, api_key: str, base_url: str = "https://api.deepseek.com", model: str = "deepseek-chat",
+                 cache: Optional[ResponseCache] = None, single_flight: Optional[SingleFlight] = None,
+                 budget: Optional[TokenBudget] = None, usage_log: Optional[str] = None,
+                 chunk_concurrency: int = CHUNK_CONCURRENCY, retry_policy: Optional[RetryPolicy] = None,
+                 breaker: Optional[CircuitBreaker] = None, hedger: Optional[Hedger] = None,
+                 http_client=None, limiter: Optional[RateLimiter] = None):
+        self.client = self._make_client(api_key, base_url, http_client)
+        self.hedger = hedger
+        self.limiter = limiter
+        self.retry_policy = retry_policy or RetryPolicy()
+        self.breaker = breaker or CircuitBreaker()
+        self.model = model
+        self.cache = cache
+        self.single_flight = single_flight
+        self.budget = budget or TokenBudget()
+        self.usage_log = usage_log  # JSONL of usage_sample records for calibrate_token_rates.py
+        self._usage_lock = threading.Lock()
+        self.usage_stats = {field: 0 for field in ('calls',) + USAGE_FIELDS}
+        self.chunk_concurrency = max(chunk_concurrency, 1)
+        self._map_pool = None
+        self._map_pool_lock = threading.Lock()
+    
+    def _make_client(self, api_key: str, base_url: str, http_client=None):
+        # Retries are handled by _create so they share the backoff and breaker
+        return OpenAI(api_key=api_key, base_url=base_url, max_retries=0, http_client=http_client)
+    
+    def warm_up(self, connections: int = 1) -> int:
+        """Open pooled connections (DNS, TCP, TLS) before the first analysis
+
+        Each connection is opened by a cheap GET /models; returns how many
+        succeeded. Failures are logged, never raised.
+        """
+        def ping(_):
+            try:
+                self.client.models.list(timeout=WARMUP_TIMEOUT)
+                return True
+            except Exception as e:
+                logger.warning(f"DeepSeek warm-up request failed: {e}")
+                return False
+        
+        with ThreadPoolExecutor(max_workers=max(connections, 1)) as pool:
+            return sum(pool.map(ping, range(connections)))
+    
+    def _create(self, priority: str = INTERACTIVE, cancelled: Optional[threading.Event] = None,
+                admitted: bool = False, **kwargs):
+        """chat.completions.create with per-attempt timeout, retries and the circuit breaker
+
+        With a limiter, every attempt first waits for rate-limit capacity
+        for its estimated prompt tokens, queued by priority; admitted means
+        the caller already did so for the first attempt. Once cancelled is
+        set no further attempt is made and a queued attempt gives up its
+        place.
+        """
+        def call():
+            nonlocal admitted
+            if self.limiter is not None and not admitted:
+                self.limiter.acquire(self._prompt_tokens(kwargs['messages']), priority, cancelled)
+            admitted = False
+            return self.client.chat.completions.create(timeout=self.retry_policy.timeout, **kwargs)
+        
+        return call_with_retry(call, self.retry_policy, self.breaker, cancelled)
+    
+    def _prompt_tokens(self, messages: List[Dict[str, str]]) -> int:
+        return sum(self.budget.estimate(message['content']) for message in messages)
+    
+    def _complete(self, messages: List[Dict[str, str]], max_tokens: int,
+                  priority: str = INTERACTIVE) -> Tuple[str, object]:
+        """One whole completion, hedged when a hedger is set; returns (content, usage)
+
+        When hedging, the primary attempt waits for rate-limit capacity
+        before the hedge delay starts, so time spent queued is neither
+        mistaken for a slow first token nor recorded as latency.
+        """
+        if self.hedger is not None:
+            if self.limiter is not None:
+                self.limiter.acquire(self._prompt_tokens(messages), priority)
+            return self.hedger.run(lambda attempt: self._collect_stream(messages, max_tokens, attempt, priority))
+        response = self._create(
+            priority,
+            model=self.model,
+            messages=messages,
+            temperature=TEMPERATURE,
+            max_tokens=max_tokens
+        )
+        return response.choices[0].message.content, response.usage
+    
+    def _collect_stream(self, messages: List[Dict[str, str]], max_tokens: int,
+                        attempt: Attempt, priority: str = INTERACTIVE) -> Tuple[str, object]:
+        """Streamed completion for one hedge attempt, so the first token is observable
+        and a cancelled attempt can drop its connection (its usage goes to the hedger stats)"""
+        stream = self._create(
+            priority,
+            cancelled=attempt.cancelled,
+            admitted=attempt.index == 0,
+            model=self.model,
+            messages=messages,
+            temperature=TEMPERATURE,
+            max_tokens=max_tokens,
+            stream=True,
+            extra_body={"stream_options": {"include_usage": True}}
+        )
+        attempt.track(stream.response)
+        parts = []
+        usage = None
+        try:
+            for chunk in stream:
+                if attempt.cancelled.is_set():
+                    break
+                usage = getattr(chunk, 'usage', None) or usage
+                if chunk.choices and chunk.choices[0].delta.content:
+                    attempt.first_token()
+                    parts.append(chunk.choices[0].delta.content)
+        finally:
+            stream.response.close()
+            if attempt.cancelled.is_set():
+                self._record_discarded(attempt, usage, messages, parts)
+        return "".join(parts), usage
+    
+    def _record_discarded(self, attempt: Attempt, usage, messages: List[Dict[str, str]], parts: List[str]):
+        """Report a cancelled hedge attempt's tokens to the hedger
+
+        The upstream bills the prompt and whatever was generated before the
+        connection dropped; usage rarely arrives by then, so both are
+        estimated unless it did.
+        """
+        prompt_tokens = self._prompt_tokens(messages)
+        completion_tokens = self.budget.estimate("".join(parts))
+        if usage is not None:
+            read = usage.get if isinstance(usage, dict) else lambda field: getattr(usage, field, None)
+            prompt_tokens = read('prompt_tokens') or prompt_tokens
+            completion_tokens = read('completion_tokens') or completion_tokens
+        attempt.hedger.record_discarded(prompt_tokens, completion_tokens)
+    
+    def detect_language(self, text: str) -> str:
+        """Detect if text is mainly Chinese ('zh') or not ('en')"""
+        return detect_language(text)
+    
+    def _output_language(self, text: str, language: Optional[str]) -> str:
+        """The requested output language, or the document's own when none is given"""
+        if language is None:
+            language = self.detect_language(text)
+            print(f"🌐 Detected document language: {language}")
+        if language not in LANGUAGES:
+            raise ValueError(f"Unsupported language: {language} (use {', '.join(LANGUAGES)})")
+        return language
+    
+    @staticmethod
+    def _output_sections(sections: Optional[Sequence[str]]) -> Optional[Tuple[str, ...]]:
+        """Normalized section selection (None = all 7)"""
+        sections, error = parse_sections(sections)
+        if error:
+            raise ValueError(error)
+        return sections
+    
+    def _max_tokens(self, language: str, sections: Optional[Tuple[str, ...]] = None) -> int:
+        """Completion budget scaled to the output language and the share of section bullets requested"""
+        max_tokens = self.budget.completion_tokens * OUTPUT_TOKEN_SHARE[language]
+        if sections is not None:
+            max_tokens *= sum(SECTION_BULLETS[name] for name in sections) / sum(SECTION_BULLETS.values())
+        return int(max_tokens)
+    
+    def analyze_medical_text(self, text: str, language: str = None,
+                             lab_values: Optional[List[Dict[str, str]]] = None,
+                             priority: str = INTERACTIVE, sections: Optional[Sequence[str]] = None) -> Dict:
+        """Analyze medical text with enhanced clinical analysis
+
+        language is 'en', 'zh' or 'bilingual' (every line in both); by
+        default the analysis is written in the language of text. Callers
+        that take lines out of the document first (LabExtractor) should
+        detect it on the full text instead, see script_stats.detect_language.
+        sections limits the analysis to some of the 7 sections (ids or
+        numbers, see parse_sections), with max_tokens cut to match.
+        lab_values are rows from LabExtractor; they are sent as a compact
+        "test | value | unit | range | flag" block ahead of the document text.
+        With single_flight set, concurrent identical requests wait for one
+        upstream call and get its result marked "coalesced". priority
+        (interactive, batch or background) orders calls queued by the limiter.
+        """
+        if not text.strip() and not lab_values:
+            return {"error": "No text provided"}
+        
+        try:
+            language = self._output_language(text, language)
+            sections = self._output_sections(sections)
+            cache_key = self._cache_key(text, language, lab_values, sections)
+            cached = self._cache_get(cache_key)
+            if cached is not None:
+                return cached
+            
+            if self.single_flight is None:
+                return self._analyze_upstream(cache_key, text, language, lab_values, priority, sections)
+            
+            # Identical concurrent requests share one upstream call
+            result, shared = self.single_flight.do(
+                cache_key,
+                lambda: self._analyze_upstream(cache_key, text, language, lab_values, priority, sections),
+                lookup=lambda: self._cache_get(cache_key)
+            )
+            return dict(result, coalesced=True) if shared else result
+            
+        except Exception as e:
+            logger.error(f"AI analysis failed: {e}")
+            return {
+                "success": False,
+                "error": f"AI analysis failed: {str(e)}"
+            }
+    
+    def _analyze_upstream(self, cache_key: str, text: str, language: str,
+                          lab_values: Optional[List[Dict[str, str]]], priority: str = INTERACTIVE,
+                          sections: Optional[Tuple[str, ...]] = None) -> Dict:
+        """Call DeepSeek (map calls first for long documents) and cache the result"""
+        chunks = self._plan_chunks(text, language, lab_values, sections)
+        map_usage = []
+        if chunks:
+            text, map_usage = self._map_chunks(chunks, language, lab_values, priority, sections)
+        
+        messages = self._build_messages(text, language, lab_values, sections)
+        
+        analysis, usage = self._complete(messages, self._max_tokens(language, sections), priority)
+        
+        result = {
+            "success": True,
+            "analysis": analysis,
+            "language": language,
+            "sections": list(sections or SECTION_IDS),
+            "model": self.model,
+            "disclaimer": DISCLAIMER,
+            "cached": False,
+            "usage": sum_usage([self._record_usage(usage, messages)] + map_usage)
+        }
+        if chunks:
+            result["chunks"] = len(chunks)
+        self._cache_set(cache_key, result)
+        return result
+    
+    def stream_medical_text(self, text: str, language: str = None,
+                            lab_values: Optional[List[Dict[str, str]]] = None,
+                            priority: str = INTERACTIVE, sections: Optional[Sequence[str]] = None) -> Iterator[Dict]:
+        """Stream the same analysis as analyze_medical_text, chunk by chunk
 
-**LANGUAGE RULE**: You MUST provide EVERY line of analysis in BOTH English and Chinese, with English first and Chinese after the " / " separator."""
+        Yields {"type": "delta", "content": ...} events as the model writes,
+        then one {"type": "done", ...} event carrying the full analysis, or
+        a single {"type": "error", ...} event if the call fails.
+        """
+        if not text.strip() and not lab_values:
+            yield {"type": "error", "error": "No text provided"}
+            return
+        
+        parts = []
+        try:
+            language = self._output_language(text, language)
+            sections = self._output_sections(sections)
+            cache_key = self._cache_key(text, language, lab_values, sections)
+            cached = self._cache_get(cache_key)
+            if cached is not None:
+                yield {"type": "delta", "content": cached["analysis"]}
+                yield dict(cached, type="done")
+                return
+            
+            chunks = self._plan_chunks(text, language, lab_values, sections)
+            map_usage = []
+            if chunks:
+                yield {"type": "progress", "stage": "map", "chunks": len(chunks)}
+                text, map_usage = self._map_chunks(chunks, language, lab_values, priority, sections)
+            
+            messages = self._build_messages(text, language, lab_values, sections)
             
-            response = self.client.chat.completions.create(
+            stream = self._create(
+                priority,
                 model=self.model,
-                messages=[
-                    {"role": "system", "content": system_content},
-                    {"role": "user", "content": prompt}
-                ],
-                temperature=0.4,
-                max_tokens=3500  # Increased token limit for bilingual content
+                messages=messages,
+                temperature=TEMPERATURE,
+                max_tokens=self._max_tokens(language, sections),
+                stream=True,
+                extra_body={"stream_options": {"include_usage": True}}
             )
             
-            analysis = response.choices[0].message.content
+            usage = None
+            try:
+                for chunk in stream:
+                    # The final chunk carries usage and no choices
+                    usage = getattr(chunk, 'usage', None) or usage
+                    if not chunk.choices:
+                        continue
+                    content = chunk.choices[0].delta.content
+                    if content:
+                        parts.append(content)
+                        yield {"type": "delta", "content": content}
+            finally:
+                # Also runs when the SSE client disconnects (GeneratorExit):
+                # closing the response stops the generation upstream
+                stream.response.close()
             
-            return {
+            result = {
                 "success": True,
-                "analysis": analysis,
-                "language": "bilingual",  # Changed to indicate bilingual output
+                "analysis": "".join(parts),
+                "language": language,
+                "sections": list(sections or SECTION_IDS),
                 "model": self.model,
-                "disclaimer": "此分析仅供信息参考，不能替代专业医疗建议、诊断或治疗。如有医疗问题，请务必咨询合格的医疗保健提供者。" + 
-                             " This analysis is for informational purposes only and is not a substitute for professional medical advice, " +
-                             "diagnosis, or treatment. Always consult with a qualified healthcare provider for medical concerns."
+                "disclaimer": DISCLAIMER,
+                "cached": False,
+                "usage": sum_usage([self._record_usage(usage, messages)] + map_usage)
             }
+            if chunks:
+                result["chunks"] = len(chunks)
+            self._cache_set(cache_key, result)
+            yield dict(result, type="done")
             
         except Exception as e:
-            logger.error(f"AI analysis failed: {e}")
-            return {
+            logger.error(f"AI analysis stream failed: {e}")
+            yield {
+                "type": "error",
                 "success": False,
                 "error": f"AI analysis failed: {str(e)}"
-            }
\ No newline at end of file
+            }
+    
+    def _plan_chunks(self, text: str, language: str, lab_values: Optional[List[Dict[str, str]]],
+                     sections: Optional[Tuple[str, ...]] = None) -> Optional[List[str]]:
+        """Parts for map-reduce analysis, or None when the document fits one prompt"""
+        if self.budget.max_chunks <= 1:
+            return None
+        facts = self._format_facts(lab_values)
+        if self.budget.estimate(text) <= self.budget.document_tokens(
+                *analysis_prompt(language, sections), facts, DOCUMENT_HEADER):
+            return None
+        
+        part_budget = self.budget.document_tokens(MAP_SYSTEM_PROMPT, MAP_INSTRUCTIONS, PART_HEADER)
+        chunks, truncated = self.budget.split(text, part_budget, self.budget.max_chunks)
+        if truncated:
+            logger.warning(f"Document exceeds {self.budget.max_chunks} parts; the rest is not analyzed")
+        return chunks
+    
+    def _map_messages(self, chunk: str) -> List[Dict[str, str]]:
+        return [
+            {"role": "system", "content": MAP_SYSTEM_PROMPT},
+            {"role": "user", "content": f"{MAP_INSTRUCTIONS}\n\n{PART_HEADER}\n{chunk}"}
+        ]
+    
+    def _map_max_tokens(self, chunk_count: int, language: str, lab_values: Optional[List[Dict[str, str]]],
+                        sections: Optional[Tuple[str, ...]] = None) -> int:
+        """Completion tokens per map call so that all findings fit the reduce prompt"""
+        reduce_budget = self.budget.document_tokens(
+            *analysis_prompt(language, sections), self._format_facts(lab_values), DOCUMENT_HEADER)
+        return max(min(MAP_COMPLETION_TOKENS, reduce_budget // chunk_count), MIN_MAP_COMPLETION_TOKENS)
+    
+    @staticmethod
+    def _join_findings(findings: List[str]) -> str:
+        total = len(findings)
+        return "\n\n".join(f"【PART {i} OF {total}】\n{part.strip()}" for i, part in enumerate(findings, 1))
+    
+    def _map_chunks(self, chunks: List[str], language: str, lab_values: Optional[List[Dict[str, str]]],
+                    priority: str = INTERACTIVE,
+                    sections: Optional[Tuple[str, ...]] = None) -> Tuple[str, List[Dict[str, int]]]:
+        """Extract findings from every part concurrently; returns (findings text, usages)"""
+        max_tokens = self._map_max_tokens(len(chunks), language, lab_values, sections)
+        with self._map_pool_lock:
+            if self._map_pool is None:
+                self._map_pool = ThreadPoolExecutor(max_workers=self.chunk_concurrency,
+                                                    thread_name_prefix='analysis-map')
+        outputs = list(self._map_pool.map(lambda chunk: self._map_chunk(chunk, max_tokens, priority), chunks))
+        return self._join_findings([text for text, _ in outputs]), [usage for _, usage in outputs]
+    
+    def _map_chunk(self, chunk: str, max_tokens: int, priority: str = INTERACTIVE) -> Tuple[str, Dict[str, int]]:
+        messages = self._map_messages(chunk)
+        content, usage = self._complete(messages, max_tokens, priority)
+        return content, self._record_usage(usage, messages)
+    
+    def _record_usage(self, usage, messages: List[Dict[str, str]]) -> Dict[str, int]:
+        """Token counts from response.usage, added to the running totals
+
+        prompt_cache_hit_tokens / prompt_cache_miss_tokens are DeepSeek
+        extensions reporting how much of the prompt came from its prefix cache.
+        """
+        if isinstance(usage, dict):  # streamed usage is an untyped extra field on the chunk
+            counts = {field: usage.get(field) or 0 for field in USAGE_FIELDS}
+        else:
+            counts = {field: getattr(usage, field, None) or 0 for field in USAGE_FIELDS}
+        if self.limiter is not None and counts['prompt_tokens']:
+            # The limiter was charged the prompt estimate; settle the real total
+            self.limiter.charge(counts['prompt_tokens'] + counts['completion_tokens'] - self._prompt_tokens(messages))
+        with self._usage_lock:
+            self.usage_stats['calls'] += 1
+            for field, value in counts.items():
+                self.usage_stats[field] += value
+            if self.usage_log and counts['prompt_tokens']:
+                try:
+                    with open(self.usage_log, 'a', encoding='utf-8') as f:
+                        f.write(json.dumps(usage_sample(messages, counts['prompt_tokens'])) + "\n")
+                except OSError as e:
+                    logger.warning(f"Could not write token usage sample: {e}")
+        return counts
+    
+    def get_usage_stats(self) -> Dict[str, float]:
+        """Token totals across upstream calls, with the prompt cache hit rate"""
+        with self._usage_lock:
+            stats = dict(self.usage_stats)
+        prompt_tokens = stats['prompt_cache_hit_tokens'] + stats['prompt_cache_miss_tokens']
+        stats['prompt_cache_hit_rate'] = stats['prompt_cache_hit_tokens'] / prompt_tokens if prompt_tokens else 0.0
+        return stats
+    
+    def _cache_key(self, text: str, language: Optional[str], lab_values: Optional[List[Dict[str, str]]],
+                   sections: Optional[Tuple[str, ...]] = None) -> str:
+        """Response cache key for a request (also the single-flight key)"""
+        return ResponseCache.make_key(text, self.model, TEMPERATURE, PROMPT_VERSION,
+                                      language=language, sections=sections, lab_values=lab_values or [],
+                                      max_tokens=self.budget.completion_tokens, prompt_tokens=self.budget.prompt_tokens,
+                                      max_chunks=self.budget.max_chunks)
+    
+    def _cache_get(self, cache_key: str) -> Optional[Dict]:
+        """Cached result marked as cached, or None"""
+        if self.cache is None:
+            return None
+        cached = self.cache.get(cache_key)
+        return dict(cached, cached=True) if cached is not None else None
+    
+    def _cache_set(self, cache_key: str, result: Dict):
+        if self.cache is not None:
+            self.cache.set(cache_key, result)
+    
+    @staticmethod
+    def _format_facts(lab_values: Optional[List[Dict[str, str]]]) -> str:
+        """The extracted lab values block placed ahead of the document"""
+        if not lab_values:
+            return ""
+        return f"""【EXTRACTED LAB VALUES】 (test | value | unit | reference range | flag)
+{format_rows(lab_values)}
+
+"""
+    
+    def _build_messages(self, text: str, language: str, lab_values: Optional[List[Dict[str, str]]],
+                        sections: Optional[Tuple[str, ...]] = None) -> List[Dict[str, str]]:
+        """Build the system and user messages for an analysis request
+
+        Everything up to 【MEDICAL DOCUMENT】 (or the lab values block) is
+        byte-identical across requests, so DeepSeek's prefix context cache
+        can reuse it; only the per-document tail varies.
+        """
+        facts = self._format_facts(lab_values)
+        
+        # Fit the document into what the prompt budget leaves after the fixed parts
+        system_prompt, instructions = analysis_prompt(language, sections)
+        document_budget = self.budget.document_tokens(system_prompt, instructions, facts, DOCUMENT_HEADER)
+        text, truncated = self.budget.truncate(text, document_budget)
+        if truncated:
+            text += "\n... [text truncated]"
+        
+        return [
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": f"{instructions}\n\n{facts}{DOCUMENT_HEADER}\n{text}"}
+        ]
@@ -0,0 +1,282 @@
+"""
+Async DeepSeek integration for the ASGI serving path
+"""
+from openai import AsyncOpenAI
+from typing import AsyncIterator, Dict, List, Optional, Sequence, Tuple
+import asyncio
+import logging
+
+from utils.ai_analyzer import (
+    AIAnalyzer, CHUNK_CONCURRENCY, DISCLAIMER, SECTION_IDS, TEMPERATURE, WARMUP_TIMEOUT, sum_usage
+)
+from utils.hedging import Attempt, Hedger
+from utils.rate_limiter import INTERACTIVE, RateLimiter
+from utils.resilience import CircuitBreaker, RetryPolicy, acall_with_retry
+from utils.response_cache import ResponseCache, SQLiteResponseBackend
+from utils.single_flight import AsyncSingleFlight
+from utils.token_budget import TokenBudget
+
+logger = logging.getLogger(__name__)
+
+class AsyncAIAnalyzer(AIAnalyzer):
+    """AIAnalyzer variant built on AsyncOpenAI
+
+    Prompts are identical to AIAnalyzer; only the upstream call is awaited,
+    so one event loop can keep hundreds of analyses in flight.
+    """
+
+    def __init__(self, api_key: str, base_url: str = "https://api.deepseek.com", model: str = "deepseek-chat",
+                 cache: Optional[ResponseCache] = None, single_flight: Optional[AsyncSingleFlight] = None,
+                 budget: Optional[TokenBudget] = None, usage_log: Optional[str] = None,
+                 chunk_concurrency: int = CHUNK_CONCURRENCY, retry_policy: Optional[RetryPolicy] = None,
+                 breaker: Optional[CircuitBreaker] = None, hedger: Optional[Hedger] = None,
+                 http_client=None, limiter: Optional[RateLimiter] = None):
+        super().__init__(api_key, base_url, model, cache=cache, single_flight=single_flight,
+                         budget=budget, usage_log=usage_log, chunk_concurrency=chunk_concurrency,
+                         retry_policy=retry_policy, breaker=breaker, hedger=hedger, http_client=http_client,
+                         limiter=limiter)
+
+    def _make_client(self, api_key: str, base_url: str, http_client=None):
+        return AsyncOpenAI(api_key=api_key, base_url=base_url, max_retries=0, http_client=http_client)
+
+    async def warm_up(self, connections: int = 1) -> int:
+        """Async version of AIAnalyzer.warm_up"""
+        async def ping():
+            try:
+                await self.client.models.list(timeout=WARMUP_TIMEOUT)
+                return True
+            except Exception as e:
+                logger.warning(f"DeepSeek warm-up request failed: {e}")
+                return False
+
+        return sum(await asyncio.gather(*(ping() for _ in range(connections))))
+
+    async def _create(self, priority: str = INTERACTIVE, admitted: bool = False, **kwargs):
+        """Async version of AIAnalyzer._create"""
+        async def call():
+            nonlocal admitted
+            if self.limiter is not None and not admitted:
+                await self.limiter.aacquire(self._prompt_tokens(kwargs['messages']), priority)
+            admitted = False
+            return await self.client.chat.completions.create(timeout=self.retry_policy.timeout, **kwargs)
+
+        return await acall_with_retry(call, self.retry_policy, self.breaker)
+
+    async def analyze_medical_text(self, text: str, language: str = None,
+                                   lab_values: Optional[List[Dict[str, str]]] = None,
+                                   priority: str = INTERACTIVE, sections: Optional[Sequence[str]] = None) -> Dict:
+        """Async version of AIAnalyzer.analyze_medical_text"""
+        if not text.strip() and not lab_values:
+            return {"error": "No text provided"}
+
+        try:
+            language = self._output_language(text, language)
+            sections = self._output_sections(sections)
+            cache_key = self._cache_key(text, language, lab_values, sections)
+            cached = await self._cache_get(cache_key)
+            if cached is not None:
+                return cached
+
+            if self.single_flight is None:
+                return await self._analyze_upstream(cache_key, text, language, lab_values, priority, sections)
+
+            result, shared = await self.single_flight.do(
+                cache_key, lambda: self._analyze_upstream(cache_key, text, language, lab_values, priority, sections)
+            )
+            return dict(result, coalesced=True) if shared else result
+
+        except Exception as e:
+            logger.error(f"AI analysis failed: {e}")
+            return {
+                "success": False,
+                "error": f"AI analysis failed: {str(e)}"
+            }
+
+    async def _complete(self, messages: List[Dict[str, str]], max_tokens: int,
+                        priority: str = INTERACTIVE) -> Tuple[str, object]:
+        """Async version of AIAnalyzer._complete"""
+        if self.hedger is not None:
+            if self.limiter is not None:
+                await self.limiter.aacquire(self._prompt_tokens(messages), priority)
+            return await self.hedger.arun(
+                lambda attempt: self._collect_stream(messages, max_tokens, attempt, priority))
+        response = await self._create(
+            priority,
+            model=self.model,
+            messages=messages,
+            temperature=TEMPERATURE,
+            max_tokens=max_tokens
+        )
+        return response.choices[0].message.content, response.usage
+
+    async def _collect_stream(self, messages: List[Dict[str, str]], max_tokens: int,
+                              attempt: Attempt, priority: str = INTERACTIVE) -> Tuple[str, object]:
+        """Async version of AIAnalyzer._collect_stream (cancelled through the task)"""
+        stream = await self._create(
+            priority,
+            admitted=attempt.index == 0,
+            model=self.model,
+            messages=messages,
+            temperature=TEMPERATURE,
+            max_tokens=max_tokens,
+            stream=True,
+            extra_body={"stream_options": {"include_usage": True}}
+        )
+        parts = []
+        usage = None
+        try:
+            async for chunk in stream:
+                usage = getattr(chunk, 'usage', None) or usage
+                if chunk.choices and chunk.choices[0].delta.content:
+                    attempt.first_token()
+                    parts.append(chunk.choices[0].delta.content)
+        except asyncio.CancelledError:
+            self._record_discarded(attempt, usage, messages, parts)
+            raise
+        finally:
+            await stream.response.aclose()
+        return "".join(parts), usage
+
+    async def _cache_get(self, cache_key: str) -> Optional[Dict]:
+        """Async version of AIAnalyzer._cache_get; the SQLite backend is read in the default executor"""
+        if self.cache is not None and isinstance(self.cache.backend, SQLiteResponseBackend):
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(None, super()._cache_get, cache_key)
+        return super()._cache_get(cache_key)
+
+    async def _cache_set(self, cache_key: str, result: Dict):
+        """Async version of AIAnalyzer._cache_set; the SQLite backend is written in the default executor"""
+        if self.cache is not None and isinstance(self.cache.backend, SQLiteResponseBackend):
+            loop = asyncio.get_running_loop()
+            await loop.run_in_executor(None, super()._cache_set, cache_key, result)
+        else:
+            super()._cache_set(cache_key, result)
+
+    async def _record_usage(self, usage, messages: List[Dict[str, str]]) -> Dict[str, int]:
+        """Async version of AIAnalyzer._record_usage
+
+        Settling the limiter charge (file lock) and appending to the usage
+        log are file I/O, so they run in the default executor.
+        """
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, super()._record_usage, usage, messages)
+
+    async def _analyze_upstream(self, cache_key: str, text: str, language: str,
+                                lab_values: Optional[List[Dict[str, str]]], priority: str = INTERACTIVE,
+                                sections: Optional[Tuple[str, ...]] = None) -> Dict:
+        """Await DeepSeek (map calls first for long documents) and cache the result"""
+        chunks = self._plan_chunks(text, language, lab_values, sections)
+        map_usage = []
+        if chunks:
+            text, map_usage = await self._map_chunks(chunks, language, lab_values, priority, sections)
+
+        messages = self._build_messages(text, language, lab_values, sections)
+
+        analysis, usage = await self._complete(messages, self._max_tokens(language, sections), priority)
+
+        result = {
+            "success": True,
+            "analysis": analysis,
+            "language": language,
+            "sections": list(sections or SECTION_IDS),
+            "model": self.model,
+            "disclaimer": DISCLAIMER,
+            "cached": False,
+            "usage": sum_usage([await self._record_usage(usage, messages)] + map_usage)
+        }
+        if chunks:
+            result["chunks"] = len(chunks)
+        await self._cache_set(cache_key, result)
+        return result
+
+    async def _map_chunks(self, chunks: List[str], language: str, lab_values: Optional[List[Dict[str, str]]],
+                          priority: str = INTERACTIVE,
+                          sections: Optional[Tuple[str, ...]] = None) -> Tuple[str, List[Dict[str, int]]]:
+        """Async version of AIAnalyzer._map_chunks, at most chunk_concurrency calls at once"""
+        max_tokens = self._map_max_tokens(len(chunks), language, lab_values, sections)
+        semaphore = asyncio.Semaphore(self.chunk_concurrency)
+
+        async def map_chunk(chunk):
+            messages = self._map_messages(chunk)
+            async with semaphore:
+                content, usage = await self._complete(messages, max_tokens, priority)
+            return content, await self._record_usage(usage, messages)
+
+        outputs = await asyncio.gather(*(map_chunk(chunk) for chunk in chunks))
+        return self._join_findings([text for text, _ in outputs]), [usage for _, usage in outputs]
+
+    async def stream_medical_text(self, text: str, language: str = None,
+                                  lab_values: Optional[List[Dict[str, str]]] = None,
+                                  priority: str = INTERACTIVE,
+                                  sections: Optional[Sequence[str]] = None) -> AsyncIterator[Dict]:
+        """Async version of AIAnalyzer.stream_medical_text (same event dicts)"""
+        if not text.strip() and not lab_values:
+            yield {"type": "error", "error": "No text provided"}
+            return
+
+        parts = []
+        try:
+            language = self._output_language(text, language)
+            sections = self._output_sections(sections)
+            cache_key = self._cache_key(text, language, lab_values, sections)
+            cached = await self._cache_get(cache_key)
+            if cached is not None:
+                yield {"type": "delta", "content": cached["analysis"]}
+                yield dict(cached, type="done")
+                return
+
+            chunks = self._plan_chunks(text, language, lab_values, sections)
+            map_usage = []
+            if chunks:
+                yield {"type": "progress", "stage": "map", "chunks": len(chunks)}
+                text, map_usage = await self._map_chunks(chunks, language, lab_values, priority, sections)
+
+            messages = self._build_messages(text, language, lab_values, sections)
+
+            stream = await self._create(
+                priority,
+                model=self.model,
+                messages=messages,
+                temperature=TEMPERATURE,
+                max_tokens=self._max_tokens(language, sections),
+                stream=True,
+                extra_body={"stream_options": {"include_usage": True}}
+            )
+
+            usage = None
+            try:
+                async for chunk in stream:
+                    # The final chunk carries usage and no choices
+                    usage = getattr(chunk, 'usage', None) or usage
+                    if not chunk.choices:
+                        continue
+                    content = chunk.choices[0].delta.content
+                    if content:
+                        parts.append(content)
+                        yield {"type": "delta", "content": content}
+            finally:
+                # Also runs when the client disconnects and the generator is closed
+                await stream.response.aclose()
+
+            result = {
+                "success": True,
+                "analysis": "".join(parts),
+                "language": language,
+                "sections": list(sections or SECTION_IDS),
+                "model": self.model,
+                "disclaimer": DISCLAIMER,
+                "cached": False,
+                "usage": sum_usage([await self._record_usage(usage, messages)] + map_usage)
+            }
+            if chunks:
+                result["chunks"] = len(chunks)
+            await self._cache_set(cache_key, result)
+            yield dict(result, type="done")
+
+        except Exception as e:
+            logger.error(f"AI analysis stream failed: {e}")
+            yield {
+                "type": "error",
+                "success": False,
+                "error": f"AI analysis failed: {str(e)}"
+            }
@@ -1,87 +1,601 @@
 """
 Document parsing utilities for medical documents
 """
+import io
+import json
+import multiprocessing
 import os
+import re
+import tempfile
+import threading
+import zipfile
+import xml.etree.ElementTree as ET
+from concurrent.futures import ProcessPoolExecutor, as_completed
 import PyPDF2
-from docx import Document
 import pdfplumber
-from typing import Optional, Tuple
+from typing import BinaryIO, Dict, Iterator, List, Optional, Tuple, Union
 import logging
 
+from utils.extraction_cache import ExtractionCache, content_digest
+from utils.lab_tables import normalize_table
+from utils.script_stats import detect_language
+
 logger = logging.getLogger(__name__)
 
+# Bump whenever extraction output changes so cached text is not reused
+PARSER_VERSION = '5'
+
+# WordprocessingML tags used by the streaming DOCX extractor
+_W = '{http://schemas.openxmlformats.org/wordprocessingml/2006/main}'
+_W_P, _W_T, _W_TAB, _W_BR, _W_CR = _W + 'p', _W + 't', _W + 'tab', _W + 'br', _W + 'cr'
+_W_TBL, _W_TR, _W_TC, _W_BODY = _W + 'tbl', _W + 'tr', _W + 'tc', _W + 'body'
+
+# Table detection: only PDF pages whose content stream draws at least this
+# many rectangles/line segments are handed to pdfplumber's extract_tables
+MIN_RULING_OPS = 8
+_RULING_OPS = re.compile(rb'\d\s+(?:re|l)\s')
+
+# A file path, raw bytes, or a readable binary stream (e.g. a Flask upload)
+DocumentSource = Union[str, bytes, bytearray, memoryview, BinaryIO]
+
+# Per-page fallback thresholds: a PyPDF2 page scoring below MIN_PAGE_QUALITY
+# (or with fewer than MIN_PAGE_CHARS visible characters) is re-read with pdfplumber
+MIN_PAGE_QUALITY = 0.6
+MIN_PAGE_CHARS = 10
+
+# Unmapped glyphs that PyPDF2/pdfminer emit for fonts without a ToUnicode map
+_CID_PATTERN = re.compile(r'\(cid:\d+\)')
+
+# Parallel extraction: PDFs with fewer pages than this stay serial, and each
+# worker process is handed at most PARALLEL_CHUNK_PAGES pages at a time
+PARALLEL_MIN_PAGES = 40
+PARALLEL_CHUNK_PAGES = 20
+
+
+def text_quality(text: str) -> float:
+    """Score extracted page text from 0.0 (empty/garbage) to 1.0 (clean text)
+
+    The score is the share of visible characters that are letters, digits,
+    CJK or ordinary punctuation. Replacement characters, control characters
+    and "(cid:NN)" glyph placeholders count against it.
+    """
+    if not text:
+        return 0.0
+    
+    cid_chars = sum(len(m) for m in _CID_PATTERN.findall(text))
+    visible = 0
+    good = 0
+    for char in text:
+        if char.isspace():
+            continue
+        visible += 1
+        if char == '\ufffd' or not char.isprintable():
+            continue
+        if char.isalnum() or char in '.,:;%()[]<>=+-/*#&\'"~_!?':
+            good += 1
+        elif '\u3000' <= char <= '\u303f' or '\uff00' <= char <= '\uffef':
+            # CJK and full-width punctuation
+            good += 1
+    
+    if visible < MIN_PAGE_CHARS:
+        return 0.0
+    
+    # Characters inside "(cid:12)" are alphanumeric but meaningless
+    good = max(good - cid_chars, 0)
+    return good / visible
+
+
+def _extract_page_range(file_path: str, start: int, stop: int,
+                        min_page_quality: float) -> Tuple[List[str], Dict[str, int]]:
+    """Worker-process entry point: extract pages [start, stop) of a PDF"""
+    parser = DocumentParser(min_page_quality=min_page_quality)
+    pages = list(parser._iter_pdf_pages(file_path, start, stop))
+    return pages, parser.page_stats
+
+
+def _extract_document(source: bytes, filename: str, max_chars: Optional[int],
+                      min_page_quality: float) -> Tuple[Optional[str], Optional[str], Dict[str, int]]:
+    """Worker-process entry point: extract one whole in-memory document"""
+    parser = DocumentParser(min_page_quality=min_page_quality)
+    text, error = parser.extract_text(source, max_chars=max_chars, filename=filename)
+    return text, error, parser.page_stats
+
 class DocumentParser:
     """Parse medical documents (PDF/DOCX)"""
     
-    def __init__(self):
+    def __init__(self, min_page_quality: float = MIN_PAGE_QUALITY, parallel_workers: int = 0,
+                 parallel_min_pages: int = PARALLEL_MIN_PAGES, cache: Optional[ExtractionCache] = None,
+                 batch_workers: int = 0):
         self.supported_extensions = {'.pdf', '.docx', '.doc'}
-    
-    def extract_text(self, file_path: str) -> Tuple[Optional[str], Optional[str]]:
-        """Extract text from document"""
-        if not os.path.exists(file_path):
-            return None, "File not found"
+        self.min_page_quality = min_page_quality
+        self.cache = cache
         
-        file_ext = os.path.splitext(file_path)[1].lower()
+        # parallel_workers > 1 enables process-pool extraction for large PDFs
+        self.parallel_workers = parallel_workers
+        self.parallel_min_pages = parallel_min_pages
+        # batch_workers > 1 parses the documents of extract_many in the same pool
+        self.batch_workers = batch_workers
+        self._pool = None
+        self._pool_lock = threading.Lock()
+        
+        # Which backend produced each PDF page, for tuning min_page_quality
+        self._stats_lock = threading.Lock()
+        self.page_stats = {'pages': 0, 'pypdf2': 0, 'pdfplumber': 0, 'empty': 0}
+    
+    def extract_text(self, source: DocumentSource, max_chars: Optional[int] = None,
+                     filename: Optional[str] = None) -> Tuple[Optional[str], Optional[str]]:
+        """Extract text from document
+
+        source may be a file path, bytes or a binary stream; in-memory sources
+        need a filename so the document type is known. If max_chars is given,
+        parsing stops as soon as that many characters have been collected and
+        the result is cut to the budget.
+        """
+        file_ext, error = self._check_source(source, filename)
+        if error:
+            return None, error
         
         try:
+            source = self._load_source(source)
+            
+            cache_key = None
+            if self.cache is not None:
+                cache_key = ExtractionCache.make_key(content_digest(source), PARSER_VERSION, max_chars)
+                cached = self.cache.get(cache_key)
+                if cached is not None:
+                    return cached, None
+            
+            pages = []
+            collected = 0
+            for page_text in self.iter_pages(source, filename=filename):
+                pages.append(page_text)
+                collected += len(page_text) + 1
+                if max_chars is not None and collected >= max_chars:
+                    break
+            
             if file_ext == '.pdf':
-                return self._extract_from_pdf(file_path), None
-            elif file_ext in ['.docx', '.doc']:
-                return self._extract_from_docx(file_path), None
+                # Form feeds mark every PDF page boundary, empty pages included:
+                # used for header/footer detection and by extract_tables
+                text = "\f".join(pages).strip(' \t\r\n') if any(pages) else ""
             else:
-                return None, f"Unsupported file type: {file_ext}"
+                text = "\n".join(pages).strip()
+            if max_chars is not None:
+                text = text[:max_chars]
+            
+            if cache_key is not None and text:
+                self.cache.put(cache_key, text)
+            return text, None
                 
         except Exception as e:
             logger.error(f"Error extracting text: {e}")
             return None, str(e)
     
-    def _extract_from_pdf(self, file_path: str) -> str:
-        """Extract text from PDF"""
-        text = ""
+    def extract_many(self, documents: List[Tuple[bytes, str]],
+                     max_chars: Optional[int] = None) -> Iterator[Tuple[int, Optional[str], Optional[str]]]:
+        """Extract several in-memory (bytes, filename) documents
+
+        Yields (index, text, error) for each document as soon as it is done,
+        i.e. in completion order. Cache hits and bad sources come back
+        first; with batch_workers > 1 the rest are parsed in the process
+        pool, otherwise one after another.
+        """
+        pending = []
+        for index, (source, filename) in enumerate(documents):
+            _, error = self._check_source(source, filename)
+            if error:
+                yield index, None, error
+                continue
+            if self.cache is not None:
+                cached = self.cache.get(ExtractionCache.make_key(content_digest(source), PARSER_VERSION, max_chars))
+                if cached is not None:
+                    yield index, cached, None
+                    continue
+            pending.append(index)
+        
+        if self.batch_workers <= 1:
+            for index in pending:
+                source, filename = documents[index]
+                text, error = self.extract_text(source, max_chars=max_chars, filename=filename)
+                yield index, text, error
+            return
         
+        pool = self._get_pool()
+        futures = {
+            pool.submit(_extract_document, documents[index][0], documents[index][1], max_chars,
+                        self.min_page_quality): index
+            for index in pending
+        }
         try:
-            with open(file_path, 'rb') as file:
-                reader = PyPDF2.PdfReader(file)
-                for page in reader.pages:
-                    text += page.extract_text() + "\n"
+            for future in as_completed(futures):
+                index = futures[future]
+                try:
+                    text, error, stats = future.result()
+                except Exception as e:
+                    logger.error(f"Error extracting text: {e}")
+                    yield index, None, str(e)
+                    continue
+                with self._stats_lock:
+                    for key, value in stats.items():
+                        self.page_stats[key] += value
+                if self.cache is not None and text:
+                    source = documents[index][0]
+                    self.cache.put(ExtractionCache.make_key(content_digest(source), PARSER_VERSION, max_chars), text)
+                yield index, text, error
+        finally:
+            # Caller gave up: don't parse documents nobody will read
+            for future in futures:
+                future.cancel()
+    
+    def iter_pages(self, source: DocumentSource, filename: Optional[str] = None) -> Iterator[str]:
+        """Yield document text page by page (DOCX is yielded paragraph by paragraph)
+
+        PDF pages without text are yielded as "", so every physical page
+        has its place.
+        """
+        source = self._load_source(source)
+        name = filename or (source if isinstance(source, str) else '')
+        file_ext = os.path.splitext(name)[1].lower()
+        
+        if file_ext == '.pdf':
+            if self.parallel_workers > 1:
+                yield from self._iter_pdf_pages_parallel(source)
+            else:
+                yield from self._iter_pdf_pages(source)
+        elif file_ext in ['.docx', '.doc']:
+            yield from self._iter_docx_lines(source)
+        else:
+            raise ValueError(f"Unsupported file type: {file_ext}")
+    
+    def extract_tables(self, source: DocumentSource, filename: Optional[str] = None,
+                       max_pages: Optional[int] = None,
+                       max_chars: Optional[int] = None) -> Tuple[Optional[List[Dict[str, str]]], Optional[str]]:
+        """Extract lab result rows {test, value, unit, range, flag} from document tables
+
+        PDF pages are pre-screened for ruling lines in their content stream,
+        so pdfplumber's table finder only runs on pages that draw a grid.
+        With max_chars, only the PDF pages that extract_text reads within
+        the same budget are searched. Rows are cached next to the text.
+        """
+        file_ext, error = self._check_source(source, filename)
+        if error:
+            return None, error
+        
+        try:
+            source = self._load_source(source)
+            if file_ext == '.pdf' and max_chars is not None:
+                text, error = self.extract_text(source, max_chars=max_chars, filename=filename)
+                if error:
+                    return None, error
+                if len(text) >= max_chars:
+                    # Budget met: pages past the last one in the text were never read
+                    # (empty pages are in the text as consecutive form feeds)
+                    pages = text.count('\f') + 1
+                    max_pages = pages if max_pages is None else min(max_pages, pages)
+            
+            cache_key = None
+            if self.cache is not None:
+                cache_key = ExtractionCache.make_key(content_digest(source), PARSER_VERSION, max_pages, kind='tables')
+                cached = self.cache.get(cache_key)
+                if cached is not None:
+                    return json.loads(cached), None
+            
+            if file_ext == '.pdf':
+                rows = self._extract_pdf_tables(source, max_pages)
+            else:
+                rows = self._extract_docx_tables(source)
+            
+            if cache_key is not None:
+                self.cache.put(cache_key, json.dumps(rows, ensure_ascii=False))
+            return rows, None
+        except Exception as e:
+            logger.error(f"Error extracting tables: {e}")
+            return None, str(e)
+    
+    def _check_source(self, source: DocumentSource, filename: Optional[str]) -> Tuple[Optional[str], Optional[str]]:
+        """Return (file extension, error) for a document source"""
+        if isinstance(source, str):
+            if not os.path.exists(source):
+                return None, "File not found"
+            filename = filename or source
+        elif not filename:
+            return None, "Filename required to parse an in-memory document"
+        
+        file_ext = os.path.splitext(filename)[1].lower()
+        if file_ext not in self.supported_extensions:
+            return None, f"Unsupported file type: {file_ext}"
+        return file_ext, None
+    
+    @staticmethod
+    def _load_source(source: DocumentSource) -> Union[str, bytes]:
+        """Normalize a source to a path or bytes; streams are read into memory"""
+        if isinstance(source, (str, bytes)):
+            return source
+        if isinstance(source, (bytearray, memoryview)):
+            return bytes(source)
+        if hasattr(source, 'seek'):
+            source.seek(0)
+        return source.read()
+    
+    @staticmethod
+    def _as_file(source: Union[str, bytes]) -> Union[str, BinaryIO]:
+        """Path or bytes -> something PyPDF2, pdfplumber and zipfile can open"""
+        return io.BytesIO(source) if isinstance(source, bytes) else source
+    
+    def _iter_pdf_pages(self, source: Union[str, bytes], start: int = 0, stop: Optional[int] = None) -> Iterator[str]:
+        """Yield PDF page text lazily, choosing the extraction backend per page
+
+        PyPDF2 is fast and is tried first. Only pages whose PyPDF2 text scores
+        below min_page_quality are re-read with pdfplumber. start/stop limit
+        extraction to a page range. Pages without text are yielded as "".
+        """
+        plumber = None
+        try:
+            with (open(source, 'rb') if isinstance(source, str) else io.BytesIO(source)) as file:
+                try:
+                    reader = PyPDF2.PdfReader(file)
+                    page_count = len(reader.pages)
+                except Exception as e:
+                    logger.warning(f"PyPDF2 failed: {e}")
+                    reader = None
+                    plumber = pdfplumber.open(self._as_file(source))
+                    page_count = len(plumber.pages)
+                
+                if stop is None or stop > page_count:
+                    stop = page_count
+                
+                for index in range(start, stop):
+                    page_text = ""
+                    quality = 0.0
+                    backend = 'pypdf2'
+                    
+                    if reader is not None:
+                        try:
+                            page_text = reader.pages[index].extract_text() or ""
+                        except Exception as e:
+                            logger.warning(f"PyPDF2 failed on page {index + 1}: {e}")
+                        quality = text_quality(page_text)
+                    
+                    if quality < self.min_page_quality:
+                        if plumber is None:
+                            plumber = pdfplumber.open(self._as_file(source))
+                        try:
+                            fallback_text = plumber.pages[index].extract_text() or ""
+                        except Exception as e:
+                            logger.error(f"pdfplumber failed on page {index + 1}: {e}")
+                            fallback_text = ""
+                        fallback_quality = text_quality(fallback_text)
+                        logger.debug(f"Page {index + 1}: PyPDF2 quality {quality:.2f}, "
+                                     f"pdfplumber quality {fallback_quality:.2f}")
+                        if fallback_quality > quality or not page_text.strip():
+                            page_text = fallback_text
+                            backend = 'pdfplumber'
+                    
+                    if not page_text.strip():
+                        backend = 'empty'
+                    self._record_page(backend)
+                    
+                    yield page_text if page_text.strip() else ""
+        finally:
+            if plumber is not None:
+                plumber.close()
+    
+    def _iter_pdf_pages_parallel(self, source: Union[str, bytes]) -> Iterator[str]:
+        """Yield PDF page text in page order, extracting page ranges in worker processes
+
+        Worker processes re-open the document by path, so an in-memory PDF
+        with enough pages to go parallel is first written to a temp file.
+        """
+        try:
+            with (open(source, 'rb') if isinstance(source, str) else io.BytesIO(source)) as file:
+                page_count = len(PyPDF2.PdfReader(file).pages)
         except Exception as e:
-            logger.warning(f"PyPDF2 failed: {e}")
-            text = ""
+            logger.warning(f"PyPDF2 could not count pages, extracting serially: {e}")
+            page_count = 0
+        
+        if page_count < self.parallel_min_pages:
+            yield from self._iter_pdf_pages(source)
+            return
+        
+        if isinstance(source, str):
+            yield from self._iter_page_ranges(source, page_count)
+            return
         
-        if not text.strip():
-            try:
-                with pdfplumber.open(file_path) as pdf:
-                    for page in pdf.pages:
-                        page_text = page.extract_text()
-                        if page_text:
-                            text += page_text + "\n"
-            except Exception as e:
-                logger.error(f"pdfplumber failed: {e}")
+        with tempfile.NamedTemporaryFile(delete=False, suffix='.pdf') as tmp:
+            tmp.write(source)
+        try:
+            yield from self._iter_page_ranges(tmp.name, page_count)
+        finally:
+            os.unlink(tmp.name)
+    
+    def _iter_page_ranges(self, file_path: str, page_count: int) -> Iterator[str]:
+        """Fan page ranges of a PDF file out to the process pool, yielding pages in order"""
+        chunk = min(PARALLEL_CHUNK_PAGES, -(-page_count // self.parallel_workers))
+        pool = self._get_pool()
+        futures = [
+            pool.submit(_extract_page_range, file_path, start, min(start + chunk, page_count),
+                        self.min_page_quality)
+            for start in range(0, page_count, chunk)
+        ]
         
-        return text.strip()
+        try:
+            for future in futures:
+                pages, stats = future.result()
+                with self._stats_lock:
+                    for key, value in stats.items():
+                        self.page_stats[key] += value
+                yield from pages
+        finally:
+            # Budget met or caller gave up: don't parse pages nobody will read
+            for future in futures:
+                future.cancel()
+    
+    def _get_pool(self) -> ProcessPoolExecutor:
+        """Create the extraction process pool on first use (i.e. after a gunicorn fork)
+
+        Workers are started by a fork server (spawned where there is none),
+        never forked from this process: gthread workers have other threads
+        that may hold locks at the moment of a fork.
+        """
+        with self._pool_lock:
+            if self._pool is None:
+                method = 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+                self._pool = ProcessPoolExecutor(max_workers=max(self.parallel_workers, self.batch_workers),
+                                                 mp_context=multiprocessing.get_context(method))
+            return self._pool
+    
+    def shutdown(self):
+        """Stop the extraction process pool, if one was started"""
+        with self._pool_lock:
+            if self._pool is not None:
+                self._pool.shutdown(cancel_futures=True)
+                self._pool = None
+    
+    def _record_page(self, backend: str):
+        """Count which backend produced a page"""
+        with self._stats_lock:
+            self.page_stats['pages'] += 1
+            self.page_stats[backend] += 1
     
-    def _extract_from_docx(self, file_path: str) -> str:
+    def get_page_stats(self) -> Dict[str, float]:
+        """Page backend counters plus the pdfplumber fallback rate"""
+        with self._stats_lock:
+            stats = dict(self.page_stats)
+        stats['fallback_rate'] = stats['pdfplumber'] / stats['pages'] if stats['pages'] else 0.0
+        return stats
+    
+    def _extract_from_pdf(self, source: Union[str, bytes]) -> str:
+        """Extract text from PDF"""
+        return "\f".join(page for page in self._iter_pdf_pages(source) if page).strip()
+    
+    def _extract_from_docx(self, source: Union[str, bytes]) -> str:
         """Extract text from Word document"""
         try:
-            doc = Document(file_path)
-            text = ""
-            for paragraph in doc.paragraphs:
-                text += paragraph.text + "\n"
-            return text.strip()
+            return "\n".join(self._iter_docx_lines(source)).strip()
         except Exception as e:
             logger.error(f"Error reading DOCX: {e}")
             return ""
     
-    def detect_language(self, text: str) -> str:
-        """Simple language detection: 'zh' or 'en'"""
-        if not text:
-            return 'en'
-        
-        # Count Chinese characters
-        chinese_chars = sum(1 for char in text if '\u4e00' <= char <= '\u9fff')
-        total_chars = len(text)
+    def _iter_docx_lines(self, source: Union[str, bytes]) -> Iterator[str]:
+        """Stream paragraphs and table rows (cells joined with " | ") in document order"""
+        for table, cells in self._iter_docx_blocks(source):
+            yield cells[0] if table is None else ' | '.join(cells)
+    
+    def _extract_docx_tables(self, source: Union[str, bytes]) -> List[Dict[str, str]]:
+        """Normalize every top-level DOCX table into lab result rows"""
+        rows = []
+        current_table = None
+        current_rows = []
+        for table, cells in self._iter_docx_blocks(source):
+            if table is None:
+                continue
+            if table != current_table:
+                rows.extend(normalize_table(current_rows))
+                current_table, current_rows = table, []
+            current_rows.append(cells)
+        rows.extend(normalize_table(current_rows))
+        return rows
+    
+    def _iter_docx_blocks(self, source: Union[str, bytes]) -> Iterator[Tuple[Optional[int], List[str]]]:
+        """Stream blocks from word/document.xml in document order
+
+        Yields (None, [paragraph text]) for body paragraphs and
+        (table number, cell texts) for top-level table rows. The XML is read
+        with iterparse and every finished paragraph or row is cleared, so
+        memory stays bounded and embedded images are never loaded.
+        """
+        with zipfile.ZipFile(self._as_file(source)) as archive:
+            with archive.open('word/document.xml') as xml_file:
+                body = None
+                table_count = 0
+                paragraphs = []  # run text of each open <w:p> (text boxes nest them)
+                cells = []       # paragraph texts of each open <w:tc>
+                rows = []        # cell texts of each open <w:tr>
+                
+                for event, elem in ET.iterparse(xml_file, events=('start', 'end')):
+                    tag = elem.tag
+                    
+                    if event == 'start':
+                        if tag == _W_P:
+                            paragraphs.append([])
+                        elif tag == _W_TC:
+                            cells.append([])
+                        elif tag == _W_TR:
+                            rows.append([])
+                        elif tag == _W_TBL and not cells:
+                            table_count += 1
+                        elif tag == _W_BODY:
+                            body = elem
+                        continue
+                    
+                    if tag == _W_T:
+                        if paragraphs and elem.text:
+                            paragraphs[-1].append(elem.text)
+                    elif tag == _W_TAB:
+                        if paragraphs:
+                            paragraphs[-1].append('\t')
+                    elif tag in (_W_BR, _W_CR):
+                        if paragraphs:
+                            paragraphs[-1].append('\n')
+                    elif tag == _W_P:
+                        line = ''.join(paragraphs.pop())
+                        if cells:
+                            cells[-1].append(line)
+                        elif line.strip():
+                            yield None, [line]
+                        elem.clear()
+                    elif tag == _W_TC:
+                        cell_text = ' '.join(p.strip() for p in cells.pop() if p.strip())
+                        if rows:
+                            rows[-1].append(cell_text)
+                    elif tag == _W_TR:
+                        row_cells = rows.pop()
+                        if cells:
+                            # Nested table: flatten into the enclosing cell
+                            cells[-1].append(' | '.join(row_cells))
+                        elif any(row_cells):
+                            yield table_count, row_cells
+                        elem.clear()
+                    
+                    # Drop finished top-level blocks so the tree never grows
+                    if body is not None and tag != _W_BODY and len(body) and body[0] is elem:
+                        body.remove(elem)
+    
+    def _extract_pdf_tables(self, source: Union[str, bytes], max_pages: Optional[int] = None) -> List[Dict[str, str]]:
+        """Run pdfplumber's table finder on PDF pages that draw ruling lines"""
+        try:
+            with (open(source, 'rb') if isinstance(source, str) else io.BytesIO(source)) as file:
+                reader = PyPDF2.PdfReader(file)
+                page_count = len(reader.pages)
+                if max_pages is not None:
+                    page_count = min(page_count, max_pages)
+                candidates = [index for index in range(page_count) if self._has_ruling_lines(reader.pages[index])]
+        except Exception as e:
+            logger.warning(f"PyPDF2 table pre-screen failed, checking every page: {e}")
+            candidates = None
         
-        if total_chars > 0 and (chinese_chars / total_chars) > 0.2:
-            return 'zh'
+        rows = []
+        if candidates == []:
+            return rows
         
-        return 'en'
\ No newline at end of file
+        with pdfplumber.open(self._as_file(source)) as pdf:
+            if candidates is None:
+                candidates = range(min(len(pdf.pages), max_pages or len(pdf.pages)))
+            for index in candidates:
+                for table in pdf.pages[index].extract_tables():
+                    rows.extend(normalize_table(table))
+        return rows
+    
+    @staticmethod
+    def _has_ruling_lines(page) -> bool:
+        """Cheap check of a PyPDF2 page's content stream for rectangle/line drawing"""
+        try:
+            contents = page.get_contents()
+            if contents is None:
+                return False
+            return len(_RULING_OPS.findall(contents.get_data())) >= MIN_RULING_OPS
+        except Exception:
+            return False
+    
+    def detect_language(self, text: str) -> str:
+        """Simple language detection: 'zh' or 'en'"""
+        return detect_language(text)
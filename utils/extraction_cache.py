@@ -0,0 +1,168 @@
+"""
+Content-addressed cache for extracted document text
+"""
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Optional, Union
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+def file_digest(file_path: str, chunk_size: int = 1024 * 1024) -> str:
+    """SHA-256 of a file's bytes, read in chunks"""
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as file:
+        for chunk in iter(lambda: file.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def content_digest(source: Union[str, bytes]) -> str:
+    """SHA-256 of a document given as a file path or as bytes"""
+    if isinstance(source, bytes):
+        return hashlib.sha256(source).hexdigest()
+    return file_digest(source)
+
+
+class ExtractionCache:
+    """Two-tier (memory LRU + optional SQLite) cache of extracted text
+
+    Entries are keyed by the SHA-256 of the uploaded bytes plus the parser
+    version and extraction options, so a parser change never serves stale text.
+    The SQLite tier drops entries older than ttl_seconds and keeps at most
+    disk_max_entries, evicting the least recently used.
+    """
+
+    def __init__(self, max_entries: int = 256, db_path: Optional[str] = None,
+                 disk_max_entries: int = 10000, ttl_seconds: int = 30 * 24 * 3600):
+        self.max_entries = max_entries
+        self.db_path = db_path
+        self.disk_max_entries = disk_max_entries
+        self.ttl_seconds = ttl_seconds
+
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._conn = None
+        self._conn_pid = None
+        self.stats = {'memory_hits': 0, 'disk_hits': 0, 'misses': 0, 'stores': 0}
+
+        if db_path:
+            directory = os.path.dirname(db_path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+
+    @staticmethod
+    def make_key(content_hash: str, parser_version: str, max_chars: Optional[int] = None, kind: str = 'text') -> str:
+        """Build the cache key for one document and extraction setting
+
+        kind separates other extraction results (e.g. 'tables', stored as
+        JSON) from the document text.
+        """
+        key = f"{content_hash}:{parser_version}:{max_chars if max_chars is not None else 'all'}"
+        return key if kind == 'text' else f"{key}:{kind}"
+
+    def get(self, key: str) -> Optional[str]:
+        """Return cached text, promoting disk hits into memory"""
+        with self._lock:
+            text = self._memory.get(key)
+            if text is not None:
+                self._memory.move_to_end(key)
+                self.stats['memory_hits'] += 1
+                return text
+
+            text = self._disk_get(key)
+            if text is not None:
+                self._memory_put(key, text)
+                self.stats['disk_hits'] += 1
+                return text
+
+            self.stats['misses'] += 1
+            return None
+
+    def put(self, key: str, text: str):
+        """Store extracted text in both tiers"""
+        with self._lock:
+            self._memory_put(key, text)
+            self._disk_put(key, text)
+            self.stats['stores'] += 1
+
+    def get_stats(self) -> Dict[str, float]:
+        """Hit/miss counters plus current size, for sizing the cache"""
+        with self._lock:
+            stats = dict(self.stats)
+            stats['memory_entries'] = len(self._memory)
+        lookups = stats['memory_hits'] + stats['disk_hits'] + stats['misses']
+        stats['hit_rate'] = (stats['memory_hits'] + stats['disk_hits']) / lookups if lookups else 0.0
+        stats['disk_enabled'] = bool(self.db_path)
+        return stats
+
+    def _memory_put(self, key: str, text: str):
+        self._memory[key] = text
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+
+    def _connection(self) -> sqlite3.Connection:
+        """One SQLite connection per process (connections must not cross a fork)"""
+        if self._conn is None or self._conn_pid != os.getpid():
+            self._conn = sqlite3.connect(self.db_path, check_same_thread=False, timeout=5)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS extracted_text ("
+                "key TEXT PRIMARY KEY, text TEXT NOT NULL, created_at REAL NOT NULL, accessed_at REAL)"
+            )
+            columns = {row[1] for row in self._conn.execute("PRAGMA table_info(extracted_text)")}
+            if 'accessed_at' not in columns:  # cache created before disk eviction
+                self._conn.execute("ALTER TABLE extracted_text ADD COLUMN accessed_at REAL")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS extracted_text_accessed ON extracted_text (accessed_at)")
+            self._conn.commit()
+            self._conn_pid = os.getpid()
+        return self._conn
+
+    def _disk_get(self, key: str) -> Optional[str]:
+        if not self.db_path:
+            return None
+        try:
+            conn = self._connection()
+            row = conn.execute(
+                "SELECT text, created_at FROM extracted_text WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            now = time.time()
+            if row[1] < now - self.ttl_seconds:
+                conn.execute("DELETE FROM extracted_text WHERE key = ?", (key,))
+                conn.commit()
+                return None
+            conn.execute("UPDATE extracted_text SET accessed_at = ? WHERE key = ?", (now, key))
+            conn.commit()
+            return row[0]
+        except sqlite3.Error as e:
+            logger.warning(f"Extraction cache read failed: {e}")
+            return None
+
+    def _disk_put(self, key: str, text: str):
+        if not self.db_path:
+            return
+        try:
+            conn = self._connection()
+            now = time.time()
+            conn.execute(
+                "INSERT OR REPLACE INTO extracted_text (key, text, created_at, accessed_at) VALUES (?, ?, ?, ?)",
+                (key, text, now, now)
+            )
+            # Expire, then evict least recently used rows beyond the size bound
+            conn.execute("DELETE FROM extracted_text WHERE created_at < ?", (now - self.ttl_seconds,))
+            conn.execute(
+                "DELETE FROM extracted_text WHERE key IN ("
+                "SELECT key FROM extracted_text ORDER BY accessed_at DESC LIMIT -1 OFFSET ?)",
+                (self.disk_max_entries,)
+            )
+            conn.commit()
+        except sqlite3.Error as e:
+            logger.warning(f"Extraction cache write failed: {e}")
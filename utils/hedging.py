@@ -0,0 +1,185 @@
+"""
+Hedged requests: a second identical upstream call when the first is slow to respond
+"""
+import asyncio
+import queue
+import threading
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable, Dict
+import logging
+
+logger = logging.getLogger(__name__)
+
+HEDGE_PERCENTILE = 95
+HEDGE_INITIAL_DELAY = 8.0   # seconds, until enough latencies are recorded
+HEDGE_MIN_DELAY = 1.0
+LATENCY_WINDOW = 200
+MIN_SAMPLES = 20
+
+
+class Attempt:
+    """Signals shared between the hedger and one attempt
+
+    The attempt calls first_token() when the first output arrives, hands
+    its in-flight response to track(), and should stop once cancelled is
+    set. cancel() sets cancelled and closes the tracked response, which
+    unblocks an attempt waiting on the stream. index is 0 for the primary
+    attempt and 1 for the hedge.
+    """
+
+    def __init__(self, hedger: 'Hedger', responded, cancelled=None, index: int = 0):
+        self.hedger = hedger
+        self.index = index
+        self.started = time.monotonic()
+        self.responded = responded
+        self.cancelled = cancelled
+        self._first = False
+        self._response = None
+        self._lock = threading.Lock()
+
+    def track(self, response):
+        """Remember the in-flight response; closed at once if already cancelled"""
+        with self._lock:
+            self._response = response
+            if not self.cancelled.is_set():
+                return
+        response.close()
+
+    def cancel(self):
+        with self._lock:
+            self.cancelled.set()
+            response = self._response
+        if response is not None:
+            try:
+                response.close()
+            except Exception as e:
+                logger.debug(f"Closing a cancelled attempt failed: {e}")
+
+    def first_token(self):
+        if not self._first:
+            self._first = True
+            self.hedger.record_latency(time.monotonic() - self.started)
+            self.responded.set()
+
+
+class Hedger:
+    """Issue a backup request when no first token arrives within the pXX latency
+
+    The delay is the configured percentile of recent time-to-first-token
+    measurements (HEDGE_INITIAL_DELAY until MIN_SAMPLES are recorded), so
+    about (100 - percentile)% of calls are hedged. Whichever attempt
+    finishes first wins and the other is cancelled. Attempts report the
+    tokens billed for output that was thrown away through record_discarded().
+    """
+
+    def __init__(self, percentile: float = HEDGE_PERCENTILE, initial_delay: float = HEDGE_INITIAL_DELAY,
+                 min_delay: float = HEDGE_MIN_DELAY, window: int = LATENCY_WINDOW):
+        self.percentile = percentile
+        self.initial_delay = initial_delay
+        self.min_delay = min_delay
+        self._latencies = deque(maxlen=window)
+        self._lock = threading.Lock()
+        self.stats = {'calls': 0, 'hedged': 0, 'hedge_wins': 0, 'primary_wins': 0,
+                      'discarded_prompt_tokens': 0, 'discarded_completion_tokens': 0}
+
+    def record_latency(self, seconds: float):
+        with self._lock:
+            self._latencies.append(seconds)
+
+    def record_discarded(self, prompt_tokens: int, completion_tokens: int):
+        """Add the usage of a cancelled attempt (the losing one), which is billed but never used"""
+        with self._lock:
+            self.stats['discarded_prompt_tokens'] += prompt_tokens
+            self.stats['discarded_completion_tokens'] += completion_tokens
+
+    def delay(self) -> float:
+        """Current hedge delay in seconds"""
+        with self._lock:
+            if len(self._latencies) < MIN_SAMPLES:
+                return self.initial_delay
+            ordered = sorted(self._latencies)
+        index = min(int(len(ordered) * self.percentile / 100), len(ordered) - 1)
+        return max(ordered[index], self.min_delay)
+
+    def _count(self, *names: str):
+        with self._lock:
+            for name in names:
+                self.stats[name] += 1
+
+    def run(self, attempt: Callable[[Attempt], Any]) -> Any:
+        """Run attempt(Attempt) in threads, hedging once; returns the first success"""
+        self._count('calls')
+        results = queue.Queue()
+        attempts = []
+
+        def launch():
+            index = len(attempts)
+            state = Attempt(self, threading.Event(), threading.Event(), index)
+            attempts.append(state)
+
+            def target():
+                try:
+                    results.put((index, attempt(state), None))
+                except Exception as e:
+                    results.put((index, None, e))
+                finally:
+                    state.responded.set()
+
+            threading.Thread(target=target, name=f'hedge-{index}', daemon=True).start()
+
+        launch()
+        if not attempts[0].responded.wait(self.delay()):
+            self._count('hedged')
+            launch()
+
+        error = None
+        for _ in attempts:
+            index, value, error = results.get()
+            if error is None:
+                for other_index, other in enumerate(attempts):
+                    if other_index != index:
+                        other.cancel()
+                if len(attempts) > 1:
+                    self._count('hedge_wins' if index else 'primary_wins')
+                return value
+        raise error
+
+    async def arun(self, attempt: Callable[[Attempt], Awaitable[Any]]) -> Any:
+        """Async version of run: attempts are tasks and the loser is cancelled"""
+        self._count('calls')
+        states = [Attempt(self, asyncio.Event())]
+        tasks = [asyncio.ensure_future(attempt(states[0]))]
+        try:
+            responded = asyncio.ensure_future(states[0].responded.wait())
+            await asyncio.wait([responded, tasks[0]], timeout=self.delay(), return_when=asyncio.FIRST_COMPLETED)
+            responded.cancel()
+            if not states[0].responded.is_set() and not tasks[0].done():
+                self._count('hedged')
+                states.append(Attempt(self, asyncio.Event(), index=1))
+                tasks.append(asyncio.ensure_future(attempt(states[1])))
+
+            pending = set(tasks)
+            error = None
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if len(tasks) > 1:
+                            self._count('hedge_wins' if task is tasks[1] else 'primary_wins')
+                        return task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+
+    def get_stats(self) -> Dict[str, float]:
+        with self._lock:
+            stats = dict(self.stats)
+            samples = len(self._latencies)
+        stats['hedge_rate'] = stats['hedged'] / stats['calls'] if stats['calls'] else 0.0
+        stats['delay_seconds'] = round(self.delay(), 3)
+        stats['latency_samples'] = samples
+        return stats
@@ -0,0 +1,48 @@
+"""
+Tuned, shareable HTTP connection pools for the DeepSeek (OpenAI-compatible) clients
+"""
+import importlib.util
+
+import httpx
+import logging
+
+logger = logging.getLogger(__name__)
+
+MAX_CONNECTIONS = 20
+MAX_KEEPALIVE_CONNECTIONS = 10
+KEEPALIVE_SECONDS = 60.0
+
+
+def http2_available() -> bool:
+    """HTTP/2 needs the optional h2 package (pip install h2)"""
+    return importlib.util.find_spec('h2') is not None
+
+
+def _pool_settings(max_connections: int, max_keepalive: int, keepalive_seconds: float, http2: bool):
+    if http2 and not http2_available():
+        logger.info("h2 not installed; DeepSeek connections use HTTP/1.1")
+        http2 = False
+    limits = httpx.Limits(
+        max_connections=max_connections,
+        max_keepalive_connections=max_keepalive,
+        keepalive_expiry=keepalive_seconds
+    )
+    return limits, http2
+
+
+def create_http_client(max_connections: int = MAX_CONNECTIONS, max_keepalive: int = MAX_KEEPALIVE_CONNECTIONS,
+                       keepalive_seconds: float = KEEPALIVE_SECONDS, http2: bool = True) -> httpx.Client:
+    """httpx.Client for OpenAI(http_client=...), shared by every thread of a worker
+
+    Create it after the fork (or leave it unused until then): pooled
+    connections must not be shared between processes.
+    """
+    limits, http2 = _pool_settings(max_connections, max_keepalive, keepalive_seconds, http2)
+    return httpx.Client(limits=limits, http2=http2)
+
+
+def create_async_http_client(max_connections: int = MAX_CONNECTIONS, max_keepalive: int = MAX_KEEPALIVE_CONNECTIONS,
+                             keepalive_seconds: float = KEEPALIVE_SECONDS, http2: bool = True) -> httpx.AsyncClient:
+    """httpx.AsyncClient for AsyncOpenAI(http_client=...)"""
+    limits, http2 = _pool_settings(max_connections, max_keepalive, keepalive_seconds, http2)
+    return httpx.AsyncClient(limits=limits, http2=http2)
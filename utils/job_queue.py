@@ -0,0 +1,212 @@
+"""
+Durable analysis job queue in SQLite (WAL), shared by the web app and job workers
+"""
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from datetime import datetime
+from typing import Dict, Optional
+import logging
+
+logger = logging.getLogger(__name__)
+
+# A running job whose worker has not finished it within the lease (crash,
+# deploy, OOM kill) is handed to another worker
+LEASE_SECONDS = 600
+MAX_ATTEMPTS = 3
+
+# A failed job is retried after RETRY_BASE_SECONDS, doubling per attempt
+RETRY_BASE_SECONDS = 30
+RETRY_MAX_SECONDS = 900
+
+
+def _iso(timestamp: Optional[float]) -> Optional[str]:
+    return datetime.fromtimestamp(timestamp).isoformat() if timestamp else None
+
+
+class JobQueue:
+    """Jobs table with claim/complete/fail semantics for multiple worker processes
+
+    A worker holds a lease on the job it runs and renews it while the job
+    is still in progress; a job whose lease ran out is handed to another
+    worker. Retried jobs wait with exponential backoff before they can be
+    claimed again.
+    """
+
+    def __init__(self, db_path: str, lease_seconds: int = LEASE_SECONDS, max_attempts: int = MAX_ATTEMPTS,
+                 retry_base_seconds: float = RETRY_BASE_SECONDS, retry_max_seconds: float = RETRY_MAX_SECONDS):
+        self.db_path = db_path
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self.retry_base_seconds = retry_base_seconds
+        self.retry_max_seconds = retry_max_seconds
+        self._lock = threading.Lock()
+        self._conn = None
+        self._conn_pid = None
+
+        directory = os.path.dirname(db_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    def _connection(self) -> sqlite3.Connection:
+        """One SQLite connection per process (connections must not cross a fork)"""
+        if self._conn is None or self._conn_pid != os.getpid():
+            # Autocommit mode: transactions are opened explicitly with BEGIN IMMEDIATE
+            self._conn = sqlite3.connect(self.db_path, check_same_thread=False, timeout=30, isolation_level=None)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS jobs ("
+                "id TEXT PRIMARY KEY, status TEXT NOT NULL, kind TEXT NOT NULL, filename TEXT, "
+                "payload BLOB, options TEXT, result TEXT, error TEXT, attempts INTEGER NOT NULL DEFAULT 0, "
+                "worker TEXT, created_at REAL NOT NULL, started_at REAL, finished_at REAL, lease_expires_at REAL, "
+                "not_before REAL)"
+            )
+            columns = {row[1] for row in self._conn.execute("PRAGMA table_info(jobs)")}
+            if 'not_before' not in columns:  # queue created before retry backoff
+                self._conn.execute("ALTER TABLE jobs ADD COLUMN not_before REAL")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS jobs_status_created ON jobs (status, created_at)")
+            self._conn_pid = os.getpid()
+        return self._conn
+
+    def enqueue(self, kind: str, payload: bytes, filename: Optional[str] = None,
+                options: Optional[Dict] = None) -> str:
+        """Store a 'file' (document bytes) or 'text' (UTF-8) job; returns its id"""
+        job_id = uuid.uuid4().hex
+        with self._lock:
+            self._connection().execute(
+                "INSERT INTO jobs (id, status, kind, filename, payload, options, created_at) "
+                "VALUES (?, 'queued', ?, ?, ?, ?, ?)",
+                (job_id, kind, filename, payload, json.dumps(options or {}), time.time())
+            )
+        return job_id
+
+    def claim(self, worker_id: str) -> Optional[Dict]:
+        """Take the oldest queued (or abandoned) job that is due, or None when there is nothing to do"""
+        with self._lock:
+            conn = self._connection()
+            now = time.time()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                # Jobs that keep killing their worker are not retried forever
+                conn.execute(
+                    "UPDATE jobs SET status = 'failed', error = 'Worker stopped while processing the job', "
+                    "payload = NULL, finished_at = ? "
+                    "WHERE status = 'running' AND lease_expires_at < ? AND attempts >= ?",
+                    (now, now, self.max_attempts)
+                )
+                row = conn.execute(
+                    "SELECT id FROM jobs WHERE (status = 'queued' AND (not_before IS NULL OR not_before <= ?)) "
+                    "OR (status = 'running' AND lease_expires_at < ?) ORDER BY created_at LIMIT 1",
+                    (now, now)
+                ).fetchone()
+                if row is not None:
+                    conn.execute(
+                        "UPDATE jobs SET status = 'running', attempts = attempts + 1, worker = ?, "
+                        "started_at = ?, lease_expires_at = ?, not_before = NULL WHERE id = ?",
+                        (worker_id, now, now + self.lease_seconds, row[0])
+                    )
+                conn.execute("COMMIT")
+            except sqlite3.Error:
+                conn.execute("ROLLBACK")
+                raise
+            if row is None:
+                return None
+
+            job = conn.execute(
+                "SELECT id, kind, filename, payload, options, attempts FROM jobs WHERE id = ?", (row[0],)
+            ).fetchone()
+        return {
+            "id": job[0],
+            "kind": job[1],
+            "filename": job[2],
+            "payload": job[3],
+            "options": json.loads(job[4] or '{}'),
+            "attempts": job[5]
+        }
+
+    def renew(self, job_id: str, worker_id: str) -> bool:
+        """Extend the lease of a job this worker is still running; False if it lost the job"""
+        with self._lock:
+            cursor = self._connection().execute(
+                "UPDATE jobs SET lease_expires_at = ? WHERE id = ? AND worker = ? AND status = 'running'",
+                (time.time() + self.lease_seconds, job_id, worker_id)
+            )
+            return cursor.rowcount > 0
+
+    def complete(self, job_id: str, result: Dict):
+        """Store the result; the uploaded document is dropped once it has been analyzed"""
+        with self._lock:
+            self._connection().execute(
+                "UPDATE jobs SET status = 'done', result = ?, error = NULL, payload = NULL, finished_at = ? "
+                "WHERE id = ?",
+                (json.dumps(result, ensure_ascii=False), time.time(), job_id)
+            )
+
+    def fail(self, job_id: str, error: str, retry: bool = False):
+        """Mark a job failed, or put it back in the queue (after a backoff) while attempts remain"""
+        with self._lock:
+            conn = self._connection()
+            attempts = conn.execute("SELECT attempts FROM jobs WHERE id = ?", (job_id,)).fetchone()
+            if retry and attempts and attempts[0] < self.max_attempts:
+                delay = min(self.retry_base_seconds * 2 ** max(attempts[0] - 1, 0), self.retry_max_seconds)
+                conn.execute(
+                    "UPDATE jobs SET status = 'queued', error = ?, lease_expires_at = NULL, not_before = ? "
+                    "WHERE id = ?",
+                    (error, time.time() + delay, job_id)
+                )
+            else:
+                conn.execute(
+                    "UPDATE jobs SET status = 'failed', error = ?, payload = NULL, finished_at = ? WHERE id = ?",
+                    (error, time.time(), job_id)
+                )
+
+    def get(self, job_id: str) -> Optional[Dict]:
+        """Public view of a job (no payload)"""
+        with self._lock:
+            row = self._connection().execute(
+                "SELECT id, status, kind, filename, result, error, attempts, created_at, started_at, finished_at, "
+                "not_before FROM jobs WHERE id = ?",
+                (job_id,)
+            ).fetchone()
+        if row is None:
+            return None
+        job = {
+            "job_id": row[0],
+            "status": row[1],
+            "kind": row[2],
+            "filename": row[3],
+            "attempts": row[6],
+            "created_at": _iso(row[7]),
+            "started_at": _iso(row[8]),
+            "finished_at": _iso(row[9])
+        }
+        if row[4] is not None:
+            job["result"] = json.loads(row[4])
+        if row[5] is not None:
+            job["error"] = row[5]
+        if row[1] == 'queued' and row[10]:
+            job["retry_at"] = _iso(row[10])
+        return job
+
+    def purge(self, older_than_seconds: int) -> int:
+        """Delete finished jobs older than the retention period; returns how many"""
+        with self._lock:
+            cursor = self._connection().execute(
+                "DELETE FROM jobs WHERE status IN ('done', 'failed') AND finished_at < ?",
+                (time.time() - older_than_seconds,)
+            )
+            return cursor.rowcount
+
+    def get_stats(self) -> Dict[str, int]:
+        with self._lock:
+            try:
+                rows = self._connection().execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall()
+            except sqlite3.Error as e:
+                logger.warning(f"Job queue stats failed: {e}")
+                return {}
+        stats = {'queued': 0, 'running': 0, 'done': 0, 'failed': 0}
+        stats.update(dict(rows))
+        return stats
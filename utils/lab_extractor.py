@@ -0,0 +1,214 @@
+"""
+Deterministic lab value extraction from report text (no LLM call)
+"""
+import re
+from bisect import bisect_right
+from typing import Dict, List, Optional, Tuple
+import logging
+
+from utils.lab_tables import FIELDS
+from utils.text_compactor import normalize_width
+
+logger = logging.getLogger(__name__)
+
+# Canonical test name -> synonyms as they appear in EN/ZH reports (matched
+# case-insensitively). Very short abbreviations that collide with ordinary
+# words or units (K, Na, UA) are deliberately left out.
+TEST_SYNONYMS = {
+    'Hemoglobin': ('hemoglobin', 'haemoglobin', 'hgb', 'hb', '血红蛋白'),
+    'WBC': ('white blood cell count', 'white blood cells', 'white blood cell', 'wbc', 'leukocytes', '白细胞计数', '白细胞'),
+    'RBC': ('red blood cell count', 'red blood cells', 'red blood cell', 'rbc', '红细胞计数', '红细胞'),
+    'Platelets': ('platelet count', 'platelets', 'platelet', 'plt', '血小板计数', '血小板'),
+    'Hematocrit': ('hematocrit', 'haematocrit', 'hct', '红细胞压积', '红细胞比容'),
+    'Glucose': ('fasting blood glucose', 'fasting glucose', 'blood glucose', 'glucose', 'fbg', 'glu', '空腹血糖', '血糖', '葡萄糖'),
+    'HbA1c': ('hemoglobin a1c', 'haemoglobin a1c', 'glycated hemoglobin', 'hba1c', 'a1c', '糖化血红蛋白'),
+    'Total Cholesterol': ('total cholesterol', 'cholesterol', 'chol', 'tc', '总胆固醇'),
+    'LDL-C': ('ldl cholesterol', 'ldl-cholesterol', 'ldl-c', 'ldl', '低密度脂蛋白胆固醇', '低密度脂蛋白'),
+    'HDL-C': ('hdl cholesterol', 'hdl-cholesterol', 'hdl-c', 'hdl', '高密度脂蛋白胆固醇', '高密度脂蛋白'),
+    'Non-HDL Cholesterol': ('non-hdl cholesterol', 'non hdl cholesterol', 'non-hdl-c', 'non-hdl', '非高密度脂蛋白胆固醇'),
+    'Triglycerides': ('triglycerides', 'triglyceride', 'trig', 'tg', '甘油三酯', '甘油三脂'),
+    'ALT': ('alanine aminotransferase', 'alt', 'sgpt', '丙氨酸氨基转移酶', '谷丙转氨酶'),
+    'AST': ('aspartate aminotransferase', 'ast', 'sgot', '天门冬氨酸氨基转移酶', '谷草转氨酶'),
+    'Total Bilirubin': ('total bilirubin', 'tbil', '总胆红素'),
+    'Albumin': ('albumin', 'alb', '白蛋白'),
+    'Creatinine': ('creatinine', 'crea', 'cr', '肌酐'),
+    'BUN': ('blood urea nitrogen', 'bun', 'urea', '尿素氮', '尿素'),
+    'eGFR': ('egfr', '估算肾小球滤过率', '肾小球滤过率'),
+    'Uric Acid': ('uric acid', '尿酸'),
+    'Potassium': ('potassium', '钾'),
+    'Sodium': ('sodium', '钠'),
+    'TSH': ('thyroid stimulating hormone', 'tsh', '促甲状腺激素'),
+    'CRP': ('c-reactive protein', 'c reactive protein', 'hs-crp', 'crp', 'c反应蛋白', 'c-反应蛋白'),
+}
+
+# A matched line counts as fully captured when the match covers this share of it
+CAPTURED_LINE_COVERAGE = 0.8
+
+_SYNONYM_TO_TEST = {
+    synonym: test for test, synonyms in TEST_SYNONYMS.items() for synonym in synonyms
+}
+
+# Longest synonyms first so "ldl cholesterol" wins over "ldl"
+_NAMES = '|'.join(
+    re.escape(synonym).replace(r'\ ', r'\s+')
+    for synonym in sorted(_SYNONYM_TO_TEST, key=len, reverse=True)
+)
+_NUMBER = r'\d+(?:\.\d+)?'
+_FLAG = r'↑|↓|偏高|偏低|(?<![A-Za-z])(?:HIGH|LOW|H|L)(?![A-Za-z])'
+
+_LAB_VALUE = re.compile(
+    rf'(?<![A-Za-z])(?P<name>{_NAMES})(?![A-Za-z])'
+    r'[ \t]*(?:\([^)\n]{1,20}\)[ \t]*)?[:：=]?[ \t]*'
+    rf'(?P<value>[<>≤≥]?[ \t]*{_NUMBER})[ \t]*(?P<flag1>{_FLAG})?[ \t]*'
+    r'(?P<unit>[×x*]?10(?:\^?\d+|[⁰¹²³⁴⁵⁶⁷⁸⁹]+)/[A-Za-z]+|%|[A-Za-zµμ]+/[A-Za-z0-9µμ.^]+(?:/[A-Za-z0-9.]+)?|fL|pg)?[ \t]*'
+    r'(?:[(（\[]?[ \t]*(?:(?:ref(?:erence)?\.?(?:[ \t]*range)?|参考(?:范围|值)?)[ \t]*[:：]?[ \t]*)?'
+    rf'(?P<range>[<>≤≥][ \t]*{_NUMBER}|{_NUMBER}[ \t]*[-–~～][ \t]*{_NUMBER})[ \t]*[)）\]]?)?[ \t]*'
+    rf'(?P<flag2>{_FLAG})?',
+    re.IGNORECASE
+)
+
+# Visit/collection dates ("2023-01-05", "2023/1/5", "2023年1月5日", "05/01/2023"); a
+# value belongs to the nearest date before it
+_DATE = re.compile(r'(?<!\d)(?:\d{4}[-/.]\d{1,2}[-/.]\d{1,2}|\d{4}年\d{1,2}月\d{1,2}日|\d{1,2}[-/.]\d{1,2}[-/.]\d{4})(?!\d)')
+
+_TABLE_SEPARATORS = re.compile(r'[\s|:：()（）\[\]]+')
+
+_FLAGS = {'↑': 'H', '偏高': 'H', 'high': 'H', 'h': 'H', '↓': 'L', '偏低': 'L', 'low': 'L', 'l': 'L'}
+_RANGE_BOUNDS = re.compile(rf'({_NUMBER})[ \t]*[-–~～][ \t]*({_NUMBER})')
+_RANGE_LIMIT = re.compile(rf'([<>≤≥])({_NUMBER})')
+
+
+def _infer_flag(value: str, value_range: str) -> str:
+    """Flag a value against a numeric "low-high", "<limit" or ">limit" reference range"""
+    if not value[:1].isdigit():
+        return ''
+    number = float(value)
+
+    bounds = _RANGE_BOUNDS.fullmatch(value_range)
+    if bounds:
+        if number > float(bounds.group(2)):
+            return 'H'
+        if number < float(bounds.group(1)):
+            return 'L'
+        return ''
+
+    limit = _RANGE_LIMIT.fullmatch(value_range)
+    if limit:
+        bound = float(limit.group(2))
+        if limit.group(1) in '<≤' and number > bound:
+            return 'H'
+        if limit.group(1) in '>≥' and number < bound:
+            return 'L'
+    return ''
+
+
+class LabExtractor:
+    """Pull (test, value, unit, range, flag) rows out of report text in one regex pass"""
+
+    def extract(self, text: str,
+                table_rows: Optional[List[Dict[str, str]]] = None) -> Tuple[List[Dict[str, str]], str]:
+        """Return the lab value rows and the text with fully captured lines removed
+
+        Rows use the same fields as utils.lab_tables. A missing flag is
+        inferred when the value falls outside a numeric reference range.
+        When a date precedes a value (serial results, one block per visit)
+        the row also gets that "date", and only exact repeats under the same
+        date are merged. Lines consisting of nothing but a captured value are
+        dropped from the returned text, since the row carries the same facts
+        in fewer tokens; a repeated line whose row was merged is kept.
+
+        table_rows (from DocumentParser.extract_tables) come first, with
+        missing flags inferred the same way. The text lines they were
+        flattened into are removed too, and values on those lines are not
+        matched a second time.
+        """
+        if not text and not table_rows:
+            return [], text or ""
+
+        dates = [(match.start(), match.group(0)) for match in _DATE.finditer(text)]
+        date_starts = [start for start, _ in dates]
+
+        rows = [
+            dict(row, flag=row.get('flag') or _infer_flag(row.get('value', ''), row.get('range', '')))
+            for row in table_rows or []
+        ]
+        seen = set()
+        captured = self._table_lines(text, rows)  # line start offset -> captured characters on that line
+        table_lines = set(captured)
+        for match in _LAB_VALUE.finditer(text):
+            line_start = text.rfind('\n', 0, match.start()) + 1
+            if line_start in table_lines:
+                continue
+            row = self._to_row(match)
+            if row is None:
+                continue
+
+            preceding = bisect_right(date_starts, match.start())
+            if preceding:
+                row['date'] = dates[preceding - 1][1]
+
+            key = (row.get('date', ''), row['test'], row['value'], row['unit'])
+            if key in seen:
+                continue
+            seen.add(key)
+            rows.append(row)
+
+            captured[line_start] = captured.get(line_start, 0) + len(match.group(0).strip())
+
+        return rows, self._remove_captured_lines(text, captured)
+
+    @staticmethod
+    def _table_lines(text: str, table_rows: List[Dict[str, str]]) -> Dict[int, int]:
+        """Line start offset -> characters covered by a table row whose test and value are on that line"""
+        if not table_rows:
+            return {}
+        cells = []
+        for row in table_rows:
+            row_cells = [normalize_width(row.get(field, '')) for field in FIELDS]
+            if row_cells[0] and row_cells[1]:
+                cells.append(row_cells)
+
+        captured = {}
+        offset = 0
+        for line in text.split('\n'):
+            covered = 0
+            for row_cells in cells:
+                if row_cells[0] in line and row_cells[1] in line:
+                    rest = line
+                    for cell in sorted(filter(None, row_cells), key=len, reverse=True):
+                        rest = rest.replace(cell, '', 1)
+                    # Nothing left but cell separators (" | " in DOCX rows): the whole line
+                    covered = max(covered, len(line.strip()) - len(_TABLE_SEPARATORS.sub('', rest)))
+            if covered:
+                captured[offset] = covered
+            offset += len(line) + 1
+        return captured
+
+    @staticmethod
+    def _to_row(match: re.Match) -> Optional[Dict[str, str]]:
+        name = re.sub(r'\s+', ' ', match.group('name').lower())
+        test = _SYNONYM_TO_TEST.get(name)
+        if test is None:
+            return None
+
+        row = dict.fromkeys(FIELDS, '')
+        row['test'] = test
+        row['value'] = re.sub(r'[ \t]+', '', match.group('value'))
+        row['unit'] = match.group('unit') or ''
+        row['range'] = re.sub(r'[ \t]+', '', match.group('range') or '')
+        flag = match.group('flag1') or match.group('flag2')
+        row['flag'] = _FLAGS.get(flag.lower(), flag) if flag else _infer_flag(row['value'], row['range'])
+        return row
+
+    @staticmethod
+    def _remove_captured_lines(text: str, captured: Dict[int, int]) -> str:
+        if not captured:
+            return text
+        kept = []
+        offset = 0
+        for line in text.split('\n'):
+            visible = len(line.strip())
+            if not (visible and captured.get(offset, 0) >= visible * CAPTURED_LINE_COVERAGE):
+                kept.append(line)
+            offset += len(line) + 1
+        return '\n'.join(kept)
@@ -0,0 +1,136 @@
+"""
+Normalize raw table rows from lab reports into compact result rows
+"""
+import re
+from typing import Dict, List, Optional
+
+# Row fields, in the order used by format_rows
+FIELDS = ('test', 'value', 'unit', 'range', 'flag')
+
+# Header cell keywords (lowercase, EN/ZH) for each field, checked in this
+# order so that e.g. "Normal Value" maps to range and "Test Result" to value
+HEADER_SYNONYMS = {
+    'range': ('reference', 'range', 'ref', 'normal', 'interval', '参考', '正常值'),
+    'unit': ('unit', '单位'),
+    'flag': ('flag', 'abnormal', 'status', 'h/l', '提示', '标志', '异常'),
+    'value': ('result', 'value', '结果', '测定值', '数值'),
+    'test': ('test', 'item', 'analyte', 'parameter', 'component', 'name', '项目', '名称'),
+}
+
+# Cells that are only an abnormality marker
+FLAG_VALUES = {
+    'h': 'H', 'high': 'H', '↑': 'H', '高': 'H', '偏高': 'H',
+    'l': 'L', 'low': 'L', '↓': 'L', '低': 'L', '偏低': 'L',
+    '*': '*', 'a': 'A', 'abnormal': 'A', '异常': 'A',
+}
+
+_WHITESPACE = re.compile(r'\s+')
+_VALUE = re.compile(r'^([<>≤≥]?\s*-?\d+(?:\.\d+)?)\s*(↑|↓|H|L|HIGH|LOW)?$', re.IGNORECASE)
+_RANGE = re.compile(r'^(?:[<>≤≥]\s*\d+(?:\.\d+)?|\d+(?:\.\d+)?\s*[-–~～]\s*\d+(?:\.\d+)?)$')
+_UNIT = re.compile(r'^(?:%|[a-zA-Zµμ]+(?:/[a-zA-Z0-9µμ.^]+)*|10\^?\d+/[a-zA-Z]+|×10\^?\d+/[a-zA-Z]+)$')
+
+
+def _clean(cell: Optional[str]) -> str:
+    return _WHITESPACE.sub(' ', cell).strip() if cell else ''
+
+
+def _header_map(row: List[str]) -> Dict[int, str]:
+    """Map column index -> field for a header row (empty if it isn't one)"""
+    mapping = {}
+    for index, cell in enumerate(row):
+        lowered = cell.lower()
+        for field, words in HEADER_SYNONYMS.items():
+            if field not in mapping.values() and any(word in lowered for word in words):
+                mapping[index] = field
+                break
+    return mapping if 'test' in mapping.values() and 'value' in mapping.values() else {}
+
+
+def _split_value(cell: str, row: Dict[str, str]):
+    """Store a value cell, moving a trailing flag ("5.6 H", "5.6↑") into the flag field"""
+    match = _VALUE.match(cell)
+    if match:
+        row['value'] = match.group(1).replace(' ', '')
+        if match.group(2) and not row['flag']:
+            row['flag'] = FLAG_VALUES.get(match.group(2).lower(), match.group(2))
+    else:
+        row['value'] = cell
+
+
+def _positional_row(cells: List[str]) -> Optional[Dict[str, str]]:
+    """Classify the cells of a row without a header by their shape"""
+    row = dict.fromkeys(FIELDS, '')
+    for cell in cells:
+        if not cell:
+            continue
+        if not row['value'] and _VALUE.match(cell):
+            _split_value(cell, row)
+        elif not row['range'] and _RANGE.match(cell):
+            row['range'] = cell
+        elif not row['flag'] and cell.lower() in FLAG_VALUES:
+            row['flag'] = FLAG_VALUES[cell.lower()]
+        elif not row['unit'] and row['value'] and _UNIT.match(cell):
+            row['unit'] = cell
+        elif not row['test'] and not row['value']:
+            row['test'] = cell
+    return row if row['test'] and row['value'] else None
+
+
+def normalize_table(table: List[List[Optional[str]]]) -> List[Dict[str, str]]:
+    """Turn raw table cells into {test, value, unit, range, flag} rows
+
+    A header row (EN or ZH) decides the column mapping when present;
+    otherwise each cell is classified by its shape. Rows without both a
+    test name and a value are dropped.
+    """
+    rows = [[_clean(cell) for cell in raw] for raw in table if raw]
+    rows = [row for row in rows if any(row)]
+    if not rows:
+        return []
+
+    mapping = {}
+    start = 0
+    for index, row in enumerate(rows[:2]):
+        mapping = _header_map(row)
+        if mapping:
+            start = index + 1
+            break
+
+    results = []
+    for cells in rows[start:]:
+        if not mapping:
+            row = _positional_row(cells)
+            if row:
+                results.append(row)
+            continue
+
+        row = dict.fromkeys(FIELDS, '')
+        for index, field in mapping.items():
+            if index >= len(cells) or not cells[index]:
+                continue
+            if field == 'value':
+                _split_value(cells[index], row)
+            elif field == 'flag':
+                row['flag'] = FLAG_VALUES.get(cells[index].lower(), cells[index])
+            else:
+                row[field] = cells[index]
+        if row['test'] and row['value']:
+            results.append(row)
+
+    return results
+
+
+def format_rows(rows: List[Dict[str, str]]) -> str:
+    """Render rows as compact "test | value | unit | range | flag" lines
+
+    Rows carrying a "date" (serial results) are preceded by a "[date]" line
+    whenever the date changes.
+    """
+    lines = []
+    date = ''
+    for row in rows:
+        if row.get('date', '') != date:
+            date = row.get('date', '')
+            lines.append(f"[{date or 'no date'}]")
+        lines.append(" | ".join(row.get(field, '') for field in FIELDS).rstrip(" |"))
+    return "\n".join(lines)
@@ -0,0 +1,264 @@
+"""
+Token-bucket rate limiting for DeepSeek calls (requests/min and tokens/min), with priority queueing
+"""
+import asyncio
+import json
+import os
+import threading
+import time
+import uuid
+from typing import Callable, Dict, Optional
+import logging
+
+try:
+    import fcntl
+except ImportError:  # Windows: no cross-process mode
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+# Lower rank goes first
+INTERACTIVE = 'interactive'
+BATCH = 'batch'
+BACKGROUND = 'background'
+PRIORITIES = {INTERACTIVE: 0, BATCH: 1, BACKGROUND: 2}
+
+MAX_WAIT_SECONDS = 300.0
+POLL_SECONDS = 0.05
+MAX_POLL_SECONDS = 0.5
+# A queued caller that stops polling (its process died) is dropped after this
+WAITER_TTL_SECONDS = 5.0
+
+
+class RateLimitTimeout(Exception):
+    """Raised when a call waited max_wait seconds without getting capacity"""
+
+
+class AcquireCancelled(Exception):
+    """Raised when the caller gave up (its cancelled event was set) while queued"""
+
+
+class RateLimiter:
+    """Two token buckets, one call and its estimated prompt tokens per acquire
+
+    Each bucket holds one minute's allowance and refills continuously.
+    Callers that don't fit wait in a queue ordered by priority (interactive,
+    batch, background), then arrival; only the head of the queue may take
+    capacity, so a large prompt is not starved by small ones. charge()
+    settles the difference once the real token usage is known, which may
+    leave the token bucket in debt for a while.
+
+    With state_path set, the buckets and the queue live in a small JSON file
+    guarded by a file lock, so every gunicorn worker (and job worker) shares
+    one limit; otherwise the limit is per process. A limit of 0 disables
+    that bucket.
+    """
+
+    def __init__(self, requests_per_minute: int = 0, tokens_per_minute: int = 0,
+                 state_path: Optional[str] = None, max_wait: Optional[float] = MAX_WAIT_SECONDS):
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self.state_path = state_path
+        self.max_wait = max_wait
+        self._lock = threading.Lock()
+        self._state = None
+        self._stats_lock = threading.Lock()
+        self.stats = {'acquired': 0, 'queued': 0, 'wait_seconds': 0.0, 'timeouts': 0}
+
+        if state_path:
+            if fcntl is None:
+                logger.warning("File locks unavailable on this platform; rate limits apply per process")
+                self.state_path = None
+            else:
+                directory = os.path.dirname(state_path)
+                if directory:
+                    os.makedirs(directory, exist_ok=True)
+
+    def _update(self, func: Callable[[Dict], object]) -> object:
+        """Run func on the shared state and save it; returns func's result"""
+        with self._lock:
+            if not self.state_path:
+                if self._state is None:
+                    self._state = self._new_state()
+                return func(self._state)
+
+            with open(self.state_path, 'a+') as handle:
+                fcntl.flock(handle, fcntl.LOCK_EX)
+                try:
+                    handle.seek(0)
+                    try:
+                        state = json.loads(handle.read() or 'null') or self._new_state()
+                    except ValueError:
+                        state = self._new_state()
+                    result = func(state)
+                    handle.seek(0)
+                    handle.truncate()
+                    handle.write(json.dumps(state))
+                    handle.flush()
+                    return result
+                finally:
+                    fcntl.flock(handle, fcntl.LOCK_UN)
+
+    def _new_state(self) -> Dict:
+        return {
+            "requests": float(self.requests_per_minute),
+            "tokens": float(self.tokens_per_minute),
+            "updated": time.time(),
+            "waiters": {}
+        }
+
+    def _refill(self, state: Dict, now: float):
+        elapsed = max(now - state["updated"], 0.0)
+        state["requests"] = min(self.requests_per_minute, state["requests"] + elapsed * self.requests_per_minute / 60)
+        state["tokens"] = min(self.tokens_per_minute, state["tokens"] + elapsed * self.tokens_per_minute / 60)
+        state["updated"] = now
+
+    def _try_take(self, state: Dict, waiter: str, rank: int, enqueued: float, tokens: int) -> float:
+        """Take capacity for waiter if it is first in line and it fits
+
+        Returns 0 once taken, otherwise how long to wait before trying again.
+        """
+        now = time.time()
+        self._refill(state, now)
+        waiters = state["waiters"]
+        for key in [key for key, (_, _, seen) in waiters.items() if seen < now - WAITER_TTL_SECONDS]:
+            del waiters[key]
+        waiters[waiter] = [rank, enqueued, now]
+
+        head = min(waiters, key=lambda key: (waiters[key][0], waiters[key][1]))
+        if head != waiter:
+            return POLL_SECONDS
+
+        # A prompt larger than a minute's allowance waits for a full bucket
+        tokens = min(tokens, self.tokens_per_minute)
+        delays = []
+        if self.requests_per_minute and state["requests"] < 1:
+            delays.append((1 - state["requests"]) * 60 / self.requests_per_minute)
+        if self.tokens_per_minute and state["tokens"] < tokens:
+            delays.append((tokens - state["tokens"]) * 60 / self.tokens_per_minute)
+        if delays:
+            return min(max(max(delays), POLL_SECONDS), MAX_POLL_SECONDS)
+
+        if self.requests_per_minute:
+            state["requests"] -= 1
+        if self.tokens_per_minute:
+            state["tokens"] -= tokens
+        del waiters[waiter]
+        return 0.0
+
+    def _leave(self, waiter: str):
+        self._update(lambda state: state["waiters"].pop(waiter, None))
+
+    def _attempt(self, waiter: str, rank: int, start: float, tokens: int) -> float:
+        """One try at acquiring; raises RateLimitTimeout past max_wait"""
+        delay = self._update(lambda state: self._try_take(state, waiter, rank, start, tokens))
+        if delay and self.max_wait is not None and time.time() - start + delay > self.max_wait:
+            self._leave(waiter)
+            with self._stats_lock:
+                self.stats['timeouts'] += 1
+            raise RateLimitTimeout(f"DeepSeek rate limit: no capacity within {self.max_wait:g}s")
+        return delay
+
+    def _record(self, start: float, queued: bool):
+        with self._stats_lock:
+            self.stats['acquired'] += 1
+            if queued:
+                self.stats['queued'] += 1
+                self.stats['wait_seconds'] += time.time() - start
+
+    def acquire(self, tokens: int, priority: str = INTERACTIVE, cancelled: Optional[threading.Event] = None) -> float:
+        """Block until one call with this many prompt tokens may go upstream; returns seconds waited
+
+        Once cancelled is set the caller leaves the queue and
+        AcquireCancelled is raised, without taking capacity.
+        """
+        rank = PRIORITIES[priority]
+        waiter = uuid.uuid4().hex
+        start = time.time()
+        queued = False
+        if cancelled is not None and cancelled.is_set():
+            raise AcquireCancelled("Rate limiter wait cancelled")
+        delay = self._attempt(waiter, rank, start, tokens)
+        while delay:
+            queued = True
+            if cancelled is not None:
+                if cancelled.wait(delay):
+                    self._leave(waiter)
+                    raise AcquireCancelled("Rate limiter wait cancelled")
+            else:
+                time.sleep(delay)
+            delay = self._attempt(waiter, rank, start, tokens)
+        self._record(start, queued)
+        return time.time() - start
+
+    async def aacquire(self, tokens: int, priority: str = INTERACTIVE) -> float:
+        """Async version of acquire
+
+        Each attempt takes a thread lock and, in shared mode, a file lock
+        plus file I/O, so attempts run in the loop's default executor
+        rather than on the event loop.
+        """
+        loop = asyncio.get_running_loop()
+        rank = PRIORITIES[priority]
+        waiter = uuid.uuid4().hex
+        start = time.time()
+        queued = False
+        attempt = None
+        try:
+            attempt = loop.run_in_executor(None, self._attempt, waiter, rank, start, tokens)
+            # shield: a cancelled caller leaves the queue only after its attempt has finished
+            delay = await asyncio.shield(attempt)
+            while delay:
+                queued = True
+                attempt = None
+                await asyncio.sleep(delay)
+                attempt = loop.run_in_executor(None, self._attempt, waiter, rank, start, tokens)
+                delay = await asyncio.shield(attempt)
+        except asyncio.CancelledError:
+            self._leave_after(loop, attempt, waiter)
+            raise
+        self._record(start, queued)
+        return time.time() - start
+
+    def _leave_after(self, loop: asyncio.AbstractEventLoop, attempt: Optional[asyncio.Future], waiter: str):
+        """Drop a cancelled async waiter from the queue once its in-flight attempt is done"""
+        def leave(future=None):
+            if future is not None and not future.cancelled():
+                future.exception()  # retrieved: nobody is awaiting it any more
+            loop.run_in_executor(None, self._leave, waiter)
+
+        if attempt is not None and not attempt.done():
+            attempt.add_done_callback(leave)
+        else:
+            leave(attempt)
+
+    def charge(self, tokens: int):
+        """Settle a call's real token usage against its estimate (negative refunds)"""
+        if not self.tokens_per_minute or not tokens:
+            return
+
+        def settle(state):
+            self._refill(state, time.time())
+            state["tokens"] = min(self.tokens_per_minute, state["tokens"] - tokens)
+
+        self._update(settle)
+
+    def get_stats(self) -> Dict[str, float]:
+        with self._stats_lock:
+            stats = dict(self.stats)
+        stats['wait_seconds'] = round(stats['wait_seconds'], 3)
+
+        def snapshot(state):
+            self._refill(state, time.time())
+            return {
+                "requests_available": round(state["requests"], 1),
+                "tokens_available": round(state["tokens"]),
+                "waiting": len(state["waiters"])
+            }
+
+        try:
+            stats.update(self._update(snapshot))
+        except OSError as e:
+            logger.warning(f"Rate limiter stats failed: {e}")
+        stats['shared'] = bool(self.state_path)
+        return stats
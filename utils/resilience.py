@@ -0,0 +1,200 @@
+"""
+Retry with jittered exponential backoff, and a circuit breaker, for upstream API calls
+"""
+import asyncio
+import random
+import threading
+import time
+from typing import Any, Awaitable, Callable, Dict, Optional
+import logging
+
+from openai import APIConnectionError, APIStatusError
+
+logger = logging.getLogger(__name__)
+
+# 408 timeout, 409 lock conflict, 429 rate limit, and every 5xx
+RETRYABLE_STATUS = {408, 409, 429}
+
+
+def is_retryable(error: Exception) -> bool:
+    """Whether an upstream error is transient (and counts against the breaker)"""
+    if isinstance(error, APIConnectionError):  # includes APITimeoutError
+        return True
+    if isinstance(error, APIStatusError):
+        return error.status_code in RETRYABLE_STATUS or error.status_code >= 500
+    return False
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling the upstream while the breaker is open"""
+
+
+class AttemptCancelled(Exception):
+    """Raised instead of calling (or retrying) the upstream once the caller gave up"""
+
+
+class CircuitBreaker:
+    """Consecutive-failure circuit breaker (closed -> open -> half_open -> closed)
+
+    After failure_threshold transient failures in a row the breaker opens
+    and calls fail immediately for reset_seconds; then one probe call is let
+    through, and its outcome closes or re-opens the breaker. State is per
+    process.
+    """
+
+    def __init__(self, failure_threshold: int = 5, reset_seconds: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self._lock = threading.Lock()
+        self._state = 'closed'
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+        self.stats = {'opened': 0, 'rejected': 0}
+
+    def before_call(self):
+        """Raise CircuitOpenError unless a call may go upstream now"""
+        with self._lock:
+            if self._state == 'closed':
+                return
+            if self._state == 'open':
+                remaining = self._opened_at + self.reset_seconds - time.time()
+                if remaining > 0:
+                    self.stats['rejected'] += 1
+                    raise CircuitOpenError(f"DeepSeek unavailable, circuit open for another {remaining:.0f}s")
+                self._state = 'half_open'
+            if self._probe_in_flight:
+                self.stats['rejected'] += 1
+                raise CircuitOpenError("DeepSeek unavailable, waiting for a probe request")
+            self._probe_in_flight = True
+
+    def record_success(self):
+        with self._lock:
+            self._state = 'closed'
+            self._failures = 0
+            self._probe_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            self._probe_in_flight = False
+            if self._state == 'half_open' or self._failures >= self.failure_threshold:
+                if self._state != 'open':
+                    self.stats['opened'] += 1
+                    logger.warning(f"DeepSeek circuit opened after {self._failures} consecutive failures")
+                self._state = 'open'
+                self._opened_at = time.time()
+
+    def release(self):
+        """End a call that neither succeeded nor failed transiently (e.g. a 400)"""
+        with self._lock:
+            self._probe_in_flight = False
+
+    def get_state(self) -> Dict[str, Any]:
+        with self._lock:
+            state = {
+                "state": self._state,
+                "consecutive_failures": self._failures,
+                "opened": self.stats['opened'],
+                "rejected": self.stats['rejected'],
+            }
+            if self._state == 'open':
+                state["retry_in_seconds"] = max(round(self._opened_at + self.reset_seconds - time.time(), 1), 0)
+            return state
+
+
+class RetryPolicy:
+    """How many times to retry transient errors, and how long to wait in between"""
+
+    def __init__(self, max_retries: int = 3, base_delay: float = 0.5, max_delay: float = 8.0,
+                 timeout: float = 60.0):
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.timeout = timeout  # seconds per attempt
+
+    def delay(self, attempt: int, error: Exception) -> float:
+        """Full-jitter exponential backoff, honouring Retry-After on 429/503"""
+        delay = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+        response = getattr(error, 'response', None)
+        retry_after = response.headers.get('retry-after') if response is not None else None
+        if retry_after:
+            try:
+                delay = max(delay, min(float(retry_after), self.max_delay))
+            except ValueError:
+                pass
+        return delay
+
+
+def call_with_retry(func: Callable[[], Any], policy: RetryPolicy, breaker: Optional[CircuitBreaker] = None,
+                    cancelled: Optional[threading.Event] = None) -> Any:
+    """Call func, retrying transient errors with backoff, guarded by the breaker
+
+    Once cancelled is set (e.g. a hedged attempt lost) no further attempt is
+    made, and a failure of the cancelled attempt does not count against the
+    breaker; AttemptCancelled is raised instead.
+    """
+    attempt = 0
+    while True:
+        if cancelled is not None and cancelled.is_set():
+            raise AttemptCancelled("DeepSeek call cancelled")
+        if breaker is not None:
+            breaker.before_call()
+        try:
+            result = func()
+        except Exception as e:
+            if cancelled is not None and cancelled.is_set():
+                if breaker is not None:
+                    breaker.release()
+                raise AttemptCancelled("DeepSeek call cancelled") from e
+            if not is_retryable(e):
+                if breaker is not None:
+                    breaker.release()
+                raise
+            if breaker is not None:
+                breaker.record_failure()
+            if attempt >= policy.max_retries:
+                raise
+            delay = policy.delay(attempt, e)
+            logger.warning(f"DeepSeek call failed ({e}); retry {attempt + 1}/{policy.max_retries} in {delay:.1f}s")
+            if cancelled is not None:
+                cancelled.wait(delay)
+            else:
+                time.sleep(delay)
+            attempt += 1
+            continue
+        if breaker is not None:
+            breaker.record_success()
+        return result
+
+
+async def acall_with_retry(func: Callable[[], Awaitable[Any]], policy: RetryPolicy,
+                           breaker: Optional[CircuitBreaker] = None) -> Any:
+    """Async version of call_with_retry"""
+    attempt = 0
+    while True:
+        if breaker is not None:
+            breaker.before_call()
+        try:
+            result = await func()
+        except asyncio.CancelledError:
+            if breaker is not None:
+                breaker.release()
+            raise
+        except Exception as e:
+            if not is_retryable(e):
+                if breaker is not None:
+                    breaker.release()
+                raise
+            if breaker is not None:
+                breaker.record_failure()
+            if attempt >= policy.max_retries:
+                raise
+            delay = policy.delay(attempt, e)
+            logger.warning(f"DeepSeek call failed ({e}); retry {attempt + 1}/{policy.max_retries} in {delay:.1f}s")
+            await asyncio.sleep(delay)
+            attempt += 1
+            continue
+        if breaker is not None:
+            breaker.record_success()
+        return result
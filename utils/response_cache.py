@@ -0,0 +1,185 @@
+"""
+Cache of DeepSeek analysis results, keyed by normalized input and prompt settings
+"""
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from typing import Dict, Optional
+import logging
+
+logger = logging.getLogger(__name__)
+
+_WHITESPACE = re.compile(r'\s+')
+
+
+def normalize_text(text: str) -> str:
+    """Normalize text so trivially different copies of a report share a key"""
+    return _WHITESPACE.sub(' ', unicodedata.normalize('NFKC', text)).strip()
+
+
+class MemoryResponseBackend:
+    """In-process LRU dict backend"""
+
+    def __init__(self, max_entries: int = 1000):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[Dict]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at < time.time():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: Dict, expires_at: float):
+        with self._lock:
+            self._entries[key] = (expires_at, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def size(self) -> int:
+        with self._lock:
+            return len(self._entries)
+
+
+class SQLiteResponseBackend:
+    """SQLite file backend, shared by every worker process on the host"""
+
+    def __init__(self, db_path: str, max_entries: int = 10000):
+        self.db_path = db_path
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._conn = None
+        self._conn_pid = None
+
+        directory = os.path.dirname(db_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    def _connection(self) -> sqlite3.Connection:
+        """One SQLite connection per process (connections must not cross a fork)"""
+        if self._conn is None or self._conn_pid != os.getpid():
+            self._conn = sqlite3.connect(self.db_path, check_same_thread=False, timeout=5)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS llm_responses ("
+                "key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL, accessed_at REAL NOT NULL)"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS llm_responses_accessed ON llm_responses (accessed_at)")
+            self._conn.commit()
+            self._conn_pid = os.getpid()
+        return self._conn
+
+    def get(self, key: str) -> Optional[Dict]:
+        with self._lock:
+            try:
+                conn = self._connection()
+                row = conn.execute(
+                    "SELECT value, expires_at FROM llm_responses WHERE key = ?", (key,)
+                ).fetchone()
+                if row is None:
+                    return None
+                if row[1] < time.time():
+                    conn.execute("DELETE FROM llm_responses WHERE key = ?", (key,))
+                    conn.commit()
+                    return None
+                conn.execute("UPDATE llm_responses SET accessed_at = ? WHERE key = ?", (time.time(), key))
+                conn.commit()
+                return json.loads(row[0])
+            except sqlite3.Error as e:
+                logger.warning(f"Response cache read failed: {e}")
+                return None
+
+    def set(self, key: str, value: Dict, expires_at: float):
+        with self._lock:
+            try:
+                conn = self._connection()
+                now = time.time()
+                conn.execute(
+                    "INSERT OR REPLACE INTO llm_responses (key, value, expires_at, accessed_at) VALUES (?, ?, ?, ?)",
+                    (key, json.dumps(value, ensure_ascii=False), expires_at, now)
+                )
+                # Expire, then evict least recently used rows beyond the size bound
+                conn.execute("DELETE FROM llm_responses WHERE expires_at < ?", (now,))
+                conn.execute(
+                    "DELETE FROM llm_responses WHERE key IN ("
+                    "SELECT key FROM llm_responses ORDER BY accessed_at DESC LIMIT -1 OFFSET ?)",
+                    (self.max_entries,)
+                )
+                conn.commit()
+            except sqlite3.Error as e:
+                logger.warning(f"Response cache write failed: {e}")
+
+    def size(self) -> int:
+        with self._lock:
+            try:
+                return self._connection().execute("SELECT COUNT(*) FROM llm_responses").fetchone()[0]
+            except sqlite3.Error:
+                return 0
+
+
+class ResponseCache:
+    """TTL + size-bounded cache of successful analysis results"""
+
+    def __init__(self, backend=None, ttl_seconds: int = 7 * 24 * 3600):
+        self.backend = backend or MemoryResponseBackend()
+        self.ttl_seconds = ttl_seconds
+        self._lock = threading.Lock()
+        self.stats = {'hits': 0, 'misses': 0, 'stores': 0}
+
+    @staticmethod
+    def make_key(text: str, model: str, temperature: float, prompt_version: str, **options) -> str:
+        """Hash of (normalized text, model, temperature, prompt version, other prompt inputs)"""
+        payload = json.dumps({
+            "text": normalize_text(text),
+            "model": model,
+            "temperature": temperature,
+            "prompt_version": prompt_version,
+            "options": options
+        }, sort_keys=True, ensure_ascii=False)
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    def get(self, key: str) -> Optional[Dict]:
+        value = self.backend.get(key)
+        with self._lock:
+            self.stats['hits' if value is not None else 'misses'] += 1
+        return value
+
+    def set(self, key: str, value: Dict):
+        self.backend.set(key, value, time.time() + self.ttl_seconds)
+        with self._lock:
+            self.stats['stores'] += 1
+
+    def get_stats(self) -> Dict[str, float]:
+        with self._lock:
+            stats = dict(self.stats)
+        lookups = stats['hits'] + stats['misses']
+        stats['hit_rate'] = stats['hits'] / lookups if lookups else 0.0
+        stats['entries'] = self.backend.size()
+        stats['backend'] = type(self.backend).__name__
+        return stats
+
+
+def create_response_cache(backend: str, db_path: Optional[str] = None, max_entries: int = 1000,
+                          ttl_seconds: int = 7 * 24 * 3600) -> Optional[ResponseCache]:
+    """Build a ResponseCache from config values ('memory', 'sqlite' or 'none')"""
+    if backend == 'none':
+        return None
+    if backend == 'sqlite':
+        if not db_path:
+            raise ValueError("RESPONSE_CACHE_PATH is required for the sqlite response cache")
+        return ResponseCache(SQLiteResponseBackend(db_path, max_entries), ttl_seconds)
+    return ResponseCache(MemoryResponseBackend(max_entries), ttl_seconds)
@@ -0,0 +1,84 @@
+"""
+Script statistics (CJK / Latin / digit mix) shared by the parser and analyzer
+"""
+from typing import Dict
+
+# Documents longer than this are sampled instead of scanned in full
+SAMPLE_CHARS = 20000
+SAMPLE_WINDOWS = 8
+
+# Share of CJK among visible characters above which a document counts as Chinese
+ZH_THRESHOLD = 0.2
+
+# Each character class is counted on the UTF-8 encoding with bytes.translate,
+# deleting every byte outside the class and taking the length of what is left.
+# CJK ideographs U+4000-U+9FFF (Unified Ideographs plus the tail of
+# Extension A) are exactly the 3-byte sequences with lead byte 0xE4-0xE9, so
+# counting those lead bytes counts the characters.
+def _keep_only(byte_values) -> bytes:
+    keep = set(byte_values)
+    return bytes(value for value in range(256) if value not in keep)
+
+
+_DELETE_NON_CJK = _keep_only(range(0xE4, 0xEA))
+_DELETE_NON_DIGIT = _keep_only(b'0123456789')
+_DELETE_NON_LATIN = _keep_only(b'abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ')
+_DELETE_NON_SPACE = _keep_only(b' \t\n\r\x0b\x0c')
+
+
+def _sample(text: str, sample_chars: int) -> str:
+    """Evenly spaced windows from a long text, so letterheads don't dominate"""
+    if len(text) <= sample_chars:
+        return text
+    window = sample_chars // SAMPLE_WINDOWS
+    step = (len(text) - window) // (SAMPLE_WINDOWS - 1)
+    return ''.join(text[i * step:i * step + window] for i in range(SAMPLE_WINDOWS))
+
+
+def char_counts(text: str) -> Dict[str, int]:
+    """Exact per-class character counts: cjk, latin, digit, space and other"""
+    encoded = text.encode('utf-8')
+    counts = {
+        "cjk": len(encoded.translate(None, _DELETE_NON_CJK)),
+        "latin": len(encoded.translate(None, _DELETE_NON_LATIN)),
+        "digit": len(encoded.translate(None, _DELETE_NON_DIGIT)),
+        "space": len(encoded.translate(None, _DELETE_NON_SPACE)),
+    }
+    counts["other"] = len(text) - sum(counts.values())
+    return counts
+
+
+def script_stats(text: str, sample_chars: int = SAMPLE_CHARS) -> Dict[str, float]:
+    """Character-class statistics for a document, counted at C speed
+
+    Ratios are relative to visible (non-whitespace) characters, except
+    whitespace_ratio which is relative to all sampled characters. Texts
+    longer than sample_chars are estimated from evenly spaced windows.
+    """
+    sample = _sample(text or '', sample_chars)
+    total = len(sample)
+    if not total:
+        return {"chars": 0, "sampled": False, "cjk_ratio": 0.0, "digit_ratio": 0.0,
+                "latin_ratio": 0.0, "other_ratio": 0.0, "whitespace_ratio": 0.0}
+
+    counts = char_counts(sample)
+    cjk, digits, latin, spaces = counts["cjk"], counts["digit"], counts["latin"], counts["space"]
+
+    visible = total - spaces
+    per_visible = 1.0 / visible if visible else 0.0
+    return {
+        "chars": len(text),
+        "sampled": total < len(text),
+        "cjk_ratio": cjk * per_visible,
+        "digit_ratio": digits * per_visible,
+        "latin_ratio": latin * per_visible,
+        "other_ratio": max(visible - cjk - digits - latin, 0) * per_visible,
+        "whitespace_ratio": spaces / total,
+    }
+
+
+def detect_language(text: str) -> str:
+    """Simple language detection: 'zh' or 'en'"""
+    if not text:
+        return 'en'
+    return 'zh' if script_stats(text)["cjk_ratio"] > ZH_THRESHOLD else 'en'
@@ -0,0 +1,175 @@
+"""
+Request coalescing: concurrent callers with the same key share one upstream call
+"""
+import asyncio
+import hashlib
+import os
+import threading
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Optional, Tuple
+import logging
+
+try:
+    import fcntl
+except ImportError:  # Windows: no cross-process mode
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+# Keys are hashed onto this many lock files, so lock_dir stays a fixed size
+LOCK_STRIPES = 64
+
+
+class _Call:
+    """One in-flight call that followers wait on"""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """Coalesce identical concurrent calls across threads (and optionally processes)
+
+    Within a process, the first caller for a key runs the function and every
+    concurrent caller with the same key waits for and shares its result.
+    With lock_dir set, the leader also takes an exclusive file lock for the
+    key, so leaders in other gunicorn workers queue behind it; once they get
+    the lock they call lookup() (typically a shared SQLite response cache)
+    and only go upstream if the first worker's result isn't there; without
+    a lookup there is nothing to share across processes and no file lock
+    is taken. Keys are hashed onto lock_stripes small empty lock files, so
+    unrelated keys occasionally queue behind each other.
+    """
+
+    def __init__(self, lock_dir: Optional[str] = None, lock_stripes: int = LOCK_STRIPES):
+        self.lock_dir = lock_dir
+        self.lock_stripes = max(lock_stripes, 1)
+        self._calls: Dict[str, _Call] = {}
+        self._lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self.stats = {'leaders': 0, 'coalesced': 0, 'cross_process_hits': 0}
+
+        if lock_dir:
+            if fcntl is None:
+                logger.warning("File locks unavailable on this platform; coalescing within the process only")
+                self.lock_dir = None
+            else:
+                os.makedirs(lock_dir, exist_ok=True)
+
+    def do(self, key: str, func: Callable[[], Any],
+           lookup: Optional[Callable[[], Any]] = None) -> Tuple[Any, bool]:
+        """Run func once per key among concurrent callers
+
+        Returns (result, shared) where shared is True when this caller got
+        another caller's result. Exceptions from func are raised in every
+        waiting caller.
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = _Call()
+                self._calls[key] = call
+
+        if not leader:
+            self._count('coalesced')
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result, True
+
+        self._count('leaders')
+        try:
+            with self._process_lock(key, lookup is not None):
+                result = lookup() if lookup is not None and self.lock_dir else None
+                if result is not None:
+                    self._count('cross_process_hits')
+                else:
+                    result = func()
+            call.result = result
+            return result, False
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+            call.done.set()
+
+    @contextmanager
+    def _process_lock(self, key: str, shared_lookup: bool = True):
+        if not self.lock_dir or not shared_lookup:
+            yield
+            return
+        stripe = int(hashlib.sha256(key.encode('utf-8')).hexdigest(), 16) % self.lock_stripes
+        with open(os.path.join(self.lock_dir, f"{stripe}.lock"), 'a') as handle:
+            fcntl.flock(handle, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(handle, fcntl.LOCK_UN)
+
+    def _count(self, name: str):
+        with self._stats_lock:
+            self.stats[name] += 1
+
+    def get_stats(self) -> Dict[str, int]:
+        with self._stats_lock:
+            stats = dict(self.stats)
+        with self._lock:
+            stats['in_flight'] = len(self._calls)
+        return stats
+
+
+class _AsyncCall:
+    """One in-flight task and how many callers are awaiting it"""
+
+    def __init__(self, task: asyncio.Task):
+        self.task = task
+        self.waiters = 0
+
+
+class AsyncSingleFlight:
+    """SingleFlight for coroutines on one event loop (the ASGI path)
+
+    The call runs in its own task, so a cancelled caller (leader or
+    follower) does not cancel it for the others; it is cancelled only when
+    the last caller waiting on it gives up.
+    """
+
+    def __init__(self):
+        self._calls: Dict[str, _AsyncCall] = {}
+        self.stats = {'leaders': 0, 'coalesced': 0}
+
+    async def do(self, key: str, func: Callable[[], Any]) -> Tuple[Any, bool]:
+        """Await func() once per key among concurrent callers; returns (result, shared)"""
+        call = self._calls.get(key)
+        shared = call is not None
+        if shared:
+            self.stats['coalesced'] += 1
+        else:
+            self.stats['leaders'] += 1
+            call = _AsyncCall(asyncio.ensure_future(func()))
+            self._calls[key] = call
+            call.task.add_done_callback(lambda _: self._forget(key, call))
+
+        call.waiters += 1
+        try:
+            return await asyncio.shield(call.task), shared
+        except asyncio.CancelledError:
+            if call.waiters == 1 and not call.task.done():
+                # Nobody else is waiting: don't pay for a result no one will read
+                self._forget(key, call)
+                call.task.cancel()
+            raise
+        finally:
+            call.waiters -= 1
+
+    def _forget(self, key: str, call: _AsyncCall):
+        if self._calls.get(key) is call:
+            del self._calls[key]
+
+    def get_stats(self) -> Dict[str, int]:
+        return dict(self.stats, in_flight=len(self._calls))
@@ -0,0 +1,154 @@
+"""
+Text compaction before AI analysis - removes tokens that carry no information
+"""
+import re
+from typing import Dict, Tuple
+import logging
+
+from utils.token_budget import estimate_tokens
+
+logger = logging.getLogger(__name__)
+
+# Lines found among the first/last HEADER_ZONE_LINES lines of at least
+# MIN_HEADER_REPEATS pages are treated as page headers/footers
+MIN_HEADER_REPEATS = 3
+HEADER_ZONE_LINES = 3
+
+# Shorter lines (e.g. "Negative", "Normal") are kept even when duplicated,
+# since in lab tables they belong to different rows; the same applies to
+# header/footer detection
+MIN_DEDUPE_CHARS = 12
+
+# The parser separates PDF pages with a form feed
+PAGE_BREAK = '\f'
+
+# Full-width ASCII (U+FF01-FF5E) and the ideographic space, as typed in
+# Chinese reports. Deliberately not NFKC, which would also flatten the
+# superscripts in units such as "×10⁹/L".
+_FULL_WIDTH = {code: code - 0xFEE0 for code in range(0xFF01, 0xFF5F)}
+_FULL_WIDTH[0x3000] = ord(' ')
+
+_HYPHENATION = re.compile(r'([a-z])-\n([a-z])')
+_DIGIT = re.compile(r'\d')
+_SPACE_RUNS = re.compile(r'[ \t\u00a0\u3000]+')
+_PAGE_MARKER = re.compile(
+    r'^(?:page\s*\d+(?:\s*(?:of|/)\s*\d+)?'
+    r'|第\s*\d+\s*页(?:\s*[,，/]?\s*共\s*\d+\s*页)?'
+    r'|-\s*\d+\s*-)$',
+    re.IGNORECASE
+)
+
+
+def normalize_width(text: str) -> str:
+    """Full-width ASCII and ideographic spaces to their ASCII forms"""
+    return text.translate(_FULL_WIDTH)
+
+
+class TextCompactor:
+    """Shrink extracted document text before it is sent to the model"""
+
+    def __init__(self, min_header_repeats: int = MIN_HEADER_REPEATS, min_dedupe_chars: int = MIN_DEDUPE_CHARS):
+        self.min_header_repeats = min_header_repeats
+        self.min_dedupe_chars = min_dedupe_chars
+
+    def compact(self, text: str) -> Tuple[str, Dict[str, int]]:
+        """Run every compaction step and report size before and after
+
+        Steps: full-width digits/letters/punctuation to ASCII (Chinese
+        reports), PDF hyphenation repair, whitespace collapsing, removal of
+        page markers and repeated headers/footers, and line de-duplication.
+        """
+        if not text:
+            return text, self._stats(text or "", text or "")
+
+        compacted = normalize_width(text)
+        compacted = _HYPHENATION.sub(r'\1\2', compacted)
+
+        pages = [
+            [_SPACE_RUNS.sub(' ', line).strip() for line in page.split('\n')]
+            for page in compacted.split(PAGE_BREAK)
+        ]
+        lines = self._drop_headers_and_footers(pages)
+        lines = self._dedupe(lines)
+
+        compacted = '\n'.join(lines)
+        stats = self._stats(text, compacted)
+        logger.debug(f"Compacted text: {stats}")
+        return compacted, stats
+
+    def _drop_headers_and_footers(self, pages):
+        """Drop page markers and keep only the first copy of page headers/footers
+
+        A header/footer is a line of at least min_dedupe_chars characters
+        that sits among the first or last HEADER_ZONE_LINES lines of at least
+        min_header_repeats pages. Pages are split at form feeds and at page
+        markers ("Page 2 of 5"), so short repeated result lines in the body
+        ("Negative", "5") are never touched. Returns the remaining lines.
+        """
+        split_pages = []
+        for page in pages:
+            current = []
+            for line in page:
+                if _PAGE_MARKER.match(line):
+                    split_pages.append(current)
+                    current = []
+                else:
+                    current.append(line)
+            split_pages.append(current)
+
+        edges = []
+        counts = {}
+        for page in split_pages:
+            filled = [index for index, line in enumerate(page) if line]
+            zone = set(filled[:HEADER_ZONE_LINES] + filled[-HEADER_ZONE_LINES:])
+            edges.append(zone)
+            for line in {page[index] for index in zone}:
+                if len(line) >= self.min_dedupe_chars:
+                    counts[line] = counts.get(line, 0) + 1
+
+        kept = []
+        seen = set()
+        for page, zone in zip(split_pages, edges):
+            for index, line in enumerate(page):
+                if index in zone and counts.get(line, 0) >= self.min_header_repeats:
+                    if line in seen:
+                        continue
+                    seen.add(line)
+                kept.append(line)
+        return kept
+
+    def _dedupe(self, lines):
+        """Remove repeated lines and collapse blank-line runs
+
+        Lines with digits (results) are only dropped when they repeat the
+        line right before them: the same result at two visits is two facts,
+        and LabExtractor merges exact repeats per visit date itself. Other
+        lines are dropped wherever they repeat.
+        """
+        kept = []
+        seen = set()
+        for line in lines:
+            if not line:
+                if kept and kept[-1]:
+                    kept.append(line)
+                continue
+            if _DIGIT.search(line):
+                if kept and kept[-1] == line:
+                    continue
+            elif len(line) >= self.min_dedupe_chars:
+                if line in seen:
+                    continue
+                seen.add(line)
+            kept.append(line)
+        while kept and not kept[-1]:
+            kept.pop()
+        return kept
+
+    @staticmethod
+    def _stats(before: str, after: str) -> Dict[str, int]:
+        return {
+            "bytes_before": len(before.encode('utf-8')),
+            "bytes_after": len(after.encode('utf-8')),
+            "tokens_before": estimate_tokens(before),
+            "tokens_after": estimate_tokens(after),
+        }
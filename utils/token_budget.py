@@ -0,0 +1,200 @@
+"""
+Local token estimation and prompt / completion budgeting for DeepSeek calls
+"""
+import json
+import re
+from typing import Dict, Iterable, List, Optional, Tuple
+import logging
+
+from utils.script_stats import char_counts
+
+logger = logging.getLogger(__name__)
+
+CHAR_CLASSES = ('cjk', 'latin', 'digit', 'space', 'other')
+
+# Tokens per character of each class, plus a fixed per-request overhead
+# ('base': chat template and role tokens). The defaults follow DeepSeek's
+# published rule of thumb (~0.3 token per English character, ~0.6 per
+# Chinese character) and lean high elsewhere; refit them from real
+# response.usage numbers with benchmarks/calibrate_token_rates.py and
+# point TOKEN_RATES_PATH at the result.
+TOKEN_RATES = {'cjk': 0.6, 'latin': 0.3, 'digit': 0.4, 'space': 0.1, 'other': 0.6, 'base': 10.0}
+
+CONTEXT_TOKENS = 64000     # deepseek-chat context window
+PROMPT_TOKENS = 6000       # system + instructions + lab values + document
+COMPLETION_TOKENS = 3500   # room for the 7-section bilingual answer
+
+# Truncation prefers the last section boundary unless that keeps less than
+# this share of what cutting at the last fitting line would keep
+SECTION_KEEP_RATIO = 0.8
+
+_SECTION_START = re.compile(r'^(?:【.+】|#+\s.+|[A-Z][A-Z0-9 /&()-]{3,}:?|[^\s].{0,40}[:：])$')
+
+
+def estimate_tokens(text: str, rates: Optional[Dict[str, float]] = None) -> int:
+    """Estimated token count of a text (without the per-request overhead)"""
+    if not text:
+        return 0
+    rates = rates or TOKEN_RATES
+    counts = char_counts(text)
+    return int(sum(counts[name] * rates[name] for name in CHAR_CLASSES)) + 1
+
+
+def load_rates(path: Optional[str]) -> Dict[str, float]:
+    """TOKEN_RATES overridden by a calibration file, when one is configured"""
+    if not path:
+        return dict(TOKEN_RATES)
+    try:
+        with open(path, encoding='utf-8') as f:
+            fitted = json.load(f)
+        return dict(TOKEN_RATES, **{name: float(fitted[name]) for name in TOKEN_RATES if name in fitted})
+    except (OSError, ValueError) as e:
+        logger.warning(f"Could not load token rates from {path}: {e}")
+        return dict(TOKEN_RATES)
+
+
+def usage_sample(messages: List[Dict[str, str]], prompt_tokens: int) -> Dict:
+    """Calibration record for one call: character class counts and the real prompt_tokens
+
+    Only counts are kept, never the text, so logs carry no patient data.
+    """
+    return {
+        "counts": char_counts("".join(message["content"] for message in messages)),
+        "prompt_tokens": prompt_tokens
+    }
+
+
+def fit_token_rates(samples: Iterable[Dict]) -> Dict[str, float]:
+    """Least-squares fit of TOKEN_RATES to usage_sample records
+
+    Classes that never occur in the samples keep their default rate.
+    """
+    rows = [([sample["counts"].get(name, 0) for name in CHAR_CLASSES], sample["prompt_tokens"])
+            for sample in samples]
+    if not rows:
+        return dict(TOKEN_RATES)
+
+    present = [i for i, name in enumerate(CHAR_CLASSES) if any(counts[i] for counts, _ in rows)]
+    names = [CHAR_CLASSES[i] for i in present] + ['base']
+    fixed = [i for i in range(len(CHAR_CLASSES)) if i not in present]
+
+    # Normal equations X'X b = X'y, with absent classes moved to the target
+    size = len(names)
+    xtx = [[0.0] * size for _ in range(size)]
+    xty = [0.0] * size
+    for counts, tokens in rows:
+        x = [counts[i] for i in present] + [1]
+        y = tokens - sum(counts[i] * TOKEN_RATES[CHAR_CLASSES[i]] for i in fixed)
+        for a in range(size):
+            xty[a] += x[a] * y
+            for b in range(size):
+                xtx[a][b] += x[a] * x[b]
+    for a in range(size):
+        xtx[a][a] += 1e-6  # keeps the system solvable with few samples
+
+    solution = _solve(xtx, xty)
+    rates = dict(TOKEN_RATES)
+    rates.update({name: round(max(value, 0.0), 4) for name, value in zip(names, solution)})
+    return rates
+
+
+def _solve(matrix: List[List[float]], vector: List[float]) -> List[float]:
+    """Gaussian elimination with partial pivoting"""
+    size = len(vector)
+    rows = [row[:] + [value] for row, value in zip(matrix, vector)]
+    for col in range(size):
+        pivot = max(range(col, size), key=lambda r: abs(rows[r][col]))
+        rows[col], rows[pivot] = rows[pivot], rows[col]
+        if rows[col][col] == 0:
+            continue
+        for r in range(col + 1, size):
+            factor = rows[r][col] / rows[col][col]
+            for c in range(col, size + 1):
+                rows[r][c] -= factor * rows[col][c]
+    solution = [0.0] * size
+    for r in range(size - 1, -1, -1):
+        if rows[r][r] == 0:
+            continue
+        solution[r] = (rows[r][size] - sum(rows[r][c] * solution[c] for c in range(r + 1, size))) / rows[r][r]
+    return solution
+
+
+class TokenBudget:
+    """Split the context window between prompt and completion, and fit text into it"""
+
+    def __init__(self, prompt_tokens: int = PROMPT_TOKENS, completion_tokens: int = COMPLETION_TOKENS,
+                 context_tokens: int = CONTEXT_TOKENS, rates: Optional[Dict[str, float]] = None,
+                 max_chunks: int = 1):
+        self.rates = dict(TOKEN_RATES, **(rates or {}))
+        self.max_chunks = max(max_chunks, 1)  # > 1 enables map-reduce analysis of long documents
+        self.context_tokens = context_tokens
+        self.completion_tokens = min(completion_tokens, context_tokens)
+        self.prompt_tokens = min(prompt_tokens, context_tokens - self.completion_tokens)
+        if self.prompt_tokens < prompt_tokens:
+            logger.warning(f"Prompt budget capped at {self.prompt_tokens} tokens to fit the context window")
+
+    def estimate(self, text: str) -> int:
+        return estimate_tokens(text, self.rates)
+
+    def document_tokens(self, *fixed_parts: str) -> int:
+        """Tokens left for the document once the fixed prompt parts are counted"""
+        used = self.rates['base'] + sum(self.estimate(part) for part in fixed_parts)
+        return max(int(self.prompt_tokens - used), 0)
+
+    def input_tokens(self) -> int:
+        """Most document tokens one analysis can use (one prompt, or max_chunks of them)"""
+        return self.prompt_tokens * self.max_chunks
+
+    def input_char_limit(self) -> int:
+        """Upper bound on characters worth extracting to fill the input budget"""
+        cheapest = min(self.rates[name] for name in ('cjk', 'latin', 'digit', 'other') if self.rates[name] > 0)
+        return int(self.input_tokens() / cheapest)
+
+    def fit_input(self, text: str) -> str:
+        """Trim raw input to the input budget (the analyzer fits it precisely)"""
+        return self.truncate(text, self.input_tokens())[0]
+
+    def split(self, text: str, max_tokens: int, max_chunks: Optional[int] = None) -> Tuple[List[str], bool]:
+        """Cut text into chunks of at most max_tokens at section or line boundaries
+
+        Returns (chunks, truncated); truncated is True when text remained
+        after max_chunks chunks.
+        """
+        chunks = []
+        rest = text
+        while rest.strip():
+            if max_chunks is not None and len(chunks) >= max_chunks:
+                return chunks, True
+            chunk, truncated = self.truncate(rest, max_tokens)
+            if not truncated:
+                chunks.append(rest)
+                break
+            chunk = chunk or rest[:max(max_tokens, 1)]
+            chunks.append(chunk)
+            rest = rest[len(chunk):].lstrip('\n')
+        return chunks, False
+
+    def truncate(self, text: str, max_tokens: int) -> Tuple[str, bool]:
+        """Cut text to max_tokens at a section or line boundary; returns (text, truncated)"""
+        if self.estimate(text) <= max_tokens:
+            return text, False
+
+        kept = []
+        used = 0
+        section_end = 0
+        newline = self.rates['space']
+        for line in text.split('\n'):
+            cost = self.estimate(line) + newline
+            if used + cost > max_tokens:
+                if not kept:
+                    # A single oversized line: cut it proportionally
+                    kept.append(line[:int(len(line) * max_tokens / cost)])
+                break
+            if not line.strip() or _SECTION_START.match(line.strip()):
+                section_end = len(kept)
+            kept.append(line)
+            used += cost
+
+        if section_end and self.estimate('\n'.join(kept[:section_end])) >= SECTION_KEEP_RATIO * used:
+            kept = kept[:section_end]
+        return '\n'.join(kept).rstrip(), True